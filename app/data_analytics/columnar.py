@@ -0,0 +1,277 @@
+"""
+Columnar (Apache Arrow / Parquet) ingestion and export.
+
+Warehouse feeds send insight rows as an Arrow IPC stream/file or a Parquet
+file instead of row-wise JSON. Aggregates are computed per column: numeric
+category columns go to NumPy without copying, and text columns are
+dictionary-encoded so each distinct value (tier, date, ID, name) is parsed
+once and rows are tallied through their integer codes. table_metrics()
+returns the same shape as demosite.compute_metrics.
+"""
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from app.data_analytics.congresses import _get_congress
+from app.data_analytics.dates import parse_report_dates, window_bounds, format_date_range, month_key
+from app.data_analytics.icategories import INSIGHT_COLS, KolTierCounts, category_bitmasks_from_columns, category_counts_from_masks, _cell_hit
+from app.data_analytics.unique_msls import _clean_name
+from app.metrics import timed, timed_fn
+
+ARROW_STREAM_TYPE = "application/vnd.apache.arrow.stream"
+ARROW_FILE_TYPE = "application/vnd.apache.arrow.file"
+PARQUET_MEDIA_TYPE = "application/vnd.apache.parquet"
+_PARQUET_TYPES = {PARQUET_MEDIA_TYPE, "application/x-parquet", "application/parquet"}
+_ARROW_TYPES = {ARROW_STREAM_TYPE, ARROW_FILE_TYPE, "application/x-apache-arrow", "application/vnd.apache.arrow"}
+
+PARQUET_COMPRESSION = os.environ.get("PARQUET_COMPRESSION", "zstd")
+
+# n8n mangles this header; the normalized name is what every aggregation reads
+_CONGRESS_COL = "Congress Name (if applic.)"
+_CONGRESS_MANGLED = "Congress Name (if applic"
+
+def columnar_kind(content_type: str = "") -> Optional[str]:
+  """
+  "parquet" or "arrow" for a columnar Content-Type; None otherwise.
+  """
+  ctype = (content_type or "").split(";")[0].strip().lower()
+  if ctype in _PARQUET_TYPES:
+    return "parquet"
+  if ctype in _ARROW_TYPES:
+    return "arrow"
+  return None
+
+@timed_fn("columnar_read")
+def read_table(body: bytes, kind: Optional[str] = None) -> pa.Table:
+  """
+  Parses a Parquet file or an Arrow IPC file/stream held in memory. The
+  buffer wraps `body` without copying. Raises ValueError on malformed input.
+  """
+  buf = pa.py_buffer(body)
+  try:
+    if kind == "parquet" or body[:4] == b"PAR1":
+      import pyarrow.parquet as pq
+      table = pq.read_table(pa.BufferReader(buf))
+    elif body[:6] == b"ARROW1":
+      table = pa.ipc.open_file(buf).read_all()
+    else:
+      table = pa.ipc.open_stream(buf).read_all()
+  except (pa.ArrowException, OSError) as e:
+    raise ValueError(str(e)) from e
+  return normalize_table(table)
+
+def normalize_table(table: pa.Table) -> pa.Table:
+  """
+  Column-level counterpart of demosite._normalize_fields_inplace: restores
+  the mangled congress header. Names are cleaned per distinct value when
+  aggregated.
+  """
+  names = table.column_names
+  if _CONGRESS_MANGLED in names and _CONGRESS_COL not in names:
+    table = table.rename_columns([_CONGRESS_COL if n == _CONGRESS_MANGLED else n for n in names])
+  return table
+
+def _codes(table: pa.Table, name: str) -> Tuple[List[Any], np.ndarray]:
+  """
+  Distinct values of a column plus one int64 code per row indexing them
+  (-1 for null or a missing column).
+  """
+  n = table.num_rows
+  if name not in table.column_names:
+    return [], np.full(n, -1, dtype=np.int64)
+  col = table.column(name)
+  if pa.types.is_null(col.type):
+    return [], np.full(n, -1, dtype=np.int64)
+  arr = col.combine_chunks() if isinstance(col, pa.ChunkedArray) else col
+  if pa.types.is_nested(arr.type):
+    # structs/lists (e.g. the n8n congress cell) can't be dictionary-encoded
+    distinct: Dict[str, int] = {}
+    values: List[Any] = []
+    codes = np.empty(n, dtype=np.int64)
+    for i, v in enumerate(arr.to_pylist()):
+      if v is None:
+        codes[i] = -1
+        continue
+      code = distinct.setdefault(repr(v), len(distinct))
+      if code == len(values):
+        values.append(v)
+      codes[i] = code
+    return values, codes
+  enc = arr if pa.types.is_dictionary(arr.type) else arr.dictionary_encode()
+  codes = enc.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int64, copy=False)
+  return enc.dictionary.to_pylist(), codes
+
+def _remap(codes: np.ndarray, lookup: List[int]) -> np.ndarray:
+  """
+  Row codes translated through `lookup` (distinct value -> new code); -1 stays -1.
+  """
+  table = np.asarray(lookup + [-1], dtype=np.int64)
+  return table[codes]
+
+def _category_column(table: pa.Table, name: str):
+  col = table.column(name)
+  if pa.types.is_integer(col.type) or pa.types.is_floating(col.type) or pa.types.is_boolean(col.type):
+    # typed numeric column: nulls are "no hit"; single chunk without nulls converts zero-copy
+    if col.null_count:
+      col = pc.fill_null(col, 0)
+    return col.to_numpy()
+  values, codes = _codes(table, name)
+  hits = np.asarray([_cell_hit(v) for v in values] + [False], dtype=bool)
+  return hits[codes]
+
+def _interaction_codes(table: pa.Table) -> Tuple[np.ndarray, int]:
+  """
+  One code per row for its interaction (stripped ID), -1 for rows without an
+  ID; plus the number of distinct IDs.
+  """
+  values, codes = _codes(table, "ID")
+  ids: Dict[str, int] = {}
+  lookup = []
+  for v in values:
+    s = str(v).strip()
+    lookup.append(ids.setdefault(s, len(ids)) if s else -1)
+  return _remap(codes, lookup), len(ids)
+
+def _date_codes(table: pa.Table) -> Tuple[List[Any], np.ndarray]:
+  """
+  Parsed distinct report dates (None when unparseable) and row codes into them.
+  """
+  values, codes = _codes(table, "Report Date")
+  return parse_report_dates(values), codes
+
+def _practice_counts(table: pa.Table, row_ids: np.ndarray) -> Dict[str, int]:
+  # first row per ID decides the setting; rows without an ID count on their own
+  values, codes = _codes(table, "KOL Practice Setting")
+  labels: Dict[str, int] = {}
+  lookup = [labels.setdefault(str(v or "").strip() or "Unknown", len(labels)) for v in values]
+  unknown = labels.setdefault("Unknown", len(labels))
+  setting = _remap(codes, lookup)
+  setting[setting < 0] = unknown
+  keyed = np.flatnonzero(row_ids >= 0)
+  _, first = np.unique(row_ids[keyed], return_index=True)
+  counted = setting[np.sort(np.concatenate([keyed[first], np.flatnonzero(row_ids < 0)]))]
+  counts = np.bincount(counted, minlength=len(labels))
+  # labels in first-counted order, like the row-wise Counter
+  _, first_seen = np.unique(counted, return_index=True)
+  names = list(labels)
+  return {names[counted[i]]: int(counts[counted[i]]) for i in np.sort(first_seen)}
+
+def _distinct_present(values: List[Any], codes: np.ndarray) -> List[Any]:
+  used = np.unique(codes[codes >= 0])
+  return [values[i] for i in used]
+
+@timed_fn("columnar_metrics")
+def table_metrics(table: pa.Table) -> Dict[str, Any]:
+  """
+  compute_metrics() over an Arrow table, column by column.
+  """
+  n = table.num_rows
+
+  with timed("pie_insight_category_counts"):
+    columns = {col: _category_column(table, col) for col in INSIGHT_COLS if col in table.column_names}
+    category_counts = category_counts_from_masks(category_bitmasks_from_columns(columns, n))
+
+  with timed("kol_tier_counts_pretty"):
+    tiers = KolTierCounts()
+    values, codes = _codes(table, "KOL Tier")
+    for v, count in zip(values, np.bincount(codes[codes >= 0], minlength=len(values))):
+      if count:
+        tiers.add_value(v, int(count))
+
+  with timed("count_unique_interactions"):
+    row_ids, n_ids = _interaction_codes(table)
+    n_interactions = n_ids + int((row_ids < 0).sum())
+
+  with timed("pie_practice_setting_by_interaction"):
+    practice_counts = _practice_counts(table, row_ids)
+
+  with timed("list_unique_msls"):
+    values, codes = _codes(table, "MSL Name")
+    msls = sorted({m for m in (_clean_name(v) for v in _distinct_present(values, codes)) if m})
+
+  with timed("list_unique_congresses"):
+    values, codes = _codes(table, _CONGRESS_COL)
+    congresses = sorted({c for c in (_get_congress({_CONGRESS_COL: v}) for v in _distinct_present(values, codes)) if c})
+
+  with timed("date_index"):
+    parsed, codes = _date_codes(table)
+    months: Dict[str, int] = {}
+    lookup = [months.setdefault(month_key(d), len(months)) if d is not None else -1 for d in parsed]
+    row_month = _remap(codes, lookup)
+    present = [parsed[i] for i in np.unique(codes[codes >= 0]) if parsed[i] is not None]
+    dates = format_date_range(min(present), max(present)) if present else "No valid dates"
+    dated = row_month >= 0
+    keyed = dated & (row_ids >= 0)
+    pairs = np.unique(row_month[keyed] * max(n_ids, 1) + row_ids[keyed])
+    per_month = np.bincount(pairs // max(n_ids, 1), minlength=len(months))
+    per_month += np.bincount(row_month[dated & (row_ids < 0)], minlength=len(months))
+    monthly_interactions = {m: int(per_month[i]) for m, i in sorted(months.items()) if per_month[i]}
+
+  return {
+    "practice_counts": practice_counts,
+    "category_counts": category_counts,
+    "kol_tier_counts": tiers.pretty(),
+    "congresses": congresses,
+    "n_interactions": n_interactions,
+    "msls": msls,
+    "insight_count": n,
+    "dates": dates,
+    "monthly_interactions": monthly_interactions,
+  }
+
+def filter_table_by_window(table: pa.Table, start: Any = None, end: Any = None) -> pa.Table:
+  """
+  Rows whose report date falls in [start, end], like dates.filter_rows_by_window
+  (undated rows dropped, end date inclusive). Row order is preserved.
+  """
+  parsed, codes = _date_codes(table)
+  start_dt, end_dt = window_bounds(start, end)
+  if end_dt is not None:
+    end_dt = end_dt.replace(hour=23, minute=59, second=59, microsecond=999999)
+  keep = [d is not None and (start_dt is None or d >= start_dt) and (end_dt is None or d <= end_dt) for d in parsed]
+  mask = np.asarray(keep + [False], dtype=bool)[codes]
+  return table.filter(pa.array(mask))
+
+def _column_array(values: List[Any]) -> pa.Array:
+  # JSON rows are loosely typed (1 next to "1", nested dicts): infer, else store as text
+  try:
+    arr = pa.array(values)
+    if not pa.types.is_nested(arr.type):
+      return arr
+  except (pa.ArrowInvalid, pa.ArrowTypeError):
+    pass
+  return pa.array([None if v is None else str(v) for v in values], type=pa.string())
+
+def rows_to_table(rows: List[Dict[str, Any]]) -> pa.Table:
+  """
+  Normalized rows as an Arrow table; columns in first-seen key order.
+  """
+  cols: Dict[str, None] = {}
+  for r in rows:
+    for k in r:
+      cols.setdefault(k, None)
+  return pa.table({c: _column_array([r.get(c) for r in rows]) for c in cols})
+
+@timed_fn("parquet_export")
+def write_parquet(table: pa.Table, path: str) -> str:
+  import pyarrow.parquet as pq
+
+  pq.write_table(table, path, compression=PARQUET_COMPRESSION)
+  return path
+
+def export_parquet_tempfile(rows: List[Dict[str, Any]]) -> str:
+  """
+  Parquet file of the rows in the temp dir; the caller removes it once streamed.
+  """
+  import tempfile
+
+  fd, path = tempfile.mkstemp(prefix="msl-export-", suffix=".parquet")
+  os.close(fd)
+  try:
+    return write_parquet(rows_to_table(rows), path)
+  except Exception:
+    os.remove(path)
+    raise
@@ -1,6 +1,5 @@
 from typing import List, Dict
 
-print("[congresses] importing...")
 __all__ = ["list_unique_congresses"]
 
 def _get_congress(row: Dict) -> str:
@@ -24,7 +23,4 @@ def list_unique_congresses(rows: List[Dict]) -> List[str]:
 		if name not in seen:
 			seen.add(name)
 			out.append(name)
-	print("[congresses] list_unique_congresses ->", len(out))
 	return sorted(out)
-
-print("[congresses] import OK, exports:", __all__)
\ No newline at end of file
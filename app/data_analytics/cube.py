@@ -0,0 +1,327 @@
+"""
+In-memory insight cube over product, MSL, KOL tier, practice setting,
+report month and insight category.
+
+Built in one pass: each row is dictionary-coded per dimension, then rows are
+grouped with np.unique on a packed key of (product, msl, tier, setting, month,
+category bitmask) into sparse COO cells holding row counts. Category stays a
+9-bit mask instead of being exploded, so every row lives in exactly one cell
+and a category filter is a bit test on the cell's mask.
+
+Counts and group-bys only touch the cells. Measures that are not additive
+across cells (unique interactions, congresses, date range) read the rows of
+the selected cells, so any slice also yields compute_metrics-shaped
+aggregates that can feed the deck.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from app.data_analytics.congresses import _get_congress
+from app.data_analytics.dates import parse_report_dates, format_date_range, month_key
+from app.data_analytics.icategories import INSIGHT_COLS, category_bitmasks, parse_kol_tier, _MASK_BITS, _N_MASKS, _TIER_LABELS
+from app.data_analytics.unique_msls import _clean_name
+from app.metrics import register_gauge, timed_fn
+
+# Datasets kept in memory per worker; the least recently used is dropped first
+CUBE_MAX_DATASETS = int(os.environ.get("CUBE_MAX_DATASETS", "8"))
+
+DIMENSIONS = ("product", "msl", "tier", "setting", "month")
+# Filterable/groupable; "category" is answered from the cell bitmask
+QUERY_DIMENSIONS = DIMENSIONS + ("category",)
+UNKNOWN = "Unknown"
+
+_MASK = len(DIMENSIONS)
+_QUARTER_RE = re.compile(r"^(?:(\d{4})\s*-?\s*)?Q([1-4])$", re.IGNORECASE)
+
+def _encode(labels: Iterable[str]) -> tuple[List[str], np.ndarray]:
+  index: Dict[str, int] = {}
+  codes = [index.setdefault(label, len(index)) for label in labels]
+  return list(index), np.asarray(codes, dtype=np.int64)
+
+def _dimension_labels(r: Dict[str, Any], dt: Optional[datetime]) -> tuple:
+  tier = parse_kol_tier(r.get("KOL Tier"))
+  return (
+    str(r.get("Product Discussed") or "").strip() or UNKNOWN,
+    _clean_name(r.get("MSL Name")) or UNKNOWN,
+    _TIER_LABELS.get(tier, UNKNOWN),
+    str(r.get("KOL Practice Setting") or "").strip() or UNKNOWN,
+    month_key(dt) if dt is not None else UNKNOWN,
+  )
+
+def quarter_months(quarter: str, months: Sequence[str]) -> List[str]:
+  """
+  Month labels ("YYYY-MM") in `months` that fall in `quarter`: "Q2" (any
+  year) or "2025-Q2".
+  """
+  m = _QUARTER_RE.match(str(quarter).strip())
+  if not m:
+    raise ValueError(f"Bad quarter {quarter!r}; expected e.g. Q2 or 2025-Q2")
+  year, q = m.group(1), int(m.group(2))
+  first = 3 * (q - 1) + 1
+  wanted = {f"{first + i:02d}" for i in range(3)}
+  return [mk for mk in months if mk != UNKNOWN and mk[5:7] in wanted and (year is None or mk[:4] == year)]
+
+def _resolve_category(value: str) -> int:
+  """
+  Bit index for a category: exact name, or an unambiguous case-insensitive
+  prefix ("competitive" -> "Competitive Insights").
+  """
+  if value in INSIGHT_COLS:
+    return INSIGHT_COLS.index(value)
+  hits = [i for i, col in enumerate(INSIGHT_COLS) if col.lower().startswith(str(value).strip().lower())]
+  if len(hits) != 1:
+    raise ValueError(f"Unknown insight category {value!r}; expected one of {INSIGHT_COLS}")
+  return hits[0]
+
+class InsightCube:
+  """
+  Sparse cube of insight rows; see the module docstring.
+  """
+  @timed_fn("cube_build")
+  def __init__(self, rows: List[Dict[str, Any]]):
+    n = len(rows)
+    self.n_rows = n
+    dates = parse_report_dates([r.get("Report Date") for r in rows])
+    masks = category_bitmasks(rows).astype(np.int64)
+
+    labels = list(zip(*(_dimension_labels(r, dt) for r, dt in zip(rows, dates)))) or [()] * len(DIMENSIONS)
+    self.labels: Dict[str, List[str]] = {}
+    row_codes = []
+    for dim, column in zip(DIMENSIONS, labels):
+      names, codes = _encode(column)
+      self.labels[dim] = names
+      row_codes.append(codes)
+    self._lookup = {dim: {name: i for i, name in enumerate(names)} for dim, names in self.labels.items()}
+
+    # per-row columns for the non-additive measures
+    ids, self.row_interaction = _encode(str(r.get("ID", "")).strip() for r in rows)
+    # codes stay < len(ids); rows without an ID get -1
+    self.id_radix = max(len(ids), 1)
+    if "" in ids:
+      self.row_interaction[self.row_interaction == ids.index("")] = -1
+    congresses, self.row_congress = _encode(_get_congress(r) for r in rows)
+    self.congress_labels = congresses
+    self.row_setting = row_codes[DIMENSIONS.index("setting")]
+    self.row_month = row_codes[DIMENSIONS.index("month")]
+    self.row_ordinal = np.asarray([dt.toordinal() if dt is not None else 0 for dt in dates], dtype=np.int64)
+
+    # one packed int64 key per row (mixed radix), grouped into cells
+    radix = [max(len(self.labels[d]), 1) for d in DIMENSIONS] + [_N_MASKS]
+    key = np.zeros(n, dtype=np.int64)
+    for codes, base in zip(row_codes + [masks], radix):
+      key = key * base + codes
+    cell_keys, self.cell_of_row, self.counts = np.unique(key, return_inverse=True, return_counts=True)
+    self.coords = np.empty((len(cell_keys), len(radix)), dtype=np.int64)
+    rest = cell_keys
+    for i in range(len(radix) - 1, -1, -1):
+      rest, self.coords[:, i] = np.divmod(rest, radix[i])
+    self.cell_of_row = self.cell_of_row.reshape(-1)
+    # contiguous per-dimension columns for select()
+    self._cols = [np.ascontiguousarray(self.coords[:, i]) for i in range(len(radix))]
+
+    h = hashlib.sha1(json.dumps([self.labels, congresses, ids]).encode("utf-8"))
+    for arr in (self.coords, self.counts, self.cell_of_row, self.row_interaction, self.row_congress, self.row_ordinal):
+      h.update(arr.tobytes())
+    self.fingerprint = h.hexdigest()
+
+  @property
+  def n_cells(self) -> int:
+    return len(self.counts)
+
+  def describe(self) -> Dict[str, Any]:
+    return {
+      "fingerprint": self.fingerprint,
+      "rows": self.n_rows,
+      "cells": self.n_cells,
+      "dimensions": {**{d: sorted(self.labels[d]) for d in DIMENSIONS}, "category": INSIGHT_COLS},
+    }
+
+  def _codes_for(self, dim: str, values: Iterable[str]) -> List[int]:
+    lookup = self._lookup[dim]
+    out = []
+    for v in values:
+      if dim == "tier" and v not in lookup:
+        # "1", "T1", "tier 1" -> "Tier 1"
+        v = _TIER_LABELS.get(parse_kol_tier(v), v)
+      if v in lookup:
+        out.append(lookup[v])
+    return out
+
+  def select(self, filters: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """
+    Boolean mask over cells. `filters` maps a dimension in QUERY_DIMENSIONS to
+    a value or list of values (OR within a dimension, AND across them), plus
+    "quarter" ("Q2", "2025-Q2"; intersected with any "month" filter).
+    Values absent from the dataset simply match nothing.
+    """
+    filters = dict(filters or {})
+    unknown = set(filters) - set(QUERY_DIMENSIONS) - {"quarter"}
+    if unknown:
+      raise ValueError(f"Unknown cube dimension(s) {sorted(unknown)}; expected {list(QUERY_DIMENSIONS) + ['quarter']}")
+    as_list = lambda v: [v] if isinstance(v, str) else list(v or [])
+
+    quarters = as_list(filters.pop("quarter", None))
+    if quarters:
+      in_quarters = {m for q in quarters for m in quarter_months(q, self.labels["month"])}
+      months = as_list(filters.get("month")) or list(in_quarters)
+      filters["month"] = [m for m in months if m in in_quarters] or ["\0none"]
+
+    # one "allowed" lookup table per filtered dimension, applied to a shrinking set of cells
+    tests = []
+    for i, dim in enumerate(DIMENSIONS):
+      values = as_list(filters.get(dim))
+      if values:
+        allowed = np.zeros(len(self.labels[dim]) + 1, dtype=bool)
+        allowed[self._codes_for(dim, values)] = True
+        tests.append((i, allowed))
+    categories = as_list(filters.get("category"))
+    if categories:
+      bits = 0
+      for c in categories:
+        bits |= 1 << _resolve_category(c)
+      allowed = (np.arange(_N_MASKS) & bits) != 0
+      tests.append((_MASK, allowed))
+
+    sel = np.zeros(self.n_cells, dtype=bool)
+    if not tests:
+      sel[:] = True
+      return sel
+    i, allowed = tests[0]
+    idx = np.flatnonzero(allowed[self._cols[i]])
+    for i, allowed in tests[1:]:
+      idx = idx[allowed[self._cols[i][idx]]]
+    sel[idx] = True
+    return sel
+
+  def group_counts(self, sel: np.ndarray, group_by: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    """
+    Insight counts of the selected cells per combination of `group_by`
+    dimensions, largest first. Grouping by "category" counts category hits
+    (a row with two categories shows up under both).
+    """
+    group_by = list(group_by)
+    bad = [d for d in group_by if d not in QUERY_DIMENSIONS]
+    if bad:
+      raise ValueError(f"Unknown group_by dimension(s) {bad}; expected {list(QUERY_DIMENSIONS)}")
+    dims = [d for d in group_by if d != "category"]
+    coords, counts = self.coords[sel], self.counts[sel]
+    # packed group key per cell (mixed radix over the grouped dimensions)
+    key = np.zeros(len(counts), dtype=np.int64)
+    radix = []
+    for d in dims:
+      radix.append(max(len(self.labels[d]), 1))
+      key = key * radix[-1] + coords[:, DIMENSIONS.index(d)]
+    weights = counts
+    if "category" in group_by:
+      # one entry per (cell, category hit)
+      hits = _MASK_BITS[coords[:, _MASK]].astype(bool)
+      cell, bit = np.nonzero(hits)
+      key, weights = key[cell] * len(INSIGHT_COLS) + bit, counts[cell]
+      radix.append(len(INSIGHT_COLS))
+    groups, inverse = np.unique(key, return_inverse=True)
+    totals = np.bincount(inverse.reshape(-1), weights=weights, minlength=len(groups))
+
+    names = dims + (["category"] if "category" in group_by else [])
+    out = []
+    for g, total in zip(groups.tolist(), totals.tolist()):
+      entry = {}
+      for name, base in zip(reversed(names), reversed(radix)):
+        g, code = divmod(g, base)
+        entry[name] = INSIGHT_COLS[code] if name == "category" else self.labels[name][code]
+      entry = {name: entry[name] for name in names}
+      entry["insights"] = int(total)
+      out.append(entry)
+    out.sort(key=lambda e: -e["insights"])
+    return out
+
+  def slice_metrics(self, sel: np.ndarray) -> Dict[str, Any]:
+    """
+    compute_metrics-shaped aggregates for the rows of the selected cells.
+    """
+    coords, counts = self.coords[sel], self.counts[sel]
+    category_counts = np.bincount(coords[:, _MASK], weights=counts, minlength=_N_MASKS).astype(np.int64) @ _MASK_BITS
+    tier_totals = np.bincount(coords[:, DIMENSIONS.index("tier")], weights=counts, minlength=len(self.labels["tier"]))
+    tiers = {label: int(tier_totals[self._lookup["tier"][label]]) for label in _TIER_LABELS.values()
+             if label in self._lookup["tier"] and tier_totals[self._lookup["tier"][label]] > 0}
+    msl_codes = np.unique(coords[:, DIMENSIONS.index("msl")])
+    msls = sorted(self.labels["msl"][c] for c in msl_codes if self.labels["msl"][c] != UNKNOWN)
+
+    rows = np.flatnonzero(sel[self.cell_of_row])
+    ids = self.row_interaction[rows]
+    keyed = np.flatnonzero(ids >= 0)
+    uniq, first = np.unique(ids[keyed], return_index=True)
+    unkeyed = np.flatnonzero(ids < 0)
+
+    # practice setting: first row per interaction, counted in first-seen order
+    counted = self.row_setting[rows[np.sort(np.concatenate([keyed[first], unkeyed]))]]
+    setting_totals = np.bincount(counted, minlength=len(self.labels["setting"]))
+    _, first_seen = np.unique(counted, return_index=True)
+    practice_counts = {self.labels["setting"][counted[i]]: int(setting_totals[counted[i]]) for i in np.sort(first_seen)}
+
+    congress_codes = np.unique(self.row_congress[rows])
+    congresses = sorted(c for c in (self.congress_labels[i] for i in congress_codes) if c)
+
+    ordinals = self.row_ordinal[rows]
+    ordinals = ordinals[ordinals > 0]
+    dates = format_date_range(datetime.fromordinal(int(ordinals.min())), datetime.fromordinal(int(ordinals.max()))) if len(ordinals) else "No valid dates"
+
+    months = self.row_month[rows]
+    month_unknown = self._lookup["month"].get(UNKNOWN, -1)
+    dated = months != month_unknown
+    n_ids = self.id_radix
+    pairs = np.unique(months[dated & (ids >= 0)] * n_ids + ids[dated & (ids >= 0)])
+    per_month = np.bincount(pairs // n_ids, minlength=len(self.labels["month"]))
+    per_month += np.bincount(months[dated & (ids < 0)], minlength=len(self.labels["month"]))
+    monthly = {self.labels["month"][i]: int(per_month[i]) for i in np.argsort(self.labels["month"]) if per_month[i] > 0}
+
+    return {
+      "practice_counts": practice_counts,
+      "category_counts": {col: int(c) for col, c in zip(INSIGHT_COLS, category_counts) if c > 0},
+      "kol_tier_counts": tiers,
+      "congresses": congresses,
+      "n_interactions": len(uniq) + len(unkeyed),
+      "msls": msls,
+      "insight_count": len(rows),
+      "dates": dates,
+      "monthly_interactions": monthly,
+    }
+
+  def query(self, filters: Optional[Dict[str, Any]] = None, group_by: Sequence[str] = (), metrics: bool = False) -> Dict[str, Any]:
+    sel = self.select(filters)
+    out = {
+      "insights": int(self.counts[sel].sum()),
+      "cells": int(sel.sum()),
+      "groups": self.group_counts(sel, group_by) if group_by else [],
+    }
+    if metrics:
+      out["metrics"] = self.slice_metrics(sel)
+    return out
+
+_CUBES: "OrderedDict[str, InsightCube]" = OrderedDict()
+_CUBES_LOCK = threading.Lock()
+
+def put_cube(dataset: str, cube: InsightCube) -> None:
+  with _CUBES_LOCK:
+    _CUBES[dataset] = cube
+    _CUBES.move_to_end(dataset)
+    while len(_CUBES) > CUBE_MAX_DATASETS:
+      _CUBES.popitem(last=False)
+
+def get_cube(dataset: str) -> InsightCube:
+  """
+  Raises KeyError for unknown (or evicted) datasets.
+  """
+  with _CUBES_LOCK:
+    cube = _CUBES[dataset]
+    _CUBES.move_to_end(dataset)
+    return cube
+
+register_gauge("msl_cube_datasets", "Insight cubes held in memory.", (), lambda: {(): len(_CUBES)})
@@ -1,30 +1,214 @@
-from typing import List, Dict
-from datetime import datetime
+import numbers
+from typing import List, Dict, Any, Optional
+from datetime import datetime, date, timedelta
+from functools import lru_cache
+from bisect import bisect_left, bisect_right
+from app.metrics import register_lru_cache
 
-def get_date_range(rows: List[Dict]) -> str:
-  dates = []
-  for r in rows:
-    # print("row:",r)
-    d = r.get("Report Date")
-    # print(d)
-    if d:
-      try:
-        # parse format m/d/YYYY
-        dt = datetime.strptime(d.strip(), "%m/%d/%Y")
-        dates.append(dt)
-      except ValueError:
-        continue  # skip bad formats
-  
-  if not dates:
-    return "No valid dates"
-  
-  earliest = min(dates)
-  latest = max(dates)
-  
+# Excel stores dates as days since 1899-12-30 (Lotus leap-year bug included)
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+# Only treat numbers in this range as serials (~1954..2119), so "3" is never a date
+_EXCEL_MIN, _EXCEL_MAX = 20000, 80000
+
+# Batches of more rows than this parse their distinct strings in one vectorized pandas call
+PANDAS_BATCH_THRESHOLD = 5000
+
+def _from_excel_serial(num: float) -> Optional[datetime]:
+  if _EXCEL_MIN <= num <= _EXCEL_MAX:
+    return datetime.fromordinal(_EXCEL_EPOCH.toordinal() + int(num))
+  return None
+
+@lru_cache(maxsize=8192)
+def _parse_date_str(s: str) -> Optional[datetime]:
+  s = s.strip()
+  if not s:
+    return None
+  # m/d/YYYY (the CRM export format) without going through strptime
+  parts = s.split("/")
+  if len(parts) == 3 and all(p.isdigit() for p in parts) and len(parts[2]) == 4:
+    try:
+      return datetime(int(parts[2]), int(parts[0]), int(parts[1]))
+    except ValueError:
+      return None
+  # ISO 8601: 2025-03-04, 2025-03-04T10:00:00, 2025-03-04 10:00:00Z ...
+  if len(s) >= 10 and s[4] == "-":
+    try:
+      return datetime.fromisoformat(s).replace(tzinfo=None)
+    except ValueError:
+      return None
+  # Excel serial sent as text
+  try:
+    return _from_excel_serial(float(s))
+  except ValueError:
+    return None
+
+register_lru_cache("report_date", _parse_date_str)
+
+def parse_report_date(val: Any) -> Optional[datetime]:
+  """
+  Parses one 'Report Date' cell. Accepts m/d/YYYY, ISO dates and Excel serials
+  (number, including NumPy scalars from the columnar/xlsx paths, or numeric
+  string), plus datetime/date objects. Returns None if unparseable.
+  """
+  if val is None or isinstance(val, bool):
+    return None
+  if isinstance(val, datetime):
+    return val.replace(tzinfo=None)
+  if isinstance(val, date):
+    return datetime(val.year, val.month, val.day)
+  if isinstance(val, numbers.Real):
+    return _from_excel_serial(float(val))
+  if isinstance(val, str):
+    return _parse_date_str(val)
+  return None
+
+def _pandas_parse(strings: List[str]) -> Dict[str, Optional[datetime]]:
+  import pandas as pd
+
+  parsed = pd.to_datetime(pd.Series(strings).str.strip(), format="%m/%d/%Y", errors="coerce")
+  out: Dict[str, Optional[datetime]] = {}
+  for s, ts in zip(strings, parsed):
+    # anything not in the export format falls back to the scalar parser
+    out[s] = ts.to_pydatetime() if not pd.isna(ts) else _parse_date_str(s)
+  return out
+
+def parse_report_dates(values: List[Any]) -> List[Optional[datetime]]:
+  """
+  Parses a batch of 'Report Date' cells. Each distinct string is parsed once;
+  for batches over PANDAS_BATCH_THRESHOLD rows the distinct strings go through
+  one pandas.to_datetime call instead of the per-string parser.
+  """
+  if len(values) > PANDAS_BATCH_THRESHOLD:
+    lookup = _pandas_parse(list({v for v in values if isinstance(v, str)}))
+    return [lookup[v] if isinstance(v, str) else parse_report_date(v) for v in values]
+  return [parse_report_date(v) for v in values]
+
+def format_date_range(earliest: datetime, latest: datetime) -> str:
   # Format as "Month YYYY"
   start_str = earliest.strftime("%B %Y")
   end_str = latest.strftime("%B %Y")
-  
   if start_str == end_str:
     return start_str
-  return f"{start_str} - {end_str}"
\ No newline at end of file
+  return f"{start_str} - {end_str}"
+
+def month_key(dt: datetime) -> str:
+  return f"{dt.year:04d}-{dt.month:02d}"
+
+def quarter_key(dt: datetime) -> str:
+  return f"{dt.year:04d}-Q{(dt.month - 1) // 3 + 1}"
+
+def window_bounds(start: Any = None, end: Any = None) -> tuple[Optional[datetime], Optional[datetime]]:
+  """
+  Parsed reporting window bounds; a missing or blank bound is None, one that
+  is given but doesn't parse raises ValueError.
+  """
+  out = []
+  for name, val in (("start", start), ("end", end)):
+    if val is None or (isinstance(val, str) and not val.strip()):
+      out.append(None)
+      continue
+    dt = parse_report_date(val)
+    if dt is None:
+      raise ValueError(f"reporting_window {name} {val!r} is not a recognised date")
+    out.append(dt)
+  return out[0], out[1]
+
+def quarters_within(start: Any, end: Any) -> List[str]:
+  """
+  Quarters ("2025-Q2") lying entirely inside the reporting window
+  [start, end] (end date inclusive); none unless both ends parse.
+  """
+  start_dt, end_dt = parse_report_date(start), parse_report_date(end)
+  if start_dt is None or end_dt is None:
+    return []
+  # first quarter starting on/after start; last quarter ending on/before end
+  y, q = start_dt.year, (start_dt.month - 1) // 3
+  if start_dt > datetime(y, 3 * q + 1, 1):
+    y, q = (y + 1, 0) if q == 3 else (y, q + 1)
+  out = []
+  while True:
+    ey, em = (y + 1, 1) if q == 3 else (y, 3 * q + 4)
+    if datetime(ey, em, 1).date() > end_dt.date() + timedelta(days=1):
+      return out
+    out.append(f"{y:04d}-Q{q + 1}")
+    y, q = (ey, 0) if q == 3 else (y, q + 1)
+
+class DateIndex:
+  """
+  Sorted index of parsed report dates -> row positions.
+  Answers the overall range, windowed row filters and per-month histograms.
+  """
+  def __init__(self, rows: List[Dict]):
+    self.rows = rows
+    dates = parse_report_dates([r.get("Report Date") for r in rows])
+    pairs = sorted((d, i) for i, d in enumerate(dates) if d is not None)
+    self.dates = [d for d, _ in pairs]
+    self.positions = [i for _, i in pairs]
+
+  def __len__(self) -> int:
+    return len(self.dates)
+
+  def _bounds(self, start: Any = None, end: Any = None) -> tuple[int, int]:
+    lo, hi = 0, len(self.dates)
+    start_dt, end_dt = window_bounds(start, end)
+    if start_dt is not None:
+      lo = bisect_left(self.dates, start_dt)
+    if end_dt is not None:
+      # inclusive end date: anything on that day still counts
+      hi = bisect_right(self.dates, end_dt.replace(hour=23, minute=59, second=59, microsecond=999999))
+    return lo, max(lo, hi)
+
+  def window(self, start: Any = None, end: Any = None) -> List[int]:
+    """
+    Row positions whose report date falls in [start, end] (either bound optional).
+    """
+    lo, hi = self._bounds(start, end)
+    return sorted(self.positions[lo:hi])
+
+  def window_rows(self, start: Any = None, end: Any = None) -> List[Dict]:
+    return [self.rows[i] for i in self.window(start, end)]
+
+  def range_label(self) -> str:
+    if not self.dates:
+      return "No valid dates"
+    return format_date_range(self.dates[0], self.dates[-1])
+
+  def monthly_counts(self, start: Any = None, end: Any = None) -> Dict[str, int]:
+    """
+    Rows per "YYYY-MM", in chronological order.
+    """
+    lo, hi = self._bounds(start, end)
+    out: Dict[str, int] = {}
+    for dt in self.dates[lo:hi]:
+      key = month_key(dt)
+      out[key] = out.get(key, 0) + 1
+    return out
+
+  def monthly_interactions(self, start: Any = None, end: Any = None) -> Dict[str, int]:
+    """
+    Unique interactions (IDs) per "YYYY-MM"; rows without an ID count on their own,
+    same as count_unique_interactions.
+    """
+    lo, hi = self._bounds(start, end)
+    ids: Dict[str, set] = {}
+    missing: Dict[str, int] = {}
+    for dt, pos in zip(self.dates[lo:hi], self.positions[lo:hi]):
+      key = month_key(dt)
+      ids.setdefault(key, set())
+      id_val = str(self.rows[pos].get("ID", "")).strip()
+      if id_val:
+        ids[key].add(id_val)
+      else:
+        missing[key] = missing.get(key, 0) + 1
+    return {k: len(v) + missing.get(k, 0) for k, v in ids.items()}
+
+def filter_rows_by_window(rows: List[Dict], start: Any = None, end: Any = None) -> List[Dict]:
+  """
+  Rows whose report date falls in the reporting window [start, end].
+  Rows without a parseable date are dropped; an unparseable bound raises
+  ValueError.
+  """
+  return DateIndex(rows).window_rows(start, end)
+
+def get_date_range(rows: List[Dict]) -> str:
+  return DateIndex(rows).range_label()
@@ -0,0 +1,172 @@
+"""
+Near-duplicate insight collapsing (MinHash + LSH) before prompting.
+
+MSLs often log almost the same insight after the same congress. Each text
+becomes a set of word 3-gram shingles. A 128-value MinHash signature
+estimates the Jaccard similarity between two such sets. LSH banding
+(16 bands of 8 rows) only compares texts that share a whole band. Every
+candidate is checked against its bucket's first member: if the share of
+equal signature values is at least DEDUPE_THRESHOLD, the two are joined.
+Each cluster is kept as its earliest row, which carries the member IDs and
+the cluster size, so theme support counts stay accurate.
+"""
+import os
+import zlib
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from app.data_analytics.insight_store import TEXT_COL, tokenize
+from app.metrics import timed_fn
+
+# opt-in: "1" collapses near-duplicate rows before prompting; off, every row goes to the LLM verbatim
+DEDUPE_INSIGHTS = os.environ.get("DEDUPE_INSIGHTS", "0") == "1"
+DEDUPE_THRESHOLD = float(os.environ.get("DEDUPE_THRESHOLD", "0.8"))
+
+DUPLICATE_IDS_KEY = "Near-Duplicate IDs"
+DUPLICATE_COUNT_KEY = "Near-Duplicate Count"
+
+NUM_PERM = 128
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+SHINGLE = 3
+_PRIME = (1 << 31) - 1
+# fixed seed: identical input always collapses the same way
+_rng = np.random.default_rng(0x5EED)
+_A = _rng.integers(1, _PRIME, size=NUM_PERM, dtype=np.int64)
+_B = _rng.integers(0, _PRIME, size=NUM_PERM, dtype=np.int64)
+# signature values computed per block of shingles, to bound memory
+_BLOCK = 1 << 15
+
+def shingles(text: Any) -> List[int]:
+  """
+  Stable 31-bit hashes of the word 3-grams (or of the words, for short texts).
+  """
+  words = tokenize(text)
+  grams = [" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)] or words
+  return sorted({zlib.crc32(g.encode("utf-8")) % _PRIME for g in grams})
+
+def signatures(texts: List[Any]) -> np.ndarray:
+  """
+  (len(texts), NUM_PERM) MinHash matrix. Empty texts get all-max rows, which
+  never match anything.
+  """
+  sig = np.full((len(texts), NUM_PERM), _PRIME, dtype=np.int64)
+  hashes, owner = [], []
+  for i, t in enumerate(texts):
+    h = shingles(t)
+    hashes.extend(h)
+    owner.extend([i] * len(h))
+  hashes = np.asarray(hashes, dtype=np.int64)
+  owner = np.asarray(owner, dtype=np.int64)
+  for start in range(0, len(hashes), _BLOCK):
+    x, docs = hashes[start:start + _BLOCK], owner[start:start + _BLOCK]
+    values = (_A[:, None] * x[None, :] + _B[:, None]) % _PRIME
+    # owner is sorted, so each doc's shingles are one contiguous run
+    firsts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+    block_min = np.minimum.reduceat(values, firsts, axis=1).T
+    np.minimum.at(sig, docs[firsts], block_min)
+  return sig
+
+def _find(parent: List[int], i: int) -> int:
+  while parent[i] != i:
+    parent[i] = parent[parent[i]]
+    i = parent[i]
+  return i
+
+def cluster_texts(texts: List[Any], threshold: float = DEDUPE_THRESHOLD) -> List[List[int]]:
+  """
+  Near-duplicate clusters as lists of positions (ascending), in order of
+  their first member. Singletons are included.
+  """
+  if len(texts) < 2:
+    return [[i] for i in range(len(texts))]
+  # texts equal after tokenizing share one signature; empty ones stay apart
+  distinct: Dict[str, int] = {}
+  uniq: List[str] = []
+  slot = []
+  for t in texts:
+    key = " ".join(tokenize(t))
+    if not key or key not in distinct:
+      if key:
+        distinct[key] = len(uniq)
+      slot.append(len(uniq))
+      uniq.append(key)
+    else:
+      slot.append(distinct[key])
+  n = len(uniq)
+  sig = signatures(uniq)
+  empty = sig[:, 0] == _PRIME
+  parent = list(range(n))
+  weights = np.int64(1_000_003) ** np.arange(ROWS_PER_BAND, dtype=np.int64)
+  for b in range(BANDS):
+    band = sig[:, b * ROWS_PER_BAND:(b + 1) * ROWS_PER_BAND]
+    keys = band @ weights
+    _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+    leader = first[inverse.reshape(-1)]
+    cand = np.flatnonzero((leader != np.arange(n)) & ~empty)
+    if not len(cand):
+      continue
+    similar = (sig[cand] == sig[leader[cand]]).mean(axis=1) >= threshold
+    for i, j in zip(cand[similar].tolist(), leader[cand[similar]].tolist()):
+      ri, rj = _find(parent, i), _find(parent, j)
+      if ri != rj:
+        parent[max(ri, rj)] = min(ri, rj)
+  # distinct texts are numbered in order of first occurrence, so roots are too
+  clusters: Dict[int, List[int]] = {}
+  for i, s in enumerate(slot):
+    clusters.setdefault(_find(parent, s), []).append(i)
+  return list(clusters.values())
+
+@timed_fn("dedupe_rows")
+def collapse_rows(rows: List[Dict[str, Any]], threshold: float = DEDUPE_THRESHOLD, text_key: str = TEXT_COL) -> List[Dict[str, Any]]:
+  """
+  One row per near-duplicate cluster (its earliest member). Representatives
+  of clusters with more than one row carry DUPLICATE_IDS_KEY (the other
+  members' IDs) and DUPLICATE_COUNT_KEY (cluster size, representative
+  included). Rows are copied, not mutated.
+  """
+  out = []
+  for members in cluster_texts([r.get(text_key) for r in rows], threshold):
+    rep = dict(rows[members[0]])
+    if len(members) > 1:
+      rep[DUPLICATE_IDS_KEY] = [rows[i].get("ID") for i in members[1:]]
+      rep[DUPLICATE_COUNT_KEY] = len(members)
+    out.append(rep)
+  return out
+
+def duplicate_groups(rows: List[Dict[str, Any]]) -> Dict[str, List[Any]]:
+  """
+  Representative ID -> member IDs, read back from collapsed rows. An ID can
+  represent several clusters (one interaction logs several insights, across
+  products); their members are merged, in order, without repeats.
+  """
+  groups: Dict[str, List[Any]] = {}
+  seen: Dict[str, set] = {}
+  for r in rows:
+    if not r.get(DUPLICATE_IDS_KEY):
+      continue
+    key = str(r.get("ID"))
+    members, known = groups.setdefault(key, []), seen.setdefault(key, set())
+    for member in r[DUPLICATE_IDS_KEY]:
+      if str(member) not in known:
+        known.add(str(member))
+        members.append(member)
+  return groups
+
+def expand_theme_sources(theme: Dict[str, Any], groups: Optional[Dict[str, List[Any]]]) -> Dict[str, Any]:
+  """
+  Copy of an LLM theme whose other_sources also list the collapsed members of
+  every representative it cites, so "n=" counts the original insights.
+  """
+  if not groups:
+    return theme
+  cited = [q.get("id") for q in theme.get("representative_quotes") or []] + list(theme.get("other_sources") or [])
+  sources = list(theme.get("other_sources") or [])
+  seen = {str(s) for s in cited}
+  for id_val in cited:
+    for member in groups.get(str(id_val), []):
+      if str(member) not in seen:
+        seen.add(str(member))
+        sources.append(member)
+  return {**theme, "other_sources": sources}
@@ -1,6 +1,9 @@
 from collections import Counter
+from functools import lru_cache
 from typing import List, Dict, Any
 import re
+import numpy as np
+from app.metrics import register_lru_cache
 
 
 INSIGHT_COLS = [
@@ -17,23 +20,111 @@ INSIGHT_COLS = [
 
 TIERS = [1,2,3]
 
+# One bit per category column, in INSIGHT_COLS order (9 bits -> fits a uint16)
+_N_CATS = len(INSIGHT_COLS)
+_N_MASKS = 1 << _N_CATS
+# _MASK_BITS[m, i] == 1 when mask m has category i set
+_MASK_BITS = ((np.arange(_N_MASKS)[:, None] >> np.arange(_N_CATS)) & 1).astype(np.int64)
+
+@lru_cache(maxsize=256)
+def _cell_hit_cached(val) -> bool:
+	try:
+		return int(val) == 1
+	except Exception:
+		return False
+
+register_lru_cache("category_cell", _cell_hit_cached)
+
+def _cell_hit(val) -> bool:
+	"""
+	True when a category cell counts as a hit (int(val) == 1).
+	Exports only use a handful of distinct cell values, so results are memoized.
+	"""
+	try:
+		return _cell_hit_cached(val)
+	except TypeError:
+		# unhashable cell (e.g. a nested dict from n8n) -> never a hit
+		return False
+
+def _column_hits(values, n: int) -> np.ndarray:
+	"""
+	Boolean hit vector for one category column.
+	Numeric arrays are compared directly; anything else goes through _cell_hit.
+	Floats are truncated first, the same int(val) == 1 rule (1.5 counts, NaN doesn't).
+	"""
+	if isinstance(values, np.ndarray) and values.dtype.kind in "biu":
+		return values == 1
+	if isinstance(values, np.ndarray) and values.dtype.kind == "f":
+		return np.trunc(values) == 1
+	return np.fromiter((_cell_hit(v) for v in values), dtype=bool, count=n)
+
+def category_bitmasks_from_columns(columns: Dict[str, Any], n: int) -> np.ndarray:
+	"""
+	Packs category columns into one uint16 bitmask per row.
+	`columns` maps column name -> sequence (or NumPy array) of length n.
+	Missing columns contribute no hits.
+	"""
+	masks = np.zeros(n, dtype=np.uint16)
+	for bit, col in enumerate(INSIGHT_COLS):
+		values = columns.get(col)
+		if values is None:
+			continue
+		masks |= _column_hits(values, n).astype(np.uint16) << np.uint16(bit)
+	return masks
+
+def category_bitmasks(rows: List[Dict]) -> np.ndarray:
+	"""
+	Packs the INSIGHT_COLS of each row into a uint16 bitmask (bit i == INSIGHT_COLS[i]).
+	"""
+	columns = {col: [r.get(col, 0) for r in rows] for col in INSIGHT_COLS}
+	return category_bitmasks_from_columns(columns, len(rows))
+
+def _mask_histogram(masks: np.ndarray) -> np.ndarray:
+	return np.bincount(masks.astype(np.int64), minlength=_N_MASKS)
+
+def category_counts_from_masks(masks: np.ndarray) -> Dict[str, int]:
+	"""
+	Category hit counts from packed bitmasks (zero-count categories omitted).
+	"""
+	counts = _mask_histogram(masks) @ _MASK_BITS
+	return {col: int(c) for col, c in zip(INSIGHT_COLS, counts) if c > 0}
+
 def pie_insight_category_counts(rows: List[Dict]) -> Dict[str, int]:
 	"""
 	Tallies category-hits across all rows.
 	Each '1' in a category column contributes one hit.
 	Overlaps are expected (a single row can increment multiple categories).
 	"""
-	hits = Counter()
-	for r in rows:
-		for col in INSIGHT_COLS:
-			val = r.get(col, 0)
-			try:
-				val = int(val)
-			except Exception:
-				val = 0
-			if val == 1:
-				hits[col] += 1
-	return dict(hits)
+	return category_counts_from_masks(category_bitmasks(rows))
+
+def category_cooccurrence(rows: List[Dict]) -> Dict[str, Dict[str, int]]:
+	"""
+	Category co-occurrence matrix: result[a][b] = rows tagged with both a and b.
+	The diagonal equals the per-category hit count.
+	"""
+	hist = _mask_histogram(category_bitmasks(rows))
+	matrix = _MASK_BITS.T @ (_MASK_BITS * hist[:, None])
+	return {
+		a: {b: int(matrix[i, j]) for j, b in enumerate(INSIGHT_COLS)}
+		for i, a in enumerate(INSIGHT_COLS)
+	}
+
+def category_counts_by(rows: List[Dict], key: str) -> Dict[str, Dict[str, int]]:
+	"""
+	Per-group category hit counts, grouped by the value of `key`
+	(e.g. "MSL Name" or "Product Discussed"). Rows without a value go to "Unknown".
+	"""
+	if not rows:
+		return {}
+	labels = [str(r.get(key) or "").strip() or "Unknown" for r in rows]
+	groups, codes = np.unique(np.array(labels, dtype=object), return_inverse=True)
+	masks = category_bitmasks(rows).astype(np.int64)
+	hist = np.bincount(codes * _N_MASKS + masks, minlength=len(groups) * _N_MASKS)
+	counts = hist.reshape(len(groups), _N_MASKS) @ _MASK_BITS
+	return {
+		str(g): {col: int(c) for col, c in zip(INSIGHT_COLS, row) if c > 0}
+		for g, row in zip(groups, counts)
+	}
 
 def pie_insight_category_counts_raw(rows: List[Dict]) -> Dict[str, int]:
 	"""
@@ -45,25 +136,67 @@ def pie_insight_category_counts_raw(rows: List[Dict]) -> Dict[str, int]:
 
 _TIER_LABELS = {1: "Tier 1", 2: "Tier 2", 3: "Tier 3"}
 
+# Bare digit 1/2/3, else T1/T2/T3 or 'Tier1' (no space)
+_TIER_DIGIT_RE = re.compile(r"\b([123])\b")
+_TIER_PREFIX_RE = re.compile(r"\bT(?:ier)?\s*([123])\b", re.IGNORECASE)
+
+@lru_cache(maxsize=1024)
+def _parse_tier_str(s: str) -> int | None:
+  m = _TIER_DIGIT_RE.search(s) or _TIER_PREFIX_RE.search(s)
+  return int(m.group(1)) if m else None
+
+register_lru_cache("kol_tier", _parse_tier_str)
+
+def parse_kol_tier(raw: Any) -> int | None:
+  """
+  Normalizes a raw 'KOL Tier' cell (1, "1", "Tier 1", "T1", ...) to 1/2/3, or None.
+  Each distinct spelling is parsed once and memoized.
+  """
+  if raw is None:
+    return None
+  return _parse_tier_str(str(raw).strip())
+
+class KolTierCounts:
+  """
+  Incrementally updatable KOL tier aggregate.
+  Feed it rows (or raw tier values) in any number of batches, read counts at any time.
+  """
+  def __init__(self, rows: List[Dict[str, Any]] | None = None):
+    self.hits = Counter({t: 0 for t in TIERS})
+    if rows:
+      self.update(rows)
+
+  def add_value(self, raw: Any, n: int = 1) -> None:
+    tier = parse_kol_tier(raw)
+    if tier is not None:
+      self.hits[tier] += n
+
+  def update_values(self, values) -> None:
+    # Count distinct raw values first, so parsing is one dict hit per distinct value.
+    # Keyed by type too: True == 1 and 1.0 == 1 but they don't parse alike.
+    values = list(values)
+    try:
+      distinct = Counter((type(v), v) for v in values)
+    except TypeError:
+      # unhashable cells (e.g. nested dicts) -> parse one by one
+      for raw in values:
+        self.add_value(raw)
+      return
+    for (_, raw), n in distinct.items():
+      self.add_value(raw, n)
+
+  def update(self, rows: List[Dict[str, Any]]) -> None:
+    self.update_values(r.get("KOL Tier", None) for r in rows)
+
+  def merge(self, other: "KolTierCounts") -> None:
+    self.hits.update(other.hits)
+
+  def pretty(self) -> Dict[str, int]:
+    return {_TIER_LABELS[k]: v for k, v in self.hits.items() if v > 0}
+
 def kol_tier_counts_pretty(rows: List[Dict[str, Any]]) -> Dict[str, int]:
   """
   Count KOL Tier values (1/2/3) from the 'KOL Tier' column and return pretty labels.
 	Accepts values like 1, "1", "Tier 1", "T1".
 	"""
-  hits = Counter({1: 0, 2: 0, 3: 0})
-  for r in rows:
-    raw = r.get("KOL Tier", None)
-    if raw is None:
-      continue
-    s = str(raw).strip()
-    # Extract first digit 1/2/3 if present
-    m = re.search(r"\b([123])\b", s)
-    if not m:
-      # Also allow T1/T2/T3 or 'Tier1' (no space)
-      m = re.search(r"\bT(?:ier)?\s*([123])\b", s, re.IGNORECASE)
-    if m:
-      tier = int(m.group(1))
-      if tier in hits:
-        hits[tier] += 1
-  # Convert to pretty labels
-  return {_TIER_LABELS[k]: v for k, v in hits.items() if v > 0}
\ No newline at end of file
+  return KolTierCounts(rows).pretty()
@@ -0,0 +1,181 @@
+"""
+Streaming ingestion of raw CRM exports (CSV or XLSX).
+
+Files are parsed in fixed-size row chunks (pandas `chunksize` for CSV,
+openpyxl read-only mode for XLSX) and folded into a StreamingAggregator, so
+the whole export never has to be materialized as one list of dicts.
+"""
+import os
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+import numpy as np
+
+from app.data_analytics.congresses import _get_congress
+from app.data_analytics.dates import parse_report_dates, format_date_range, month_key
+from app.data_analytics.icategories import INSIGHT_COLS, KolTierCounts, category_bitmasks, _mask_histogram, _MASK_BITS
+from app.data_analytics.unique_msls import _clean_name
+
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", "20000"))
+
+class StreamingAggregator:
+  """
+  compute_metrics() computed incrementally: feed normalized rows in any number
+  of chunks, read the same aggregates from snapshot().
+  """
+  def __init__(self):
+    self.insights = 0
+    self.mask_hist = np.zeros(1 << len(INSIGHT_COLS), dtype=np.int64)
+    self.tiers = KolTierCounts()
+    self.ids: Set[str] = set()
+    self.missing_ids = 0
+    # practice setting per interaction, first row wins (as pie_practice_setting_by_interaction)
+    self.settings: Counter = Counter()
+    self.msls: Set[str] = set()
+    self.congresses: Set[str] = set()
+    self.earliest = self.latest = None
+    self.month_ids: Dict[str, Set[str]] = {}
+    self.month_missing: Counter = Counter()
+
+  def add_rows(self, rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+      return
+    self.insights += len(rows)
+    self.mask_hist += _mask_histogram(category_bitmasks(rows))
+    self.tiers.update(rows)
+    dates = parse_report_dates([r.get("Report Date") for r in rows])
+
+    for r, dt in zip(rows, dates):
+      id_val = str(r.get("ID", "")).strip()
+      if id_val:
+        if id_val not in self.ids:
+          self.ids.add(id_val)
+          self.settings[(r.get("KOL Practice Setting") or "").strip() or "Unknown"] += 1
+      else:
+        self.missing_ids += 1
+        self.settings[(r.get("KOL Practice Setting") or "").strip() or "Unknown"] += 1
+
+      msl = _clean_name(r.get("MSL Name"))
+      if msl:
+        self.msls.add(msl)
+      congress = _get_congress(r)
+      if congress:
+        self.congresses.add(congress)
+
+      if dt is not None:
+        if self.earliest is None or dt < self.earliest:
+          self.earliest = dt
+        if self.latest is None or dt > self.latest:
+          self.latest = dt
+        key = month_key(dt)
+        if id_val:
+          self.month_ids.setdefault(key, set()).add(id_val)
+        else:
+          self.month_missing[key] += 1
+
+  def snapshot(self) -> Dict[str, Any]:
+    """
+    Aggregates so far, shaped like demosite.compute_metrics.
+    """
+    counts = self.mask_hist @ _MASK_BITS
+    months = sorted(set(self.month_ids) | set(self.month_missing))
+    return {
+      "practice_counts": dict(self.settings),
+      "category_counts": {col: int(c) for col, c in zip(INSIGHT_COLS, counts) if c > 0},
+      "kol_tier_counts": self.tiers.pretty(),
+      "congresses": sorted(self.congresses),
+      "n_interactions": len(self.ids) + self.missing_ids,
+      "msls": sorted(self.msls),
+      "insight_count": self.insights,
+      "dates": format_date_range(self.earliest, self.latest) if self.earliest else "No valid dates",
+      "monthly_interactions": {m: len(self.month_ids.get(m, ())) + self.month_missing.get(m, 0) for m in months},
+    }
+
+def iter_csv_chunks(fileobj, chunksize: int = INGEST_CHUNK_ROWS) -> Iterator[List[Dict[str, Any]]]:
+  import pandas as pd
+
+  # every cell as text, empty cells as "" (matches what n8n sends)
+  reader = pd.read_csv(fileobj, chunksize=chunksize, dtype=str, keep_default_na=False, encoding_errors="replace")
+  for frame in reader:
+    yield frame.to_dict("records")
+
+def iter_xlsx_chunks(fileobj, chunksize: int = INGEST_CHUNK_ROWS, sheet: Optional[str] = None) -> Iterator[List[Dict[str, Any]]]:
+  """
+  Raises ValueError for a corrupt workbook (bad zip, missing parts or sheet,
+  malformed XML), whether it shows up on open or while streaming rows.
+  """
+  import zipfile
+  import zlib
+  from xml.etree.ElementTree import ParseError
+  from openpyxl import load_workbook
+  from openpyxl.utils.exceptions import InvalidFileException
+
+  corrupt = (zipfile.BadZipFile, InvalidFileException, KeyError, zlib.error, ParseError, EOFError)
+  try:
+    wb = load_workbook(fileobj, read_only=True, data_only=True)
+  except corrupt as e:
+    raise ValueError(f"Invalid .xlsx file: {e}") from e
+  try:
+    ws = wb[sheet] if sheet else wb.worksheets[0]
+    values = ws.iter_rows(values_only=True)
+    header = next(values, None)
+    if header is None:
+      return
+    cols = [str(h).strip() if h is not None else f"column_{i}" for i, h in enumerate(header)]
+    chunk: List[Dict[str, Any]] = []
+    for row in values:
+      if row is None or all(v is None for v in row):
+        continue
+      chunk.append({c: ("" if v is None else v) for c, v in zip(cols, row)})
+      if len(chunk) >= chunksize:
+        yield chunk
+        chunk = []
+    if chunk:
+      yield chunk
+  except corrupt as e:
+    raise ValueError(f"Invalid .xlsx file: {e}") from e
+  finally:
+    wb.close()
+
+def upload_kind(filename: str = "", content_type: str = "") -> Optional[str]:
+  """
+  "csv" or "xlsx" by extension (or content type); None if unsupported.
+  """
+  name = (filename or "").lower()
+  if name.endswith((".xlsx", ".xlsm")) or "spreadsheetml" in (content_type or ""):
+    return "xlsx"
+  if name.endswith(".csv") or content_type in ("text/csv", "application/csv"):
+    return "csv"
+  return None
+
+def iter_upload_chunks(fileobj, filename: str = "", content_type: str = "", chunksize: int = INGEST_CHUNK_ROWS) -> Iterator[List[Dict[str, Any]]]:
+  kind = upload_kind(filename, content_type)
+  if kind == "xlsx":
+    return iter_xlsx_chunks(fileobj, chunksize)
+  if kind == "csv":
+    return iter_csv_chunks(fileobj, chunksize)
+  raise ValueError(f"Unsupported upload type: {filename or content_type or 'unknown'} (expected .csv or .xlsx)")
+
+def hold_back_last_interaction(chunks: Iterator[List[Dict[str, Any]]]) -> Iterator[List[Dict[str, Any]]]:
+  """
+  Re-chunks so rows of the interaction at a chunk boundary travel together.
+  The metrics store replaces an ID's contribution on every apply, so an
+  interaction split across two applies would lose its first half. Exports list
+  an interaction's rows contiguously; IDs that recur non-contiguously still
+  end up replaced by their last run.
+  """
+  carry: List[Dict[str, Any]] = []
+  for chunk in chunks:
+    rows = carry + chunk
+    last = str(rows[-1].get("ID", "")).strip() if rows else ""
+    cut = len(rows)
+    if last:
+      while cut > 0 and str(rows[cut - 1].get("ID", "")).strip() == last:
+        cut -= 1
+    if cut == 0:
+      carry = rows
+      continue
+    carry = rows[cut:]
+    yield rows[:cut]
+  if carry:
+    yield carry
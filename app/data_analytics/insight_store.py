@@ -0,0 +1,231 @@
+"""
+In-memory insight store for resolving and verifying LLM theme quotes.
+
+Theme outputs cite insights as {"id": ..., "quote": ...} and list
+supporting IDs in other_sources. The store keeps every row's
+"Raw CRM Input (from MSL)" text and indexes it two ways:
+- an ID -> row positions dict, so a quoted ID is resolved in O(1) and its
+  quote is checked only against that interaction's own texts;
+- an inverted index (token -> sorted row positions and term counts), so
+  searches, and quotes attributed to the wrong ID, only touch rows that
+  contain every token.
+"""
+import hashlib
+import math
+import os
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+from app.metrics import register_gauge, timed_fn
+
+TEXT_COL = "Raw CRM Input (from MSL)"
+# Datasets kept in memory per worker; the least recently used is dropped first
+INSIGHT_STORE_MAX_DATASETS = int(os.environ.get("INSIGHT_STORE_MAX_DATASETS", "8"))
+
+# IDs listed per misattributed quote (the total is always reported)
+FOUND_IN_LIMIT = 20
+
+_TOKEN_RE = re.compile(r"\w+")
+_EMPTY = np.zeros(0, dtype=np.int64)
+# LLMs restyle punctuation when quoting; fold it before substring checks
+_FOLD = str.maketrans({
+  "\u2018": "'", "\u2019": "'", "\u201c": '"', "\u201d": '"',
+  "\u2010": "-", "\u2011": "-", "\u2012": "-", "\u2013": "-", "\u2014": "-", "\u2212": "-",
+  "\u00a0": " ", "\u2026": "...",
+})
+# "..." (or "[...]") marks an elision inside a quote
+_ELLIPSIS_RE = re.compile(r"\s*\[?\.{3,}\]?\s*")
+# wrapping quote marks and punctuation the LLM adds around a quoted span
+_EDGE = "'\" .,;:!?-"
+
+def normalize_text(s: Any) -> str:
+  """
+  Casefolded, punctuation-folded, whitespace-collapsed text for quote matching.
+  """
+  s = unicodedata.normalize("NFKC", str(s or "")).translate(_FOLD).casefold()
+  return " ".join(s.split())
+
+def _quote_segments(quote: Any) -> List[str]:
+  """
+  The normalized pieces of a quote between elisions, edge punctuation
+  removed. Leading/trailing ellipses (truncated quotes) leave no empty piece.
+  """
+  pieces = (p.strip(_EDGE) for p in _ELLIPSIS_RE.split(normalize_text(quote)))
+  return [p for p in pieces if p]
+
+def _contains_in_order(text: str, segments: List[str]) -> bool:
+  at = 0
+  for seg in segments:
+    found = text.find(seg, at)
+    if found < 0:
+      return False
+    at = found + len(seg)
+  return True
+
+def tokenize(s: Any) -> List[str]:
+  return _TOKEN_RE.findall(normalize_text(s))
+
+class InsightStore:
+  """
+  Insight texts indexed by ID and by token; see the module docstring.
+  """
+  @timed_fn("insight_store_build")
+  def __init__(self, rows: List[Dict[str, Any]]):
+    self.rows = rows
+    self.ids = [str(r.get("ID", "")).strip() for r in rows]
+    self.texts = [str(r.get(TEXT_COL) or "") for r in rows]
+    self._norm = [normalize_text(t) for t in self.texts]
+    self.by_id: Dict[str, List[int]] = {}
+    for i, id_val in enumerate(self.ids):
+      if id_val:
+        self.by_id.setdefault(id_val, []).append(i)
+    rows_of: Dict[str, List[int]] = {}
+    tf_of: Dict[str, List[int]] = {}
+    for i, text in enumerate(self._norm):
+      # positions are appended in row order, so every posting list stays sorted
+      for tok, n in Counter(_TOKEN_RE.findall(text)).items():
+        rows_of.setdefault(tok, []).append(i)
+        tf_of.setdefault(tok, []).append(n)
+    # token -> (sorted row positions, term frequency in each of those rows)
+    self.postings: Dict[str, tuple] = {
+      tok: (np.asarray(positions, dtype=np.int64), np.asarray(tf_of[tok], dtype=np.float64))
+      for tok, positions in rows_of.items()
+    }
+
+    h = hashlib.sha1()
+    for id_val, text in zip(self.ids, self.texts):
+      h.update(id_val.encode("utf-8") + b"\0" + text.encode("utf-8") + b"\0")
+    self.fingerprint = h.hexdigest()
+
+  def describe(self) -> Dict[str, Any]:
+    return {"fingerprint": self.fingerprint, "rows": len(self.rows), "ids": len(self.by_id), "terms": len(self.postings)}
+
+  def get(self, id_val: Any) -> List[Dict[str, Any]]:
+    """
+    All rows of one interaction ID.
+    """
+    return [self.rows[i] for i in self.by_id.get(str(id_val).strip(), [])]
+
+  def _candidates(self, tokens: Iterable[str]) -> np.ndarray:
+    """
+    Rows containing every token: posting lists intersected rarest first.
+    """
+    lists = sorted((self.postings.get(t, (_EMPTY, _EMPTY))[0] for t in set(tokens)), key=len)
+    if not lists:
+      return _EMPTY
+    out = lists[0]
+    for positions in lists[1:]:
+      if not len(out):
+        break
+      out = np.intersect1d(out, positions, assume_unique=True)
+    return out
+
+  def locate(self, quote: Any) -> List[int]:
+    """
+    Rows whose text contains the quote (after normalization); an elided
+    quote's pieces must appear in order.
+    """
+    segments = _quote_segments(quote)
+    if not segments:
+      return []
+    # a piece's first/last token may be cut mid-word; only interior tokens are whole index terms
+    tokens = [t for seg in segments for t in _TOKEN_RE.findall(seg)[1:-1]]
+    candidates = self._candidates(tokens).tolist() if tokens else range(len(self._norm))
+    return [i for i in candidates if _contains_in_order(self._norm[i], segments)]
+
+  def verify_quote(self, id_val: Any, quote: Any) -> Dict[str, Any]:
+    """
+    Whether `quote` is real text of an insight of `id_val`: a substring
+    after normalization, or, for a quote with "..." elisions, its pieces in
+    order. Falls back to the inverted index when it isn't, to report where
+    the text actually appears ("found_in": other IDs).
+    """
+    id_val = str(id_val if id_val is not None else "").strip()
+    segments = _quote_segments(quote)
+    positions = self.by_id.get(id_val, [])
+    result: Dict[str, Any] = {"id": id_val, "id_known": bool(positions), "verified": False, "exact": False}
+    if not segments:
+      return result
+    raw = str(quote or "")
+    for i in positions:
+      if _contains_in_order(self._norm[i], segments):
+        result.update(verified=True, exact=raw in self.texts[i])
+        return result
+    found = sorted({self.ids[i] for i in self.locate(quote) if self.ids[i]})
+    result["found_in"] = found[:FOUND_IN_LIMIT]
+    result["found_in_count"] = len(found)
+    return result
+
+  def verify_theme(self, theme: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Per-quote verification plus which other_sources IDs exist in the store.
+    """
+    quotes = [self.verify_quote(q.get("id"), q.get("quote")) for q in theme.get("representative_quotes") or []]
+    sources = [str(s).strip() for s in theme.get("other_sources") or []]
+    known = [s for s in sources if s in self.by_id]
+    return {
+      "quotes": quotes,
+      "verified_quotes": sum(q["verified"] for q in quotes),
+      "other_sources_known": len(known),
+      "other_sources_unknown": sorted(set(sources) - set(known)),
+    }
+
+  def filter_theme(self, theme: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Copy of `theme` keeping only verified quotes and other_sources IDs that exist.
+    """
+    quotes = [q for q in theme.get("representative_quotes") or [] if self.verify_quote(q.get("id"), q.get("quote"))["verified"]]
+    sources = [s for s in theme.get("other_sources") or [] if str(s).strip() in self.by_id]
+    return {**theme, "representative_quotes": quotes, "other_sources": sources}
+
+  def search(self, query: str, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Rows containing every query token, ranked by tf-idf; a "quoted phrase"
+    query must also appear verbatim (after normalization).
+    """
+    phrase = query.strip()
+    is_phrase = len(phrase) > 1 and phrase[0] == phrase[-1] == '"'
+    tokens = [t for t in set(tokenize(query)) if t in self.postings]
+    if is_phrase:
+      candidates = np.asarray(self.locate(phrase[1:-1]), dtype=np.int64)
+    else:
+      candidates = self._candidates(tokenize(query))
+    if not len(candidates):
+      return []
+    # tf-idf: each token's tf for the candidates, looked up in its sorted posting list
+    n = max(len(self.rows), 1)
+    scores = np.zeros(len(candidates))
+    for t in tokens:
+      positions, tf = self.postings[t]
+      at = np.minimum(np.searchsorted(positions, candidates), len(positions) - 1)
+      hit = positions[at] == candidates
+      scores += np.where(hit, tf[at], 0.0) * math.log(1 + n / len(positions))
+    top = np.argsort(-scores, kind="stable")[:limit]
+    return [{"id": self.ids[i], "row": int(i), "score": round(float(scores[j]), 4), "text": self.texts[i]}
+            for j, i in zip(top, candidates[top])]
+
+_STORES: "OrderedDict[str, InsightStore]" = OrderedDict()
+_STORES_LOCK = threading.Lock()
+
+def put_insight_store(dataset: str, store: InsightStore) -> None:
+  with _STORES_LOCK:
+    _STORES[dataset] = store
+    _STORES.move_to_end(dataset)
+    while len(_STORES) > INSIGHT_STORE_MAX_DATASETS:
+      _STORES.popitem(last=False)
+
+def get_insight_store(dataset: str) -> InsightStore:
+  """
+  Raises KeyError for unknown (or evicted) datasets.
+  """
+  with _STORES_LOCK:
+    store = _STORES[dataset]
+    _STORES.move_to_end(dataset)
+    return store
+
+register_gauge("msl_insight_stores", "Insight stores held in memory.", (), lambda: {(): len(_STORES)})
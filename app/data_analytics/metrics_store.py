@@ -0,0 +1,207 @@
+"""
+Local, incrementally maintained aggregate store for deck stats.
+
+Rows are grouped into interactions by `ID`. Applying a delta for an ID replaces
+everything previously stored for that ID: its old contribution is subtracted
+from the counters and the new one is added, so the aggregates never need a
+full re-scan. Send every row of an interaction whenever that interaction changes.
+
+Rows without an ID each count as their own interaction, as in
+count_unique_interactions. They are keyed by their batch and position
+("_row_<batch>_<i>"), so identical ID-less rows are all counted; they can't
+be replaced by a later delta, only deleted by that key.
+"""
+import json
+import uuid
+import os
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Optional
+
+from app.data_analytics.congresses import _get_congress
+from app.data_analytics.dates import parse_report_dates, format_date_range, month_key
+from app.data_analytics.icategories import INSIGHT_COLS, category_bitmasks, parse_kol_tier, _TIER_LABELS
+from app.data_analytics.unique_msls import _clean_name
+
+DEFAULT_PATH = os.environ.get("METRICS_STORE_PATH", "metrics_store.sqlite3")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS interactions (
+  id TEXT PRIMARY KEY,
+  contrib TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS counters (
+  kind TEXT NOT NULL,
+  key TEXT NOT NULL,
+  n INTEGER NOT NULL,
+  PRIMARY KEY (kind, key)
+) WITHOUT ROWID;
+"""
+
+# category column names set in each possible bitmask
+_MASK_COLS = [
+  [col for bit, col in enumerate(INSIGHT_COLS) if mask >> bit & 1]
+  for mask in range(1 << len(INSIGHT_COLS))
+]
+
+def _interaction_key(row: Dict[str, Any], batch: str, position: int) -> str:
+  id_val = str(row.get("ID", "")).strip()
+  if id_val:
+    return id_val
+  return f"_row_{batch}_{position}"
+
+def _contribution(rows: List[Dict[str, Any]], masks, dates) -> Dict[str, Dict[str, int]]:
+  """
+  Counter deltas one interaction (all rows sharing an ID) adds to the store.
+  `masks` / `dates` are the rows' category bitmasks (as ints) and parsed report dates.
+  Mirrors the per-row logic of the analytics functions in this package.
+  """
+  c: Dict[str, Counter] = {k: Counter() for k in ("total", "category", "tier", "msl", "congress", "setting", "date", "month")}
+  c["total"]["insights"] = len(rows)
+  c["total"]["interactions"] = 1
+
+  for r, mask in zip(rows, masks):
+    for col in _MASK_COLS[mask]:
+      c["category"][col] += 1
+    tier = parse_kol_tier(r.get("KOL Tier", None))
+    if tier is not None:
+      c["tier"][_TIER_LABELS[tier]] += 1
+    msl = _clean_name(r.get("MSL Name"))
+    if msl:
+      c["msl"][msl] += 1
+    congress = _get_congress(r)
+    if congress:
+      c["congress"][congress] += 1
+
+  # practice setting counts once per interaction (first row wins)
+  setting = (rows[0].get("KOL Practice Setting") or "").strip() or "Unknown"
+  c["setting"][setting] = 1
+
+  dates = [d for d in dates if d is not None]
+  for d in dates:
+    c["date"][d.date().isoformat()] += 1
+  for m in {month_key(d) for d in dates}:
+    c["month"][m] = 1
+
+  return {kind: dict(vals) for kind, vals in c.items() if vals}
+
+class MetricsStore:
+  """
+  SQLite-backed counters (counts, unique MSLs/congresses, dates) kept current by row deltas.
+  """
+  def __init__(self, path: str = DEFAULT_PATH):
+    self.path = path
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.executescript(_SCHEMA)
+
+  @staticmethod
+  def _accumulate(total: Counter, contrib: Dict[str, Dict[str, int]], sign: int) -> None:
+    for kind, vals in contrib.items():
+      for key, n in vals.items():
+        total[(kind, key)] += sign * n
+
+  def _write_counters(self, delta: Counter) -> None:
+    self._conn.executemany(
+      "INSERT INTO counters (kind, key, n) VALUES (?, ?, ?) "
+      "ON CONFLICT(kind, key) DO UPDATE SET n = n + excluded.n",
+      [(kind, key, n) for (kind, key), n in delta.items() if n],
+    )
+    self._conn.execute("DELETE FROM counters WHERE n <= 0")
+
+  def _drop(self, ids: List[str], delta: Counter) -> int:
+    """
+    Subtracts the stored contribution of `ids` into `delta` and deletes them.
+    """
+    dropped = 0
+    for start in range(0, len(ids), 500):
+      chunk = ids[start:start + 500]
+      marks = ",".join("?" * len(chunk))
+      cur = self._conn.execute(f"SELECT contrib FROM interactions WHERE id IN ({marks})", chunk)
+      for (contrib,) in cur.fetchall():
+        self._accumulate(delta, json.loads(contrib), -1)
+        dropped += 1
+      self._conn.execute(f"DELETE FROM interactions WHERE id IN ({marks})", chunk)
+    return dropped
+
+  def apply_rows(self, rows: List[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Upserts normalized rows. Each ID present in `rows` replaces what was stored for it.
+    """
+    batch = uuid.uuid4().hex[:12]
+    groups: Dict[str, List[int]] = {}
+    for i, r in enumerate(rows):
+      groups.setdefault(_interaction_key(r, batch, i), []).append(i)
+    # parse the whole delta in one batch, then slice per interaction
+    masks = category_bitmasks(rows).tolist()
+    dates = parse_report_dates([r.get("Report Date") for r in rows])
+
+    delta: Counter = Counter()
+    stored = []
+    for id_val, idx in groups.items():
+      contrib = _contribution([rows[i] for i in idx], [masks[i] for i in idx], [dates[i] for i in idx])
+      self._accumulate(delta, contrib, 1)
+      stored.append((id_val, json.dumps(contrib)))
+
+    with self._lock, self._conn:
+      replaced = self._drop(list(groups), delta)
+      self._conn.executemany("INSERT INTO interactions (id, contrib) VALUES (?, ?)", stored)
+      self._write_counters(delta)
+    return {"interactions": len(groups), "replaced": replaced, "rows": len(rows), "batch": batch}
+
+  def delete_ids(self, ids: Iterable[str]) -> int:
+    delta: Counter = Counter()
+    with self._lock, self._conn:
+      dropped = self._drop([str(i).strip() for i in ids], delta)
+      self._write_counters(delta)
+    return dropped
+
+  def clear(self) -> None:
+    with self._lock, self._conn:
+      self._conn.execute("DELETE FROM interactions")
+      self._conn.execute("DELETE FROM counters")
+
+  def _kind(self, kind: str) -> Dict[str, int]:
+    cur = self._conn.execute("SELECT key, n FROM counters WHERE kind = ? AND n > 0 ORDER BY key", (kind,))
+    return {k: n for k, n in cur}
+
+  def snapshot(self) -> Dict[str, Any]:
+    """
+    Current aggregates, shaped like demosite.compute_metrics.
+    """
+    with self._lock:
+      totals = self._kind("total")
+      categories = self._kind("category")
+      tiers = self._kind("tier")
+      row = self._conn.execute(
+        "SELECT MIN(key), MAX(key) FROM counters WHERE kind = 'date' AND n > 0"
+      ).fetchone()
+      snap = {
+        "practice_counts": self._kind("setting"),
+        "category_counts": {col: categories[col] for col in INSIGHT_COLS if col in categories},
+        "kol_tier_counts": {label: tiers[label] for label in _TIER_LABELS.values() if label in tiers},
+        "congresses": sorted(self._kind("congress")),
+        "n_interactions": totals.get("interactions", 0),
+        "msls": sorted(self._kind("msl")),
+        "insight_count": totals.get("insights", 0),
+        "monthly_interactions": self._kind("month"),
+      }
+
+    if row and row[0]:
+      earliest, latest = parse_report_dates([row[0], row[1]])
+      snap["dates"] = format_date_range(earliest, latest)
+    else:
+      snap["dates"] = "No valid dates"
+    return snap
+
+_STORE: Optional[MetricsStore] = None
+_STORE_LOCK = threading.Lock()
+
+def get_metrics_store() -> MetricsStore:
+  global _STORE
+  with _STORE_LOCK:
+    if _STORE is None:
+      _STORE = MetricsStore()
+    return _STORE
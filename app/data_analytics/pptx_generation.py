@@ -4,6 +4,12 @@ from pptx.dml.color import RGBColor
 from pptx.enum.shapes import MSO_SHAPE_TYPE
 from io import BytesIO
 import os
+from app.templates import LEGACY_TEMPLATE_PATH, open_template, save_presentation
+from app.logger import get_logger, kv
+from app.metrics import timed, timed_fn
+from app.slides import THEMES_PER_SLIDE, chunk_themes, expand_theme_slides, theme_texts
+
+log = get_logger(__name__)
 
 # EMU conversions
 EMU_PER_INCH = 914400
@@ -88,10 +94,16 @@ def find_shape_by_id_recursive(slide, shape_id: int):
       return shp
   return None
 
-def replace_text_by_id(slide, shape_id, new_text,
-                       font_name="Calibri", font_size=20, font_color=(0, 0, 0),
-                       bold=None, italic=None):
-  shp = find_shape_by_id_recursive(slide, shape_id)
+def _index_shapes_by_id(slide):
+  # first match wins, like find_shape_by_id_recursive (IDs can repeat inside groups/clones)
+  by_id = {}
+  for _, shp in _iter_shapes_recursive(slide.shapes):
+    by_id.setdefault(shp.shape_id, shp)
+  return by_id
+
+def _replace_text(shp, shape_id, new_text,
+                  font_name="Calibri", font_size=20, font_color=(0, 0, 0),
+                  bold=None, italic=None):
   if shp is None:
     raise ValueError(f"No shape found with ID {shape_id} (check slide index and that IDs haven't changed)")
 
@@ -112,496 +124,76 @@ def replace_text_by_id(slide, shape_id, new_text,
   if italic is not None:
     run.font.italic = italic
 
-
-def full_replacement(stats, patient, education, competitive):
-  base_dir = os.path.dirname(os.path.abspath(__file__))
-  template_path = os.path.join(base_dir, "Acquis Template.pptx")
-  print('base_dir: '+ base_dir)
-  print('template_path: '+template_path)
-  prs = Presentation(template_path)
-  
-
-  # FILLERRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRR
-  # Patient Management Slide
-  pmslide = prs.slides[4]  # change if global search shows a different index
-  # Theme size:
-  supporting1 = str(len(patient[0]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=73,
-    new_text="Theme 1 (n="+supporting1+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  supporting2 = str(len(patient[1]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=74,
-    new_text="Theme 2 (n="+supporting2+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  supporting3 = str(len(patient[2]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=75,
-    new_text="Theme 3 (n="+supporting3+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # Main Theme Descriptions
-  theme1 = patient[0]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=60,
-    new_text=theme1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-  theme2 = patient[1]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=64,
-    new_text=theme2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-  theme3 = patient[2]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=65,
-    new_text=theme3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
-  # Quotation Gaps
-  gap1 = patient[0]["representative_quotes"]
-  formgap1 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap1])
-  replace_text_by_id(
-    pmslide,
-    shape_id=71,
-    new_text=formgap1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  gap2 = patient[1]["representative_quotes"]
-  formgap2 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap2])
-  replace_text_by_id(
-    pmslide,
-    shape_id=83,
-    new_text=formgap2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  # THE ONE BELOW NEEDS FORMATTING
-  gap3 = patient[2]["representative_quotes"]
-  formgap3 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap3])
-  replace_text_by_id(
-    pmslide,
-    shape_id=92,
-    new_text=formgap3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # Root Causes
-  root1 = "1: "+patient[0]["root_cause_questions"][0]+"\n"+"2: "+patient[0]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=79,
-    new_text=root1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  root2 = "1: "+patient[1]["root_cause_questions"][0]+"\n"+"2: "+patient[1]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=88,
-    new_text=root2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  root3 = "1: "+patient[2]["root_cause_questions"][0]+"\n"+"2: "+patient[2]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=97,
-    new_text=root3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # FILLERRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRR
-  # Education Slide
-  pmslide = prs.slides[5]  # change if global search shows a different index
-  # Theme size:
-  supporting1 = str(len(education[0]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=73,
-    new_text="Theme 1 (n="+supporting1+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  supporting2 = str(len(education[1]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=74,
-    new_text="Theme 2 (n="+supporting2+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  supporting3 = str(len(education[2]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=75,
-    new_text="Theme 3 (n="+supporting3+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # Main Theme Descriptions
-  theme1 = education[0]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=60,
-    new_text=theme1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-  theme2 = education[1]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=64,
-    new_text=theme2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-  theme3 = education[2]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=65,
-    new_text=theme3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
-  # Quotation Gaps
-  gap1 = education[0]["representative_quotes"]
-  formgap1 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap1])
-  replace_text_by_id(
-    pmslide,
-    shape_id=71,
-    new_text=formgap1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  gap2 = education[1]["representative_quotes"]
-  formgap2 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap2])
-  replace_text_by_id(
-    pmslide,
-    shape_id=83,
-    new_text=formgap2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  # THE ONE BELOW NEEDS FORMATTING
-  gap3 = education[2]["representative_quotes"]
-  formgap3 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap3])
-  replace_text_by_id(
-    pmslide,
-    shape_id=92,
-    new_text=formgap3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # Root Causes
-  root1 = "1: "+education[0]["root_cause_questions"][0]+"\n"+"2: "+education[0]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=79,
-    new_text=root1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  root2 = "1: "+education[1]["root_cause_questions"][0]+"\n"+"2: "+education[1]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=88,
-    new_text=root2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  root3 = "1: "+education[2]["root_cause_questions"][0]+"\n"+"2: "+education[2]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=97,
-    new_text=root3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # FILLERRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRR
-  # competition Slide
-  pmslide = prs.slides[6]  # change if global search shows a different index
-  # Theme size:
-  supporting1 = str(len(competitive[0]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=73,
-    new_text="Theme 1 (n="+supporting1+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  supporting2 = str(len(competitive[1]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=74,
-    new_text="Theme 2 (n="+supporting2+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  supporting3 = str(len(competitive[2]["other_sources"])+3)
-  replace_text_by_id(
-    pmslide,
-    shape_id=75,
-    new_text="Theme 3 (n="+supporting3+")",
-    font_name="Century Gothic Bold",  # family only
-    font_size=14,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # Main Theme Descriptions
-  theme1 = competitive[0]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=60,
-    new_text=theme1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-  theme2 = competitive[1]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=64,
-    new_text=theme2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-  theme3 = competitive[2]["gap_definition"]
-  replace_text_by_id(
-    pmslide,
-    shape_id=65,
-    new_text=theme3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
-  # Quotation Gaps
-  gap1 = competitive[0]["representative_quotes"]
-  formgap1 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap1])
-  replace_text_by_id(
-    pmslide,
-    shape_id=71,
-    new_text=formgap1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  gap2 = competitive[1]["representative_quotes"]
-  formgap2 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap2])
-  replace_text_by_id(
-    pmslide,
-    shape_id=83,
-    new_text=formgap2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  # THE ONE BELOW NEEDS FORMATTING
-  gap3 = competitive[2]["representative_quotes"]
-  formgap3 = "\n".join([f"id {q['id']}: '{q['quote']}'" for q in gap3])
-  replace_text_by_id(
-    pmslide,
-    shape_id=92,
-    new_text=formgap3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # Root Causes
-  root1 = "1: "+competitive[0]["root_cause_questions"][0]+"\n"+"2: "+competitive[0]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=79,
-    new_text=root1,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  root2 = "1: "+competitive[1]["root_cause_questions"][0]+"\n"+"2: "+competitive[1]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=88,
-    new_text=root2,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-  root3 = "1: "+competitive[2]["root_cause_questions"][0]+"\n"+"2: "+competitive[2]["root_cause_questions"][1]
-  replace_text_by_id(
-    pmslide,
-    shape_id=97,
-    new_text=root3,
-    font_name="Century Gothic",  # family only
-    font_size=9,
-    font_color=(48, 25, 52),
-    italic=False
-  )
-
-  # FILLERRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRRR
-  # Stats Slide
-  pmslide = prs.slides[3]
-  Dates = stats['Reporting_Dates']
-  replace_text_by_id(
-    pmslide,
-    shape_id=203,
-    new_text=Dates,
-    font_name="Century Gothic",  # family only
-    font_size=10,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
-  deployed = stats['deployedMSLS']
-  replace_text_by_id(
-    pmslide,
-    shape_id=238,
-    new_text=str(deployed),
-    font_name="Century Gothic",  # family only
-    font_size=10,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
+def replace_text_by_id(slide, shape_id, new_text,
+                       font_name="Calibri", font_size=20, font_color=(0, 0, 0),
+                       bold=None, italic=None):
+  _replace_text(find_shape_by_id_recursive(slide, shape_id), shape_id, new_text,
+                font_name=font_name, font_size=font_size, font_color=font_color, bold=bold, italic=italic)
+
+# ======================
+# Slide sections
+# ======================
+# Section slides in the legacy template
+STATS_SLIDE = 3
+THEME_SLIDES = {"patient": 4, "education": 5, "competitive": 6}
+
+# Per theme column: (title, gap definition, quotes, root causes) shape IDs.
+# Theme slides are cloned for every extra three themes (app.slides).
+THEME_SHAPES = [(73, 60, 71, 79), (74, 64, 83, 88), (75, 65, 92, 97)]
+
+TITLE_STYLE = dict(font_name="Century Gothic Bold", font_size=14, font_color=(48, 25, 52), italic=False)
+GAP_STYLE = dict(font_name="Century Gothic", font_size=9, font_color=(255, 255, 255), italic=False)
+BODY_STYLE = dict(font_name="Century Gothic", font_size=9, font_color=(48, 25, 52), italic=False)
+STATS_STYLE = dict(font_name="Century Gothic", font_size=10, font_color=(255, 255, 255), italic=False)
+
+def theme_section_edits(themes, first_number=1):
+  """
+  (shape_id, text, style) edits for one theme slide (three theme columns).
+  None entries blank their column.
+  """
+  edits = []
+  for i, (title_id, gap_id, quotes_id, roots_id) in enumerate(THEME_SHAPES):
+    texts = theme_texts(themes[i] if i < len(themes) else None, first_number + i)
+    edits.append((title_id, texts["title"], TITLE_STYLE))
+    edits.append((gap_id, texts["gap"], GAP_STYLE))
+    edits.append((quotes_id, texts["quotes"], BODY_STYLE))
+    edits.append((roots_id, texts["roots"], BODY_STYLE))
+  return edits
+
+def stats_section_edits(stats):
   hcpStats = 'Total: '+str(stats['totalInteractions']) +'\nAcademic Setting HCPs: '+str(stats['AcademicSettings'])+'\nCommunity Setting HCPs: '+str(stats['CommunitySettings'])
-  replace_text_by_id(
-    pmslide,
-    shape_id=276,
-    new_text=hcpStats,
-    font_name="Century Gothic",  # family only
-    font_size=10,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
-  insightCount = stats['InsightCount']
-  replace_text_by_id(
-    pmslide,
-    shape_id=27,
-    new_text=str(insightCount),
-    font_name="Century Gothic",  # family only
-    font_size=10,
-    font_color=(255, 255, 255),
-    italic=False
-  )
-
-  Congresses = "\n".join(stats['Congresses'])
-  replace_text_by_id(
-    pmslide,
-    shape_id=235,
-    new_text=Congresses,
-    font_name="Century Gothic",  # family only
-    font_size=10,
-    font_color=(255, 255, 255),
-    italic=False
-  )
+  return [
+    (203, stats['Reporting_Dates'], STATS_STYLE),
+    (238, str(stats['deployedMSLS']), STATS_STYLE),
+    (276, hcpStats, STATS_STYLE),
+    (27, str(stats['InsightCount']), STATS_STYLE),
+    (235, "\n".join(stats['Congresses']), STATS_STYLE),
+  ]
+
+def apply_section(slide, edits):
+  """
+  Applies edits to one slide; only that slide's XML is touched.
+  """
+  shapes = _index_shapes_by_id(slide)
+  for shape_id, text, style in edits:
+    _replace_text(shapes.get(shape_id), shape_id, text, **style)
 
+def insert_stats_images(prs, stats):
   # Image Processing
   insert_image_fit_units(
     prs,
-    slide_idx=3,
+    slide_idx=STATS_SLIDE,
     image_bytes=stats['graph1'],
     box_w=6,
     box_h=4,           # size of the bounding box
-    pos_x=3.65, 
+    pos_x=3.65,
     pos_y=2,           # top-left position of the box
     units="in"       # 'in', 'cm', 'pt', or 'px'
   )
 
   insert_image_fit_units(
     prs,
-    slide_idx=3,
+    slide_idx=STATS_SLIDE,
     image_bytes=stats['graph2'],
     box_w=6,
     box_h=4,           # size of the bounding box
@@ -610,7 +202,31 @@ def full_replacement(stats, patient, education, competitive):
     units="in"       # 'in', 'cm', 'pt', or 'px'
   )
 
+@timed_fn("full_replacement")
+def full_replacement(stats, patient, education, competitive):
+  template_path = LEGACY_TEMPLATE_PATH
+  log.debug("loading template", extra=kv(template_path=template_path))
+  with timed("template_load"):
+    prs = open_template(template_path)
+
+  # resolve slides up front: the slide list and package are shared state
+  slides = prs.slides
+  jobs = [(slides[STATS_SLIDE], stats_section_edits(stats))]
+  prototypes = [(slides[THEME_SLIDES[name]], themes) for name, themes in
+                (("patient", patient), ("education", education), ("competitive", competitive))]
+  # one slide per three themes: clone each prototype before any text is written
+  with timed("clone_slides"):
+    for proto, themes in prototypes:
+      chunks = chunk_themes(themes)
+      for n, (slide, chunk) in enumerate(zip(expand_theme_slides(prs, proto, len(themes)), chunks)):
+        jobs.append((slide, theme_section_edits(chunk, first_number=n * THEMES_PER_SLIDE + 1)))
+
+  with timed("fill_sections"):
+    for slide, edits in jobs:
+      apply_section(slide, edits)
+
+  insert_stats_images(prs, stats)
+
   # prs.save("out.pptx")
-  buf = BytesIO()
-  prs.save(buf)
-  return buf.getvalue()
\ No newline at end of file
+  with timed("prs_save"):
+    return save_presentation(prs)
@@ -0,0 +1,229 @@
+"""
+Local TF-IDF + k-means pre-clustering of insight buckets before prompting.
+
+Large product buckets are not sent to the LLM row by row. Each insight text
+becomes an L2-normalized TF-IDF vector (sublinear tf, smoothed idf, terms
+in at least two texts), stored as flat CSR arrays. Spherical k-means
+(cosine similarity, k-means++ seeding) is fitted on a fixed-size sample and
+then assigns every row once, so the cost grows linearly with the bucket.
+The LLM can then receive one summary per cluster instead of the rows: size,
+top terms, the exemplar rows closest to the centroid, and a capped list of
+the other IDs. A theme backed by a whole cluster lists the cluster label in
+other_sources; expand_cluster_sources() swaps it for every member ID.
+"""
+import math
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.data_analytics.dedupe import DUPLICATE_COUNT_KEY
+from app.data_analytics.insight_store import TEXT_COL, tokenize
+from app.metrics import timed, timed_fn
+
+# buckets with more rows than this get cluster summaries; "0" disables them
+PRECLUSTER_MIN_ROWS = int(os.environ.get("PRECLUSTER_MIN_ROWS", "200"))
+PRECLUSTER_MAX_CLUSTERS = int(os.environ.get("PRECLUSTER_MAX_CLUSTERS", "24"))
+PRECLUSTER_EXEMPLARS = int(os.environ.get("PRECLUSTER_EXEMPLARS", "3"))
+# rows k-means is fitted on; the rest are only assigned
+PRECLUSTER_SAMPLE = int(os.environ.get("PRECLUSTER_SAMPLE", "5000"))
+
+# IDs listed per cluster summary (the total is always reported)
+CLUSTER_ID_LIMIT = 50
+TOP_TERMS = 8
+MIN_DF = 2
+_MAX_ITER = 30
+_SEED = 0x5EED
+# non-zeros multiplied per block in _sparse_dot, to bound memory
+_BLOCK = 1 << 18
+
+_STOPWORDS = frozenset("""
+a about after all also an and any are as at be been but by can could did do does for from had has have he her his
+how i if in into is it its may more most no not of on or our she should so some such than that the their them then
+there these they this those to was we were what when which who will with would you
+""".split())
+
+def tfidf(texts: List[Any]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, List[str]]:
+  """
+  (indptr, indices, values, terms): one L2-normalized TF-IDF row per text in
+  CSR form. Rows without an indexed term are empty.
+  """
+  vocab: Dict[str, int] = {}
+  indptr = [0]
+  indices: List[int] = []
+  counts: List[int] = []
+  for t in texts:
+    tf: Dict[int, int] = {}
+    for tok in tokenize(t):
+      if tok not in _STOPWORDS and not tok.isdigit():
+        j = vocab.setdefault(tok, len(vocab))
+        tf[j] = tf.get(j, 0) + 1
+    indices.extend(tf)
+    counts.extend(tf.values())
+    indptr.append(len(indices))
+  n = len(texts)
+  indptr_a = np.asarray(indptr, dtype=np.int64)
+  indices_a = np.asarray(indices, dtype=np.int64)
+  df = np.bincount(indices_a, minlength=len(vocab))
+  keep = df >= min(MIN_DF, n)
+  # renumber the kept terms and drop the others' entries
+  new_id = np.cumsum(keep) - 1
+  kept = keep[indices_a]
+  row = np.repeat(np.arange(n), np.diff(indptr_a))[kept]
+  indices_a = new_id[indices_a[kept]]
+  idf = np.log((1 + n) / (1 + df[keep])) + 1
+  values = (1 + np.log(np.asarray(counts, dtype=np.float64)[kept])) * idf[indices_a]
+  norms = np.sqrt(np.bincount(row, weights=values * values, minlength=n))
+  values /= norms[row]
+  indptr_a = np.concatenate([[0], np.cumsum(np.bincount(row, minlength=n))])
+  names = list(vocab)
+  terms = [names[j] for j in np.flatnonzero(keep)]
+  return indptr_a, indices_a, values, terms
+
+def _sparse_dot(indptr: np.ndarray, indices: np.ndarray, values: np.ndarray, dense: np.ndarray) -> np.ndarray:
+  """
+  (n_rows, k) = CSR rows @ dense.T for a (k, n_terms) dense matrix, in
+  row-aligned blocks of about _BLOCK non-zeros.
+  """
+  n = len(indptr) - 1
+  out = np.zeros((n, dense.shape[0]))
+  dense_t = np.ascontiguousarray(dense.T)
+  lo = 0
+  while lo < n:
+    hi = max(int(np.searchsorted(indptr, indptr[lo] + _BLOCK, side="right")) - 1, lo + 1)
+    a, b = indptr[lo], indptr[hi]
+    if b > a:
+      row = np.repeat(np.arange(hi - lo), np.diff(indptr[lo:hi + 1]))
+      contrib = values[a:b, None] * dense_t[indices[a:b]]
+      for j in range(dense.shape[0]):
+        out[lo:hi, j] = np.bincount(row, weights=contrib[:, j], minlength=hi - lo)
+    lo = hi
+  return out
+
+def _centroids(indptr, indices, values, labels, weights, k, n_terms) -> np.ndarray:
+  row = np.repeat(labels, np.diff(indptr))
+  flat = np.bincount(row * n_terms + indices, weights=values * np.repeat(weights, np.diff(indptr)), minlength=k * n_terms)
+  centers = flat.reshape(k, n_terms)
+  norms = np.linalg.norm(centers, axis=1)
+  centers[norms > 0] /= norms[norms > 0, None]
+  return centers
+
+def _dense_rows(indptr, indices, values, rows, n_terms) -> np.ndarray:
+  out = np.zeros((len(rows), n_terms))
+  for i, r in enumerate(rows):
+    out[i, indices[indptr[r]:indptr[r + 1]]] = values[indptr[r]:indptr[r + 1]]
+  return out
+
+def kmeans(indptr: np.ndarray, indices: np.ndarray, values: np.ndarray, n_terms: int, k: int,
+           weights: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+  """
+  Spherical k-means over CSR rows (all non-empty); returns (k, n_terms)
+  unit centroids. Seeded k-means++, stops once assignments are stable.
+  """
+  n = len(indptr) - 1
+  first = int(rng.integers(n))
+  centers = _dense_rows(indptr, indices, values, [first], n_terms)
+  best = _sparse_dot(indptr, indices, values, centers)[:, 0]
+  while len(centers) < k:
+    dist = np.clip(1 - best, 0, None) ** 2 * weights
+    if dist.sum() <= 0:
+      break
+    pick = int(rng.choice(n, p=dist / dist.sum()))
+    c = _dense_rows(indptr, indices, values, [pick], n_terms)
+    centers = np.vstack([centers, c])
+    best = np.maximum(best, _sparse_dot(indptr, indices, values, c)[:, 0])
+  labels = None
+  for _ in range(_MAX_ITER):
+    sims = _sparse_dot(indptr, indices, values, centers)
+    new = sims.argmax(axis=1)
+    if labels is not None and np.array_equal(new, labels):
+      break
+    labels = new
+    centers = _centroids(indptr, indices, values, labels, weights, len(centers), n_terms)
+    # an emptied cluster restarts from the row its centroid fits worst
+    for j in np.flatnonzero(~centers.any(axis=1)):
+      worst = int(sims[np.arange(n), labels].argmin())
+      centers[j] = _dense_rows(indptr, indices, values, [worst], n_terms)[0]
+  return centers
+
+def _subset(indptr, indices, values, rows) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+  lengths = indptr[rows + 1] - indptr[rows]
+  take = np.concatenate([np.arange(indptr[r], indptr[r + 1]) for r in rows]) if len(rows) else np.zeros(0, dtype=np.int64)
+  return np.concatenate([[0], np.cumsum(lengths)]), indices[take], values[take]
+
+def n_clusters(n: int) -> int:
+  return max(2, min(PRECLUSTER_MAX_CLUSTERS, round(math.sqrt(n / 2))))
+
+@timed_fn("precluster_rows")
+def precluster_rows(rows: List[Dict[str, Any]], label: str = "cluster", text_key: str = TEXT_COL) -> Tuple[List[Dict[str, Any]], Dict[str, List[Any]]]:
+  """
+  Cluster summaries for one bucket, largest first, plus every cluster's full
+  member ID list. Summary "insight_count" includes rows collapsed into
+  near-duplicate representatives. Rows with no indexed term form their own
+  cluster.
+  """
+  n = len(rows)
+  with timed("precluster_tfidf"):
+    indptr, indices, values, terms = tfidf([r.get(text_key) for r in rows])
+  weights = np.asarray([r.get(DUPLICATE_COUNT_KEY) or 1 for r in rows], dtype=np.float64)
+  nonempty = np.flatnonzero(np.diff(indptr) > 0)
+  rng = np.random.default_rng(_SEED)
+  labels = np.full(n, -1, dtype=np.int64)
+  sim = np.zeros(n)
+  centers = np.zeros((0, len(terms)))
+  if len(nonempty) >= 2:
+    with timed("precluster_kmeans"):
+      sample = np.sort(rng.choice(nonempty, size=min(PRECLUSTER_SAMPLE, len(nonempty)), replace=False))
+      centers = kmeans(*_subset(indptr, indices, values, sample), len(terms), min(n_clusters(n), len(sample)), weights[sample], rng)
+      sims = _sparse_dot(indptr, indices, values, centers)
+      labels[nonempty] = sims[nonempty].argmax(axis=1)
+      sim[nonempty] = sims[nonempty, labels[nonempty]]
+  elif len(nonempty):
+    labels[nonempty] = 0
+    centers = _dense_rows(indptr, indices, values, nonempty, len(terms))
+
+  groups = [np.flatnonzero(labels == j) for j in range(len(centers))] + [np.flatnonzero(labels < 0)]
+  groups = [g for g in groups if len(g)]
+  # largest first; ties keep the cluster whose first row comes earlier
+  groups.sort(key=lambda g: (-weights[g].sum(), g[0]))
+  summaries, members = [], {}
+  for c, g in enumerate(groups, start=1):
+    name = f"{label}-{c}"
+    j = labels[g[0]]
+    top = [terms[t] for t in np.argsort(-centers[j], kind="stable")[:TOP_TERMS] if centers[j, t] > 0] if j >= 0 else []
+    ranked = g[np.argsort(-sim[g], kind="stable")]
+    exemplars = [dict(rows[i]) for i in ranked[:PRECLUSTER_EXEMPLARS]]
+    shown = {str(r.get("ID")) for r in exemplars}
+    ids = list(dict.fromkeys(rows[i].get("ID") for i in g))
+    others = [i for i in ids if str(i) not in shown]
+    members[name] = ids
+    summaries.append({
+      "cluster": name,
+      "insight_count": int(weights[g].sum()),
+      "top_terms": top,
+      "exemplars": exemplars,
+      "other_ids": others[:CLUSTER_ID_LIMIT],
+      "other_ids_total": len(others),
+    })
+  return summaries, members
+
+def expand_cluster_sources(theme: Dict[str, Any], clusters: Optional[Dict[str, List[Any]]]) -> Dict[str, Any]:
+  """
+  Copy of an LLM theme whose other_sources cluster labels ("Kymriah-3") are
+  replaced by the cluster's member IDs (minus IDs the theme already cites).
+  """
+  if not clusters:
+    return theme
+  sources = list(theme.get("other_sources") or [])
+  seen = {str(q.get("id")) for q in theme.get("representative_quotes") or []}
+  seen.update(str(s) for s in sources if str(s) not in clusters)
+  out = []
+  for s in sources:
+    if str(s) not in clusters:
+      out.append(s)
+      continue
+    for member in clusters[str(s)]:
+      if str(member) not in seen:
+        seen.add(str(member))
+        out.append(member)
+  return {**theme, "other_sources": out}
@@ -0,0 +1,190 @@
+"""
+Local time series of per-quarter aggregates, for reporting-cycle comparisons.
+
+When a deck is generated from raw rows with an explicit "series" (a team's
+product/territory cut), the rows are split by report quarter and each
+quarter's aggregates (interactions, insights, category and tier mix,
+practice settings, congresses) are upserted under (series, quarter). Only
+quarters lying entirely inside the deck's reporting_window are recorded: a
+quarter the window only touches holds a partial cut and would replace the
+full one. Quarter-over-quarter deltas are read from these compact rows; old
+raw CRM rows never have to be re-sent.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.logger import get_logger, kv
+
+DEFAULT_PATH = os.environ.get("TREND_STORE_PATH", "trend_store.sqlite3")
+# "0" stops decks from recording trend points
+TREND_RECORDING = os.environ.get("TREND_RECORDING", "1") != "0"
+
+log = get_logger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS periods (
+  series TEXT NOT NULL,
+  period TEXT NOT NULL,
+  updated_at INTEGER NOT NULL,
+  interactions INTEGER NOT NULL,
+  insights INTEGER NOT NULL,
+  aggregates TEXT NOT NULL,
+  PRIMARY KEY (series, period)
+) WITHOUT ROWID;
+"""
+
+# compute_metrics keys kept per period (the mixes) -> stored name
+_MIXES = {
+  "category_counts": "categories",
+  "kol_tier_counts": "tiers",
+  "practice_counts": "settings",
+}
+
+def previous_quarter(period: str) -> str:
+  year, q = int(period[:4]), int(period[-1])
+  return f"{year - 1}-Q4" if q == 1 else f"{year}-Q{q - 1}"
+
+def _shares(counts: Dict[str, int]) -> Dict[str, float]:
+  total = sum(counts.values())
+  return {k: v / total for k, v in counts.items()} if total else {}
+
+def _pct(new: int, old: int) -> Optional[float]:
+  return round(100.0 * (new - old) / old, 2) if old else None
+
+def _mix_delta(new: Dict[str, int], old: Dict[str, int]) -> Dict[str, Dict[str, Any]]:
+  """
+  Per key: count change and share change in percentage points.
+  """
+  new_s, old_s = _shares(new), _shares(old)
+  return {
+    k: {
+      "count": new.get(k, 0) - old.get(k, 0),
+      "share_pp": round(100.0 * (new_s.get(k, 0.0) - old_s.get(k, 0.0)), 2),
+    }
+    for k in sorted(set(new) | set(old))
+  }
+
+def period_delta(cur: Dict[str, Any], prev: Dict[str, Any]) -> Dict[str, Any]:
+  """
+  Change from `prev` to `cur` (two stored periods).
+  """
+  prev_congresses, cur_congresses = set(prev["congresses"]), set(cur["congresses"])
+  return {
+    "from": prev["period"],
+    "interactions": cur["interactions"] - prev["interactions"],
+    "interactions_pct": _pct(cur["interactions"], prev["interactions"]),
+    "insights": cur["insights"] - prev["insights"],
+    "insights_pct": _pct(cur["insights"], prev["insights"]),
+    **{name: _mix_delta(cur[name], prev[name]) for name in _MIXES.values()},
+    "congresses_added": sorted(cur_congresses - prev_congresses),
+    "congresses_dropped": sorted(prev_congresses - cur_congresses),
+  }
+
+class TrendStore:
+  """
+  SQLite table of per-(series, quarter) aggregates.
+  """
+  def __init__(self, path: str = DEFAULT_PATH):
+    self.path = path
+    self._lock = threading.Lock()
+    self._conn = sqlite3.connect(path, check_same_thread=False)
+    self._conn.execute("PRAGMA journal_mode=WAL")
+    self._conn.executescript(_SCHEMA)
+
+  def upsert(self, series: str, by_period: Dict[str, Dict[str, Any]]) -> int:
+    """
+    Stores compute_metrics-shaped aggregates per quarter ("2025-Q2"),
+    replacing what was stored for those quarters of `series`.
+    """
+    now = int(time.time())
+    records = []
+    for period, m in by_period.items():
+      aggregates = {name: m.get(key, {}) for key, name in _MIXES.items()}
+      aggregates["congresses"] = list(m.get("congresses", []))
+      aggregates["msls"] = len(m.get("msls", []))
+      records.append((series, period, now, m.get("n_interactions", 0), m.get("insight_count", 0), json.dumps(aggregates, sort_keys=True)))
+    with self._lock, self._conn:
+      self._conn.executemany(
+        "INSERT INTO periods (series, period, updated_at, interactions, insights, aggregates) VALUES (?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(series, period) DO UPDATE SET updated_at = excluded.updated_at, "
+        "interactions = excluded.interactions, insights = excluded.insights, aggregates = excluded.aggregates",
+        records,
+      )
+    return len(records)
+
+  def periods(self, series: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Stored quarters of `series` in order ("YYYY-Qn" sorts chronologically),
+    optionally limited to [start, end].
+    """
+    sql = "SELECT period, updated_at, interactions, insights, aggregates FROM periods WHERE series = ?"
+    args: List[Any] = [series]
+    if start:
+      sql += " AND period >= ?"
+      args.append(start)
+    if end:
+      sql += " AND period <= ?"
+      args.append(end)
+    with self._lock:
+      cur = self._conn.execute(sql + " ORDER BY period", args)
+      rows = cur.fetchall()
+    return [
+      {"period": p, "updated_at": ts, "interactions": n_int, "insights": n_ins, **json.loads(agg)}
+      for p, ts, n_int, n_ins, agg in rows
+    ]
+
+  def trends(self, series: str, start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    periods() with a quarter-over-quarter "delta" on each period whose
+    previous calendar quarter is stored (None otherwise).
+    """
+    lo = previous_quarter(start) if start else None
+    stored = self.periods(series, lo, end)
+    by_period = {p["period"]: p for p in stored}
+    out = []
+    for p in stored:
+      if start and p["period"] < start:
+        continue
+      prev = by_period.get(previous_quarter(p["period"]))
+      out.append({**p, "delta": period_delta(p, prev) if prev else None})
+    return out
+
+  def series(self) -> List[str]:
+    with self._lock:
+      return [s for (s,) in self._conn.execute("SELECT DISTINCT series FROM periods ORDER BY series")]
+
+  def delete_series(self, series: str) -> int:
+    with self._lock, self._conn:
+      return self._conn.execute("DELETE FROM periods WHERE series = ?", (series,)).rowcount
+
+_STORE: Optional[TrendStore] = None
+_STORE_LOCK = threading.Lock()
+# one writer thread: recording never delays the deck and upserts stay ordered
+_RECORDER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="trend-recorder")
+
+def get_trend_store() -> TrendStore:
+  global _STORE
+  with _STORE_LOCK:
+    if _STORE is None:
+      _STORE = TrendStore()
+    return _STORE
+
+def _record(series: str, compute) -> None:
+  try:
+    by_period = compute()
+    n = get_trend_store().upsert(series, by_period)
+    log.info("trend periods recorded", extra=kv(series=series, periods=n))
+  except Exception:
+    log.exception("trend recording failed", extra=kv(series=series))
+
+def record_async(series: str, compute):
+  """
+  Runs `compute` (-> {quarter: metrics}) and upserts the result on the
+  recorder thread.
+  """
+  return _RECORDER.submit(_record, series, compute)
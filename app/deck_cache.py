@@ -0,0 +1,207 @@
+"""
+Content-addressed on-disk cache of rendered decks.
+
+The key is a sha256 over the canonical JSON of everything the renderer reads
+plus the template version, so an identical request maps to the same file and
+editing the template invalidates every entry. Files are evicted least recently
+used first once the directory exceeds DECK_CACHE_MAX_BYTES.
+
+Decks are saved deterministically (app.templates.save_presentation), so the
+strong ETag, a hash of the deck bytes, is stable across re-renders.
+
+get()/put() hand out a private hard link (a copy where links aren't
+supported) made under the cache lock; eviction only unlinks the cache's own
+name, so a deck being served can't disappear mid-response. The caller
+removes the link once it has been sent.
+
+  DECK_CACHE_DIR        default <tmp>/msl-deck-cache
+  DECK_CACHE_MAX_BYTES  default 512 MiB (0 disables the cache)
+  DECK_BUILD_ID         deploy/build id (e.g. the git sha) salted into every key
+
+Keys also include RENDERER_VERSION, so decks cached by older rendering code
+are never served after a deploy that changes it.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import uuid
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from app.metrics import register_gauge
+from app.templates import template_version
+
+DECK_CACHE_DIR = os.environ.get("DECK_CACHE_DIR", os.path.join(tempfile.gettempdir(), "msl-deck-cache"))
+DECK_CACHE_MAX_BYTES = int(os.environ.get("DECK_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+DECK_BUILD_ID = os.environ.get("DECK_BUILD_ID", "")
+# bump whenever the deck renderers, slide filling or chart drawing change output
+RENDERER_VERSION = "2"
+
+_SUFFIX = ".pptx"
+# per-response links handed out by get()/put()
+_SERVE_SUFFIX = ".serve"
+
+def canonical_json(value: Any) -> bytes:
+  """
+  Key order and whitespace independent serialization.
+  """
+  return json.dumps(value, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+def deck_key(renderer: str, template_path: str, inputs: Any) -> str:
+  h = hashlib.sha256()
+  h.update(f"{RENDERER_VERSION}\0{DECK_BUILD_ID}\0{renderer}".encode())
+  h.update(b"\0")
+  h.update(template_version(template_path).encode())
+  h.update(b"\0")
+  h.update(canonical_json(inputs))
+  return h.hexdigest()
+
+class DeckCache:
+  def __init__(self, root: str = DECK_CACHE_DIR, max_bytes: int = DECK_CACHE_MAX_BYTES):
+    self.root = root
+    self.max_bytes = max_bytes
+    self._lock = threading.Lock()
+    # key -> size, least recently used first
+    self._entries: "OrderedDict[str, int]" = OrderedDict()
+    self._bytes = 0
+    # key -> strong ETag of the file, filled on put or on first lookup
+    self._etags: Dict[str, str] = {}
+    self.hits = self.misses = self.evictions = 0
+    os.makedirs(root, exist_ok=True)
+    self._load()
+
+  def _load(self) -> None:
+    found = []
+    for name in os.listdir(self.root):
+      if name.endswith((_SERVE_SUFFIX, ".tmp")):
+        # left behind by a response interrupted before its cleanup ran, or a crashed put()
+        try:
+          os.remove(os.path.join(self.root, name))
+        except OSError:
+          pass
+      elif name.endswith(_SUFFIX):
+        st = os.stat(os.path.join(self.root, name))
+        # recency lives in atime; mtime stays the render time (served as Last-Modified)
+        found.append((st.st_atime, name[:-len(_SUFFIX)], st.st_size))
+    for _, key, size in sorted(found):
+      self._entries[key] = size
+      self._bytes += size
+
+  def path(self, key: str) -> str:
+    return os.path.join(self.root, key + _SUFFIX)
+
+  def _checkout(self, key: str) -> Optional[str]:
+    # caller holds the lock, so no eviction can unlink the entry meanwhile
+    src = self.path(key)
+    dst = f"{src}.{uuid.uuid4().hex}{_SERVE_SUFFIX}"
+    try:
+      try:
+        os.link(src, dst)
+      except OSError:
+        shutil.copyfile(src, dst)
+    except OSError:
+      return None
+    return dst
+
+  def get(self, key: str) -> Optional[str]:
+    """
+    Path of a private link to the cached deck (the caller removes it), or
+    None. Marks the entry most recently used.
+    """
+    with self._lock:
+      served = self._checkout(key) if key in self._entries else None
+      if served is None:
+        if key in self._entries:
+          self._bytes -= self._entries.pop(key)
+          self._etags.pop(key, None)
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+    try:
+      os.utime(self.path(key), (time.time(), os.stat(served).st_mtime))
+    except OSError:
+      pass
+    return served
+
+  def etag(self, key: str, path: Optional[str] = None) -> Optional[str]:
+    """
+    Strong ETag of a cached deck (hash of its bytes), or None if not cached.
+    `path` (a link from get()) is hashed when the tag isn't known yet.
+    """
+    with self._lock:
+      tag = self._etags.get(key)
+    if tag is not None:
+      return tag
+    try:
+      with open(path or self.path(key), "rb") as f:
+        tag = content_etag(f.read())
+    except OSError:
+      return None
+    with self._lock:
+      if key in self._entries:
+        self._etags[key] = tag
+    return tag
+
+  def put(self, key: str, data: bytes) -> Optional[str]:
+    """
+    Stores a rendered deck; returns a private link to it as get() does, or
+    None when the cache is disabled.
+    """
+    if self.max_bytes <= 0:
+      return None
+    path = self.path(key)
+    tmp = f"{path}.{threading.get_ident()}.tmp"
+    with open(tmp, "wb") as f:
+      f.write(data)
+    os.replace(tmp, path)
+    with self._lock:
+      self._bytes += len(data) - self._entries.pop(key, 0)
+      self._entries[key] = len(data)
+      self._etags[key] = content_etag(data)
+      while self._bytes > self.max_bytes and len(self._entries) > 1:
+        old, size = self._entries.popitem(last=False)
+        self._bytes -= size
+        self._etags.pop(old, None)
+        self.evictions += 1
+        try:
+          os.remove(self.path(old))
+        except OSError:
+          pass
+      return self._checkout(key)
+
+  def stats(self) -> dict:
+    with self._lock:
+      return {"entries": len(self._entries), "bytes": self._bytes, "hits": self.hits,
+              "misses": self.misses, "evictions": self.evictions}
+
+def content_etag(data: bytes) -> str:
+  return '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+  if not if_none_match:
+    return False
+  tags = [t.strip() for t in if_none_match.split(",")]
+  return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+_CACHE: Optional[DeckCache] = None
+_CACHE_LOCK = threading.Lock()
+
+def get_deck_cache() -> DeckCache:
+  global _CACHE
+  with _CACHE_LOCK:
+    if _CACHE is None:
+      _CACHE = DeckCache()
+    return _CACHE
+
+def _gauge_values():
+  if _CACHE is None:
+    return {}
+  s = _CACHE.stats()
+  return {(k,): v for k, v in s.items()}
+
+register_gauge("msl_deck_cache", "Rendered deck cache entries, bytes, hits, misses and evictions.", ("stat",), _gauge_values)
@@ -1,31 +1,21 @@
 import json
 import io
+import logging
 import base64
+import threading
+from functools import lru_cache
 import numpy as np
-import matplotlib
-matplotlib.use("Agg")
-import matplotlib.pyplot as plt
 from app.data_analytics.congresses import list_unique_congresses
 from app.data_analytics.hcp_interactions import count_unique_interactions
 from app.data_analytics.icategories import pie_insight_category_counts, kol_tier_counts_pretty
 from app.data_analytics.psetting import pie_practice_setting_by_interaction
 from app.data_analytics.unique_msls import list_unique_msls
-from app.data_analytics.dates import get_date_range
-import traceback
-print("[demosite] importing congresses...")
-
-try:
-	import app.data_analytics.congresses as _c
-	print("[demosite] congresses.__file__:", getattr(_c, "__file__", None))
-	print("[demosite] has list_unique_congresses?:", hasattr(_c, "list_unique_congresses"))
-	print("[demosite] dir sample:", [n for n in dir(_c) if "congress" in n.lower() or "list" in n.lower()])
-	# keep this line last; it will still raise if the symbol truly isn't there
-	from app.data_analytics.congresses import list_unique_congresses
-	print("[demosite] direct import succeeded")
-except Exception as e:
-	print("[demosite] import failed:", repr(e))
-	traceback.print_exc()
-	raise
+from app.data_analytics.dates import DateIndex, filter_rows_by_window
+from app.data_analytics.metrics_store import get_metrics_store
+from app.logger import get_logger, kv
+from app.metrics import timed, timed_fn, register_lru_cache
+
+log = get_logger(__name__)
 
 def _extract_rows(content):
   """
@@ -111,6 +101,18 @@ def _png_b64(png_bytes: bytes) -> str:
 	"""
 	return base64.b64encode(png_bytes).decode("utf-8")
 
+_PYPLOT_LOCK = threading.Lock()
+
+def _pyplot():
+  # matplotlib is only needed when a chart is actually drawn; keep it off the import path.
+  # Locked so a request and the warm-up thread never see a half-imported pyplot.
+  with _PYPLOT_LOCK:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+  return plt
+
+@timed_fn("create_pie_chart")
 def _create_pie_chart(data: dict[str, int]) -> bytes:
   """
   Create a pie chart (PNG bytes) with:
@@ -141,6 +143,7 @@ def _create_pie_chart(data: dict[str, int]) -> bytes:
   # Threshold below which labels go outside (as a % of total)
   OUTSIDE_THRESHOLD = 6.0  # percent
 
+  plt = _pyplot()
   fig, ax = plt.subplots(figsize=(5.5, 4))
 
   # Draw pie without labels (legend will handle labels)
@@ -202,45 +205,87 @@ def _create_pie_chart(data: dict[str, int]) -> bytes:
   plt.close(fig)
   return buf.getvalue()
 
-def data_preprocess(data):
-  # unwrap to rows
-  content = data.get("content", data)
-  rows = _extract_rows(content)
-  _normalize_fields_inplace(rows)
-
+def compute_metrics(rows):
+  """
+  All deck metrics for already-normalized rows, without rendering charts.
+  """
   # --- Extracted metrics ---
 
   # Pie chart: practice setting (by unique interaction/ID)
-  practice_counts = pie_practice_setting_by_interaction(rows)
-  print("Practice setting counts:", practice_counts)
+  with timed("pie_practice_setting_by_interaction"):
+    practice_counts = pie_practice_setting_by_interaction(rows)
 
   # Pie chart: insight categories (raw category-hits, overlaps allowed)
-  category_counts = pie_insight_category_counts(rows)
-  print("Insight category counts:", category_counts)
+  with timed("pie_insight_category_counts"):
+    category_counts = pie_insight_category_counts(rows)
 
   # Pie chart: Counts different KOL Tiers
-  kol_tier_counts = kol_tier_counts_pretty(rows)
-  print("KOL Tier counts:", kol_tier_counts)
+  with timed("kol_tier_counts_pretty"):
+    kol_tier_counts = kol_tier_counts_pretty(rows)
 
   # List of congresses
-  congresses = list_unique_congresses(rows)
-  print("Unique congresses:", congresses)
+  with timed("list_unique_congresses"):
+    congresses = list_unique_congresses(rows)
 
   # Number of interactions
-  n_interactions = count_unique_interactions(rows)
-  print("Number of interactions:", n_interactions)
+  with timed("count_unique_interactions"):
+    n_interactions = count_unique_interactions(rows)
 
   # Unique MSLs
-  msls = list_unique_msls(rows)
-  print("Unique MSLs:", msls)
+  with timed("list_unique_msls"):
+    msls = list_unique_msls(rows)
 
   # Dates
-  dates = get_date_range(rows)
-  print("Date Range: ", dates)
+  with timed("date_index"):
+    date_index = DateIndex(rows)
+    dates = date_index.range_label()
+    monthly_interactions = date_index.monthly_interactions()
+
+  log.info("metrics computed", extra=kv(
+    rows=len(rows), n_interactions=n_interactions, msls=len(msls), congresses=len(congresses),
+    categories=len(category_counts), dates=dates,
+  ))
+  if log.isEnabledFor(logging.DEBUG):
+    log.debug("metrics detail", extra=kv(
+      practice_counts=practice_counts, category_counts=category_counts,
+      kol_tier_counts=kol_tier_counts, congresses=congresses, msls=msls,
+    ))
+
+  return {
+    "practice_counts": practice_counts,
+    "category_counts": category_counts,
+    "kol_tier_counts": kol_tier_counts,
+    "congresses": congresses,
+    "n_interactions": n_interactions,
+    "msls": msls,
+    "insight_count": len(rows),
+    "dates": dates,
+    "monthly_interactions": monthly_interactions
+  }
 
+# Chart name -> metric it plots (same pairing as the deck's graph1/graph2)
+CHART_SOURCES = {
+  "category": "kol_tier_counts",
+  "practice": "practice_counts",
+}
+
+@lru_cache(maxsize=64)
+def _pie_chart_cached(items: tuple) -> bytes:
+  return _create_pie_chart(dict(items))
+
+register_lru_cache("pie_chart", _pie_chart_cached)
+
+def render_chart(metrics, kind: str) -> bytes:
+  """
+  PNG for one chart in CHART_SOURCES. Identical counts reuse the last render,
+  so polling dashboards don't redraw unchanged pies.
+  """
+  return _pie_chart_cached(tuple(metrics[CHART_SOURCES[kind]].items()))
+
+def _with_charts(metrics):
   # --- Build PNG pies (raw counts) ---
-  practice_pie_png = _create_pie_chart(practice_counts)
-  category_pie_png = _create_pie_chart(kol_tier_counts)
+  practice_pie_png = render_chart(metrics, "practice")
+  category_pie_png = render_chart(metrics, "category")
 
   # # Base64 for n8n (JSON-safe)
   # practice_pie_b64 = _png_b64(practice_pie_png)
@@ -248,30 +293,157 @@ def data_preprocess(data):
 
   # Return payload for n8n
   return {
-    "practice_counts": practice_counts,
-    "category_counts": category_counts,
-    "congresses": congresses,
-    "n_interactions": n_interactions,
-    "msls": msls,
+    **metrics,
     "practice_pie_png_b64": practice_pie_png,
     "category_pie_png_b64": category_pie_png,
-    "insight_count": len(rows),
     "_meta": {
       "practice_pie_title": "HCP Practice Setting",
       "category_pie_title": "Insight Categories",
       "images_format": "png",
       "images_encoding": "base64"
-    },
-    "dates": dates
+    }
   }
 
-def second_process(data):
+def extract_normalized_rows(data):
+  # unwrap to rows
+  content = data.get("content", data)
+  with timed("extract_rows"):
+    rows = _extract_rows(content)
+    _normalize_fields_inplace(rows)
+  return rows
+
+def preprocess_rows(data):
+  rows = extract_normalized_rows(data)
+
+  # Optional reporting period: {"reporting_window": {"start": "1/1/2025", "end": "3/31/2025"}}
+  window = data.get("reporting_window") if isinstance(data, dict) else None
+  if isinstance(window, dict):
+    rows = filter_rows_by_window(rows, window.get("start"), window.get("end"))
+  return rows
+
+def columnar_input(data):
+  """
+  (body, kind) for a table sent inline instead of rows:
+  {"columnar": {"format": "parquet" | "arrow", "data": "<base64>"}}.
+  None when absent; ValueError when it can't be decoded.
+  """
+  import base64
+  import binascii
+  spec = data.get("columnar") if isinstance(data, dict) else None
+  if spec is None:
+    return None
+  if not isinstance(spec, dict) or spec.get("format") not in ("parquet", "arrow"):
+    raise ValueError('"columnar" must be {"format": "parquet" | "arrow", "data": "<base64>"}')
+  try:
+    return base64.b64decode(spec.get("data") or "", validate=True), spec["format"]
+  except (binascii.Error, TypeError) as e:
+    raise ValueError(f"columnar data is not valid base64: {e}") from e
+
+def data_preprocess(data):
+  inline = columnar_input(data)
+  if inline is not None:
+    return _with_charts(columnar_preprocess(*inline, data.get("reporting_window")))
+  return _with_charts(compute_metrics(preprocess_rows(data)))
+
+def metrics_by_quarter(rows):
+  """
+  compute_metrics per report quarter ("2025-Q2"); undated rows are left out.
+  """
+  from app.data_analytics.dates import parse_report_dates, quarter_key
+  groups = {}
+  for r, dt in zip(rows, parse_report_dates([r.get("Report Date") for r in rows])):
+    if dt is not None:
+      groups.setdefault(quarter_key(dt), []).append(r)
+  return {q: compute_metrics(group) for q, group in sorted(groups.items())}
+
+def record_trends(rows, series=None, window=None):
+  """
+  Queues the rows' per-quarter aggregates for the trend store (off the
+  request path). Needs an explicit series; only quarters entirely inside the
+  reporting window are recorded.
+  """
+  from app.data_analytics.dates import quarters_within
+  from app.data_analytics.trend_store import TREND_RECORDING, record_async
+  if not TREND_RECORDING or not rows or not series or not isinstance(window, dict):
+    return None
+  covered = set(quarters_within(window.get("start"), window.get("end")))
+  if not covered:
+    return None
+  def compute():
+    return {q: m for q, m in metrics_by_quarter(rows).items() if q in covered}
+  return record_async(str(series), compute)
+
+def deck_preprocess(data, record=True):
+  """
+  data_preprocess for deck renders; with record, also records the quarters
+  its reporting_window fully covers under data["series"] in the trend store.
+  """
+  rows = preprocess_rows(data)
+  if record:
+    record_trends(rows, data.get("series"), data.get("reporting_window"))
+  return _with_charts(compute_metrics(rows))
+
+def columnar_preprocess(body: bytes, kind: str = None, window=None):
+  """
+  compute_metrics-shaped aggregates straight from an Arrow IPC or Parquet
+  body, computed column by column (no per-row dicts).
+  Optional window: {"start": ..., "end": ...} as for reporting_window.
+  """
+  from app.data_analytics.columnar import read_table, filter_table_by_window, table_metrics
+  table = read_table(body, kind)
+  if isinstance(window, dict) and (window.get("start") or window.get("end")):
+    table = filter_table_by_window(table, window.get("start"), window.get("end"))
+  metrics = table_metrics(table)
+  log.info("columnar metrics computed", extra=kv(rows=table.num_rows, columns=table.num_columns, bytes=len(body)))
+  return metrics
+
+def cube_preprocess(cube, filters=None):
+  """
+  Same payload as data_preprocess for one slice of an InsightCube
+  (filters as for InsightCube.select).
+  """
+  return _with_charts(cube.slice_metrics(cube.select(filters)))
+
+def store_preprocess(store=None):
+  """
+  Same payload as data_preprocess, read from the pre-aggregated metrics store
+  instead of re-scanning raw rows.
+  """
+  store = store or get_metrics_store()
+  return _with_charts(store.snapshot())
+
+def ingest_upload(fileobj, filename: str = "", content_type: str = "", to_store: bool = False, store=None):
+  """
+  Streams a raw CSV/XLSX export through the aggregator (and optionally the
+  metrics store) chunk by chunk. Returns compute_metrics-shaped aggregates.
+  """
+  from app.data_analytics.ingest import StreamingAggregator, iter_upload_chunks, hold_back_last_interaction
+  agg = StreamingAggregator()
+  chunks = iter_upload_chunks(fileobj, filename, content_type)
+  if to_store:
+    store = store or get_metrics_store()
+    chunks = hold_back_last_interaction(chunks)
+  n_chunks = 0
+  for rows in chunks:
+    with timed("ingest_chunk"):
+      _normalize_fields_inplace(rows)
+      agg.add_rows(rows)
+      if to_store:
+        store.apply_rows(rows)
+    n_chunks += 1
+  metrics = agg.snapshot()
+  log.info("upload ingested", extra=kv(filename=filename, rows=metrics["insight_count"], chunks=n_chunks, to_store=to_store))
+  return {**metrics, "_ingest": {"filename": filename, "rows": metrics["insight_count"], "chunks": n_chunks, "stored": to_store}}
+
+def stats_summary(data):
+  """
+  The deck's headline numbers (second_process without the chart images).
+  Works on compute_metrics output; no chart is rendered.
+  """
   settings = data["practice_counts"]
   academic_count = settings.get('Academic Center', 0)
   other_count = sum(v for k, v in settings.items() if k != 'Academic Center')
-  stats = {
-    'graph1': data["category_pie_png_b64"], # Done
-    'graph2': data["practice_pie_png_b64"], # Done
+  return {
     'deployedMSLS': len(data["msls"]), # Done
     'totalInteractions': data["n_interactions"], # Done
     'AcademicSettings': academic_count, # Done
@@ -281,5 +453,24 @@ def second_process(data):
     'Reporting_Dates':data["dates"],
     'category_count':data["category_counts"]
   }
+
+def second_process(data):
+  stats = {
+    'graph1': data["category_pie_png_b64"], # Done
+    'graph2': data["practice_pie_png_b64"], # Done
+    **stats_summary(data),
+  }
   return stats
 
+def stats_metrics(data, use_store: bool = False, store=None):
+  """
+  compute_metrics output for a request body (rows or an inline columnar
+  table) or the metrics store, with no charts attached; render_chart() draws
+  them only if asked for.
+  """
+  if use_store:
+    return (store or get_metrics_store()).snapshot()
+  inline = columnar_input(data)
+  if inline is not None:
+    return columnar_preprocess(*inline, data.get("reporting_window"))
+  return compute_metrics(preprocess_rows(data))
@@ -91,6 +91,17 @@ Format your response as:
 The data is below:
 """
   }
+  # prepended to the data section when the LLM gets cluster summaries instead of rows
+  cluster_format = """The data below is not one insight per record. Similar insights were grouped into clusters, and each record summarizes one cluster:
+- **cluster:** the cluster label (e.g. "Kymriah-3")
+- **insight_count:** how many insights the cluster holds
+- **top_terms:** the terms that characterize the cluster
+- **exemplars:** full insight records closest to the cluster's center; take supporting quotes only from these, citing their ID
+- **other_ids / other_ids_total:** IDs of the remaining insights in the cluster (the list is capped; the total is not)
+
+When a gap or theme is supported by a whole cluster, list the cluster label in other_sources instead of its individual IDs.
+
+"""
   remove = [
             "KOL Full Name", 
             "Therapeutic Area", 
@@ -118,6 +129,23 @@ The data is below:
       kym.append(i)
     elif i["Product Discussed"] == "Rituximab":
       rit.append(i)
+  # numpy-backed stages, imported here so loading the prompting path stays light
+  from app.data_analytics.dedupe import DEDUPE_INSIGHTS, collapse_rows, duplicate_groups
+  from app.data_analytics.preclustering import PRECLUSTER_MIN_ROWS, precluster_rows
+  # with DEDUPE_INSIGHTS=1, near-identical insights go to the LLM once, carrying their member ids and count
+  duplicates = {}
+  if DEDUPE_INSIGHTS:
+    ep, kym, rit = collapse_rows(ep), collapse_rows(kym), collapse_rows(rit)
+    duplicates = duplicate_groups(ep + kym + rit)
+  # large buckets also get cluster summaries (rows stay in 'data'); a theme
+  # citing a cluster label is expanded to its members via 'clusters'
+  summaries = [None, None, None]
+  clusters = {}
+  if PRECLUSTER_MIN_ROWS:
+    for n, (name, bucket) in enumerate((("Epcoritamab", ep), ("Kymriah", kym), ("Rituximab", rit))):
+      if len(bucket) > PRECLUSTER_MIN_ROWS:
+        summaries[n], members = precluster_rows(bucket, name)
+        clusters.update(members)
   # eptext = json.dumps(ep, indent=2)
   # kymtext = json.dumps(kym, indent=2)
   # rittext = json.dumps(rit, indent=2)
@@ -127,4 +155,11 @@ The data is below:
   # print(education_prompt)
   # print(clinical_prompt)
   # print(comp_prompt)
-  return [{'prompts':prompts[cat], 'data':[ep, kym, rit]}]
+  return [{
+    'prompts':prompts[cat],
+    'data':[ep, kym, rit],
+    'duplicates':duplicates,
+    'summary_prompts':prompts[cat].replace("The data is below:\n", cluster_format + "The data is below:\n"),
+    'summaries':summaries,
+    'clusters':clusters,
+  }]
@@ -0,0 +1,117 @@
+"""
+Structured, leveled, asynchronous logging.
+
+Records are filtered (level, sampling) and their fields size-capped in the
+calling thread, then handed to a queue; a background listener serializes them
+as one JSON object per line on stdout. Hot paths never block on stdout writes.
+
+  LOG_LEVEL          minimum level (default INFO)
+  LOG_SAMPLE_RATE    fraction of DEBUG records kept (default 1.0)
+  LOG_MAX_FIELD      max characters per field value (default 512)
+
+Usage:
+  log = get_logger(__name__)
+  log.debug("prompt assembled", extra=kv(run=run, prompt=dat))
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import reprlib
+import sys
+import threading
+from typing import Any, Dict
+
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+LOG_SAMPLE_RATE = float(os.environ.get("LOG_SAMPLE_RATE", "1.0"))
+LOG_MAX_FIELD = int(os.environ.get("LOG_MAX_FIELD", "512"))
+
+_ROOT = "msl"
+_LOCK = threading.Lock()
+_QUEUE: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_LISTENER = None
+
+_repr = reprlib.Repr()
+_repr.maxstring = LOG_MAX_FIELD
+_repr.maxother = LOG_MAX_FIELD
+_repr.maxlist = _repr.maxdict = _repr.maxset = _repr.maxtuple = 8
+_repr.maxlevel = 3
+
+def kv(**fields: Any) -> Dict[str, Any]:
+  """
+  Wraps structured fields for `extra=`.
+  """
+  return {"fields": fields}
+
+def _cap(value: Any) -> Any:
+  """
+  Bounded-cost rendering of a field value: never serializes a whole payload.
+  """
+  if value is None or isinstance(value, (bool, int, float)):
+    return value
+  if isinstance(value, str):
+    if len(value) <= LOG_MAX_FIELD:
+      return value
+    return f"{value[:LOG_MAX_FIELD]}...(+{len(value) - LOG_MAX_FIELD} chars)"
+  if isinstance(value, (list, tuple, dict, set)) and len(value) > _repr.maxlist:
+    return f"<{type(value).__name__} len={len(value)}> " + _repr.repr(value)
+  return _repr.repr(value)
+
+class _SampleAndCap(logging.Filter):
+  """
+  Runs in the caller's thread: drops sampled-out DEBUG records and caps field sizes
+  before anything reaches the queue.
+  """
+  def filter(self, record: logging.LogRecord) -> bool:
+    if record.levelno <= logging.DEBUG and LOG_SAMPLE_RATE < 1.0 and random.random() >= LOG_SAMPLE_RATE:
+      return False
+    fields = getattr(record, "fields", None)
+    if fields:
+      record.fields = {k: _cap(v) for k, v in fields.items()}
+    return True
+
+class _JsonFormatter(logging.Formatter):
+  def format(self, record: logging.LogRecord) -> str:
+    out = {
+      "ts": round(record.created, 3),
+      "level": record.levelname,
+      "logger": record.name,
+      "msg": record.getMessage(),
+    }
+    out.update(getattr(record, "fields", None) or {})
+    if record.exc_info:
+      out["exc"] = self.formatException(record.exc_info)
+    return json.dumps(out, default=str)
+
+def _configure() -> None:
+  global _LISTENER
+  with _LOCK:
+    if _LISTENER is not None:
+      return
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(_JsonFormatter())
+    _LISTENER = logging.handlers.QueueListener(_QUEUE, stream, respect_handler_level=False)
+    _LISTENER.start()
+    atexit.register(_LISTENER.stop)
+
+    handler = logging.handlers.QueueHandler(_QUEUE)
+    handler.addFilter(_SampleAndCap())
+    root = logging.getLogger(_ROOT)
+    root.addHandler(handler)
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+
+def queue_depth() -> int:
+  """
+  Records waiting to be written by the listener thread.
+  """
+  return _QUEUE.qsize()
+
+def get_logger(name: str) -> logging.Logger:
+  _configure()
+  if not name.startswith(_ROOT + "."):
+    name = f"{_ROOT}.{name}"
+  return logging.getLogger(name)
@@ -0,0 +1,129 @@
+"""
+Per-stage timing instrumentation, exposed in Prometheus text format on /metrics.
+
+  with timed("template_load"):
+    prs = open_template(path)
+
+  @timed_fn("create_pie_chart")
+  def _create_pie_chart(...): ...
+
+Stages land in the `msl_stage_seconds` histogram; gauges registered with
+register_gauge() (cache hit rates, queue depths) are read at scrape time.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, List, Tuple
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+  return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _fmt_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+  parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+  if extra:
+    parts.append(extra)
+  return "{" + ",".join(parts) + "}" if parts else ""
+
+class Histogram:
+  """
+  Minimal thread-safe Prometheus histogram with fixed label names.
+  """
+  def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+    self.name = name
+    self.help = help
+    self.labelnames = tuple(labelnames)
+    self.buckets = tuple(buckets)
+    self._lock = threading.Lock()
+    # label values -> [per-bucket counts..., +Inf count], sum
+    self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+  def observe(self, value: float, *labelvalues: str) -> None:
+    idx = bisect_left(self.buckets, value)
+    with self._lock:
+      counts, total = self._series.setdefault(labelvalues, ([0] * (len(self.buckets) + 1), [0.0]))
+      counts[idx] += 1
+      total[0] += value
+
+  def render(self) -> List[str]:
+    lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+    with self._lock:
+      series = [(k, list(c), t[0]) for k, (c, t) in self._series.items()]
+    for labelvalues, counts, total in sorted(series):
+      cumulative = 0
+      for bound, n in zip(self.buckets + (float("inf"),), counts):
+        cumulative += n
+        le = 'le="+Inf"' if bound == float("inf") else f'le="{bound}"'
+        lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, labelvalues, le)} {cumulative}")
+      lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, labelvalues)} {total}")
+      lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, labelvalues)} {cumulative}")
+    return lines
+
+STAGE_SECONDS = Histogram("msl_stage_seconds", "Time spent per pipeline stage.", ("stage",))
+REQUEST_SECONDS = Histogram("msl_request_seconds", "End-to-end request latency per route.", ("method", "route", "status"))
+
+# name -> (help, type, callback returning {label tuple: value})
+_GAUGES: Dict[str, Tuple[str, str, Tuple[str, ...], Callable[[], Dict[Tuple[str, ...], float]]]] = {}
+
+def register_gauge(name: str, help: str, labelnames: Tuple[str, ...], fn: Callable[[], Dict[Tuple[str, ...], float]], kind: str = "gauge") -> None:
+  """
+  Registers a value read at scrape time. `fn` returns {label values: value}.
+  """
+  _GAUGES[name] = (help, kind, tuple(labelnames), fn)
+
+@contextmanager
+def timed(stage: str):
+  start = time.perf_counter()
+  try:
+    yield
+  finally:
+    STAGE_SECONDS.observe(time.perf_counter() - start, stage)
+
+def timed_fn(stage: str):
+  """
+  Decorator form of timed().
+  """
+  def deco(fn):
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+      with timed(stage):
+        return fn(*args, **kwargs)
+    return wrapper
+  return deco
+
+_LRU_CACHES: Dict[str, Callable] = {}
+
+def register_lru_cache(name: str, fn: Callable) -> None:
+  """
+  Exposes hits/misses of a functools.lru_cache-wrapped function.
+  """
+  _LRU_CACHES[name] = fn
+
+def _cache_values(field: str) -> Dict[Tuple[str, ...], float]:
+  out = {}
+  for name, fn in _LRU_CACHES.items():
+    info = fn.cache_info()
+    if field == "ratio":
+      calls = info.hits + info.misses
+      out[(name,)] = (info.hits / calls) if calls else 0.0
+    else:
+      out[(name,)] = getattr(info, field)
+  return out
+
+register_gauge("msl_cache_hits_total", "Cache hits per memoized parser/loader.", ("cache",), lambda: _cache_values("hits"), kind="counter")
+register_gauge("msl_cache_misses_total", "Cache misses per memoized parser/loader.", ("cache",), lambda: _cache_values("misses"), kind="counter")
+register_gauge("msl_cache_hit_ratio", "Cache hit ratio per memoized parser/loader.", ("cache",), lambda: _cache_values("ratio"))
+
+def render_metrics() -> str:
+  lines: List[str] = []
+  for hist in (STAGE_SECONDS, REQUEST_SECONDS):
+    lines.extend(hist.render())
+  for name, (help, kind, labelnames, fn) in _GAUGES.items():
+    lines.append(f"# HELP {name} {help}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labelvalues, value in sorted(fn().items()):
+      lines.append(f"{name}{_fmt_labels(labelnames, labelvalues)} {value}")
+  return "\n".join(lines) + "\n"
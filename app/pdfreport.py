@@ -0,0 +1,176 @@
+"""
+Read-only PDF report drawn directly with the reportlab canvas.
+
+Takes the same inputs as full_replacement (second_process stats plus the
+patient/education/competitive theme lists). Each chart image and the page
+header are drawn once into a form XObject and placed with doForm(), so
+repeated pages reference the same object instead of re-embedding it.
+"""
+import os
+import tempfile
+from io import BytesIO
+from typing import Any, Dict, List
+
+from reportlab.lib.colors import HexColor, white
+from reportlab.lib.pagesizes import landscape, letter
+from reportlab.lib.utils import ImageReader, simpleSplit
+from reportlab.pdfgen import canvas
+
+from app.metrics import timed_fn
+from app.slides import theme_texts
+
+PAGE_W, PAGE_H = landscape(letter)
+MARGIN = 40
+INK = HexColor("#28246f")
+ACCENT = HexColor("#302534")
+MUTED = HexColor("#6b6b80")
+FONT = "Helvetica"
+FONT_BOLD = "Helvetica-Bold"
+# Chart forms are drawn at this size, then scaled to the slot they are placed in
+CHART_BOX = (400.0, 300.0)
+
+SECTIONS = [
+  ("patient", "Patient Management / Care"),
+  ("education", "Education & Communication"),
+  ("competitive", "Competitive Intelligence"),
+]
+
+def _define_header(c: canvas.Canvas) -> None:
+  c.beginForm("header")
+  c.setFillColor(INK)
+  c.rect(0, PAGE_H - 28, PAGE_W, 28, stroke=0, fill=1)
+  c.setFillColor(white)
+  c.setFont(FONT_BOLD, 11)
+  c.drawString(MARGIN, PAGE_H - 19, "MSL Insights Report")
+  c.endForm()
+
+def _define_image(c: canvas.Canvas, name: str, image_bytes: bytes, box_w: float, box_h: float) -> bool:
+  """
+  Draws the image, fitted into box_w x box_h, into form XObject `name`.
+  """
+  if not image_bytes:
+    return False
+  img = ImageReader(BytesIO(image_bytes))
+  iw, ih = img.getSize()
+  scale = min(box_w / iw, box_h / ih)
+  w, h = iw * scale, ih * scale
+  c.beginForm(name)
+  c.drawImage(img, (box_w - w) / 2, (box_h - h) / 2, width=w, height=h, mask="auto")
+  c.endForm()
+  return True
+
+class _Writer:
+  """
+  Top-down text cursor that starts a new page when it runs out of room.
+  """
+  def __init__(self, c: canvas.Canvas, title: str):
+    self.c = c
+    self.title = title
+    self.y = 0.0
+    self.page()
+
+  def page(self, cont: bool = False) -> None:
+    if self.y:
+      self.c.showPage()
+    self.c.doForm("header")
+    self.c.setFillColor(ACCENT)
+    self.c.setFont(FONT_BOLD, 18)
+    self.c.drawString(MARGIN, PAGE_H - 62, self.title + (" (cont.)" if cont else ""))
+    self.y = PAGE_H - 88
+
+  def need(self, height: float) -> None:
+    if self.y - height < MARGIN:
+      self.page(cont=True)
+
+  def paragraph(self, text: str, font: str = FONT, size: float = 10, color=INK, indent: float = 0, gap: float = 4) -> None:
+    lines: List[str] = []
+    for raw in (text or "").split("\n"):
+      lines.extend(simpleSplit(raw, font, size, PAGE_W - 2 * MARGIN - indent) or [""])
+    leading = size * 1.3
+    self.c.setFillColor(color)
+    self.c.setFont(font, size)
+    for line in lines:
+      self.need(leading)
+      self.c.setFont(font, size)
+      self.c.setFillColor(color)
+      self.c.drawString(MARGIN + indent, self.y - size, line)
+      self.y -= leading
+    self.y -= gap
+
+def _stats_page(c: canvas.Canvas, stats: Dict[str, Any], charts: Dict[str, bool]) -> None:
+  w = _Writer(c, "Reporting Overview")
+  facts = [
+    ("Reporting period", stats.get("Reporting_Dates", "")),
+    ("Deployed MSLs", str(stats.get("deployedMSLS", ""))),
+    ("HCP interactions", f"Total: {stats.get('totalInteractions', '')}   Academic: {stats.get('AcademicSettings', '')}"
+                         f"   Community: {stats.get('CommunitySettings', '')}"),
+    ("Insights", str(stats.get("InsightCount", ""))),
+    ("Congresses", ", ".join(stats.get("Congresses", [])) or "None"),
+  ]
+  for label, value in facts:
+    w.paragraph(label, font=FONT_BOLD, size=10, color=MUTED, gap=0)
+    w.paragraph(value, size=12, gap=6)
+
+  chart_w = (PAGE_W - 3 * MARGIN) / 2
+  chart_h = max(120.0, w.y - MARGIN)
+  for i, (name, caption) in enumerate((("graph1", "Insight Categories"), ("graph2", "HCP Practice Setting"))):
+    if not charts.get(name):
+      continue
+    x = MARGIN + i * (chart_w + MARGIN)
+    c.saveState()
+    c.translate(x, MARGIN)
+    c.scale(chart_w / CHART_BOX[0], (chart_h - 16) / CHART_BOX[1])
+    c.doForm(name)
+    c.restoreState()
+    c.setFont(FONT_BOLD, 10)
+    c.setFillColor(MUTED)
+    c.drawCentredString(x + chart_w / 2, MARGIN + chart_h - 12, caption)
+  c.showPage()
+
+def _theme_pages(c: canvas.Canvas, title: str, themes: List[Dict[str, Any]]) -> None:
+  w = _Writer(c, title)
+  if not themes:
+    w.paragraph("No themes identified for this period.", color=MUTED)
+  for i, theme in enumerate(themes):
+    t = theme_texts(theme, i + 1)
+    w.need(80)
+    w.paragraph(t["title"], font=FONT_BOLD, size=13, color=ACCENT, gap=2)
+    w.paragraph(t["gap"], size=10)
+    w.paragraph("Representative quotes", font=FONT_BOLD, size=9, color=MUTED, gap=0)
+    w.paragraph(t["quotes"], font="Helvetica-Oblique", size=9, indent=10)
+    w.paragraph("Root-cause questions", font=FONT_BOLD, size=9, color=MUTED, gap=0)
+    w.paragraph(t["roots"], size=9, indent=10, gap=12)
+  c.showPage()
+
+@timed_fn("pdf_report")
+def pdf_report(stats: Dict[str, Any], patient, education, competitive, out=None) -> bytes | None:
+  """
+  Renders the report into `out` (any binary file object) or returns the bytes.
+  Output is byte-stable for identical inputs (invariant mode).
+  """
+  buf = out if out is not None else BytesIO()
+  c = canvas.Canvas(buf, pagesize=(PAGE_W, PAGE_H), invariant=1, pageCompression=1)
+  c.setTitle("MSL Insights Report")
+  _define_header(c)
+  charts = {name: _define_image(c, name, stats.get(name), *CHART_BOX) for name in ("graph1", "graph2")}
+
+  _stats_page(c, stats, charts)
+  themes = {"patient": patient, "education": education, "competitive": competitive}
+  for key, title in SECTIONS:
+    _theme_pages(c, title, themes[key] or [])
+  c.save()
+  return None if out is not None else buf.getvalue()
+
+def pdf_to_tempfile(stats: Dict[str, Any], patient, education, competitive) -> str:
+  """
+  Report path in the temp dir, written page by page through `out`; the
+  caller removes it once streamed.
+  """
+  fd, path = tempfile.mkstemp(prefix="msl-report-", suffix=".pdf")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      pdf_report(stats, patient, education, competitive, out=f)
+    return path
+  except Exception:
+    os.remove(path)
+    raise
@@ -6,8 +6,15 @@ from pptx.oxml.xmlchemy import OxmlElement
 from pptx.oxml.ns import qn
 from io import BytesIO
 import ast
+import logging
 import os
 from typing import Dict, Any, Tuple, List, Set
+from app.templates import NEW_TEMPLATE_PATH, open_template, save_presentation
+from app.logger import get_logger, kv
+from app.metrics import timed, timed_fn
+from app.slides import THEMES_PER_SLIDE, chunk_themes, expand_theme_slides, theme_texts
+
+log = get_logger(__name__)
 
 # ======================
 # EMU conversions
@@ -348,9 +355,68 @@ def editPPTX(pres, ref: Dict[int, Dict], items: Dict[int, Tuple[str, int]], debu
     for nm in missing:
       print(f"  - {nm}")
 
+# ======================
+# Theme slides
+# ======================
+# Per category: item ids of each prototype column's (title, gap, quotes, roots) shapes
+THEME_COLUMN_IDS = {
+  "patient": [(1441, 1443, 1445, 1447), (1450, 1452, 1454, 1456), (1459, 1461, 1463, 1465)],
+  "education": [(1470, 1472, 1474, 1476), (1479, 1481, 1483, 1485), (1488, 1490, 1492, 1494)],
+  "competitive": [(1499, 1501, 1503, 1505), (1508, 1510, 1512, 1514), (1517, 1519, 1521, 1523)],
+}
+THEME_FONT_SIZES = {"title": 14, "gap": 10, "quotes": 8, "roots": 8}
+THEME_FONT_OVERRIDES = {"competitive": {"roots": 9}}
+
+def fill_theme_slides(prs, items: Dict[int, Tuple[str, int]], themes_by_category: Dict[str, List[Dict[str, Any]]]):
+  """
+  Clones each category's theme slide once per extra three themes, then writes
+  every column by shape name on its own slide (clones repeat the prototype's
+  names, so the deck-wide name index can't address them). Unused columns on
+  the last slide are blanked.
+  """
+  by_name, _ = _index_shapes_by_name(prs)
+  slides = list(prs.slides)
+  plan = []
+  for category, themes in themes_by_category.items():
+    columns = THEME_COLUMN_IDS[category]
+    names = [tuple(items[i][0] for i in col) for col in columns]
+    entry = by_name.get(names[0][0])
+    if entry is None:
+      log.warning("theme prototype not found; skipping", extra=kv(category=category, shape=names[0][0]))
+      continue
+    proto = slides[entry[0]]
+    # clone first: clones must copy the untouched prototype
+    plan.append((category, names, chunk_themes(themes), expand_theme_slides(prs, proto, len(themes or []))))
+
+  for category, names, chunks, theme_slides in plan:
+    sizes = {**THEME_FONT_SIZES, **THEME_FONT_OVERRIDES.get(category, {})}
+    for n, (slide, chunk) in enumerate(zip(theme_slides, chunks)):
+      # first occurrence wins, as in _index_shapes_by_name
+      shapes = {}
+      for shp in _iter_shapes_recursive(slide):
+        shapes.setdefault(getattr(shp, "name", None), shp)
+      for col, (theme, col_names) in enumerate(zip(chunk, names)):
+        texts = theme_texts(theme, n * THEMES_PER_SLIDE + col + 1)
+        for field, name in zip(("title", "gap", "quotes", "roots"), col_names):
+          shp = shapes.get(name)
+          if shp is None:
+            log.warning("theme shape missing", extra=kv(category=category, slide=n, shape=name))
+            continue
+          try:
+            _overwrite_shape_text(
+              shp,
+              text=texts[field],
+              font_name="Century Gothic",
+              font_size=sizes[field],
+              font_color=hex_to_rgb("28246f"),
+            )
+          except Exception as e:
+            log.warning("theme shape write failed", extra=kv(category=category, slide=n, shape=name, error=str(e)))
+
 # ======================
 # Public entry
 # ======================
+@timed_fn("true_replacement")
 def true_replacement(
   stats: Dict[str, Any],
   patient: List[Dict[str, Any]],
@@ -363,13 +429,13 @@ def true_replacement(
   """
   Loads the template, injects text+graphs, returns PPTX bytes.
   """
-  base_dir = os.path.dirname(os.path.abspath(__file__))
-  template_path = template_path or os.path.join(base_dir, "New Acquis Template.pptx")
+  template_path = template_path or NEW_TEMPLATE_PATH
 
   if not os.path.exists(template_path):
     raise FileNotFoundError(f"Template not found at: {template_path}")
 
-  prs = Presentation(template_path)
+  with timed("template_load"):
+    prs = open_template(template_path)
 
   def safe_get(lst, idx, key, default=""):
     return (lst[idx].get(key) if 0 <= idx < len(lst) and isinstance(lst[idx], dict) else default)
@@ -449,108 +515,13 @@ def true_replacement(
     1425: {"text": str(catcount[5]), "font": "Century Gothic", "font_size": 11, "font_color": hex_to_rgb("333333"), "bold":True},
     1427: {"text": str(catcount[6]), "font": "Century Gothic", "font_size": 11, "font_color": hex_to_rgb("333333"), "bold":True},
     1429: {"text": str(catcount[7]), "font": "Century Gothic", "font_size": 11, "font_color": hex_to_rgb("333333"), "bold":True},
-    1431: {"text": str(catcount[8]), "font": "Century Gothic", "font_size": 11, "font_color": hex_to_rgb("333333"), "bold":True},
-
-    # Slide 3: Patient
-    1441: {"text": f"Theme 1 (n={len(patient[0].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-    1450: {"text": f"Theme 2 (n={len(patient[1].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-    1459: {"text": f"Theme 3 (n={len(patient[2].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-
-    1443: {"text": patient[0].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-    1452: {"text": patient[1].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-    1461: {"text": patient[2].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-
-    1445: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in patient[0].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1454: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in patient[1].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1463: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in patient[2].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-
-    1447: {"text": f"1: {patient[0].get('root_cause_questions', ['',''])[0] or ''}\n"
-          f"2: {patient[0].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1456: {"text": f"1: {patient[1].get('root_cause_questions', ['',''])[0] or ''}\n"
-          f"2: {patient[1].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1465: {"text": f"1: {patient[2].get('root_cause_questions', ['',''])[0] or ''}\n"
-          f"2: {patient[2].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-
-    # Slide 4: Education
-    1470: {"text": f"Theme 1 (n={len(education[0].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-    1479: {"text": f"Theme 2 (n={len(education[1].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-    1488: {"text": f"Theme 3 (n={len(education[2].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-
-    1472: {"text": education[0].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-    1481: {"text": education[1].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-    1490: {"text": education[2].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-
-    1474: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in education[0].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1483: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in education[1].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1492: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in education[2].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-
-    1476: {"text": f"1: {education[0].get('root_cause_questions', ['',''])[0] or ''}\n"
-          f"2: {education[0].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1485: {"text": f"1: {education[1].get('root_cause_questions', ['',''])[0] or ''}\n"
-          f"2: {education[1].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1494: {"text": f"1: {education[2].get('root_cause_questions', ['',''])[0] or ''}\n"
-          f"2: {education[2].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-
-    # Slide 5: Competitive
-    1499: {"text": f"Theme 1 (n={len(competitive[0].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-    1508: {"text": f"Theme 2 (n={len(competitive[1].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-    1517: {"text": f"Theme 3 (n={len(competitive[2].get('other_sources', [])) + 3})",
-          "font": "Century Gothic", "font_size": 14, "font_color": hex_to_rgb("28246f")},
-
-    1501: {"text": competitive[0].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-    1510: {"text": competitive[1].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-    1519: {"text": competitive[2].get("gap_definition", ""),
-          "font": "Century Gothic", "font_size": 10, "font_color": hex_to_rgb("28246f")},
-
-    1503: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in competitive[0].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1512: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in competitive[1].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-    1521: {"text": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in competitive[2].get("representative_quotes", [])]),
-          "font": "Century Gothic", "font_size": 8, "font_color": hex_to_rgb("28246f")},
-
-    1505: {"text": f"1: {competitive[0].get('root_cause_questions', ['',''])[0] or ''}\n"
-        f"2: {competitive[0].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 9, "font_color": hex_to_rgb("28246f")},
-    1514: {"text": f"1: {competitive[1].get('root_cause_questions', ['',''])[0] or ''}\n"
-        f"2: {competitive[1].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 9, "font_color": hex_to_rgb("28246f")},
-    1523: {"text": f"1: {competitive[2].get('root_cause_questions', ['',''])[0] or ''}\n"
-        f"2: {competitive[2].get('root_cause_questions', ['',''])[1] or ''}",
-      "font": "Century Gothic", "font_size": 9, "font_color": hex_to_rgb("28246f")}
+    1431: {"text": str(catcount[8]), "font": "Century Gothic", "font_size": 11, "font_color": hex_to_rgb("333333"), "bold":True}
   }
 
-  print("buggy text: ","\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in competitive[0].get("representative_quotes", [])]))
-  print("\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in competitive[1].get("representative_quotes", [])]))
-  print("\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in competitive[2].get("representative_quotes", [])]))
+  if log.isEnabledFor(logging.DEBUG):
+    log.debug("competitive quotes", extra=kv(**{
+      f"theme{i + 1}": theme_texts(theme, i + 1)["quotes"] for i, theme in enumerate(competitive)
+    }))
 
   # items: id -> (shape_name, slide_idx_hint).
   items: Dict[int, Tuple[str, int]] = {1350: ('Rectangle: Rounded Corners 136', 4), 1351: ('Google Shape;499;p44', 5), 1352: ('Google Shape;500;p44', 5), 1353: ('Google Shape;502;p44', 5), 1354: ('Google Shape;503;p44', 5), 1355: ('Google Shape;504;p44', 5), 1356: ('Google Shape;506;p44', 5), 1357: ('Google Shape;507;p44', 5), 1358: ('Google Shape;508;p44', 5), 1359: ('Google Shape;510;p44', 5), 1360: ('Google Shape;511;p44', 5), 1361: ('Google Shape;512;p44', 5), 1362: ('Google Shape;513;p44', 5), 1363: ('Google Shape;514;p44', 5), 1364: ('Google Shape;515;p44', 5), 1365: ('Google Shape;516;p44', 5), 1366: ('Google Shape;517;p44', 5), 1367: ('Google Shape;518;p44', 5), 1368: ('Google Shape;519;p44', 5), 1369: ('Google Shape;525;p44', 5), 1370: ('Google Shape;526;p44', 5), 1371: ('Google Shape;527;p44', 5), 1372: ('Google Shape;528;p44', 5), 1373: ('Google Shape;529;p44', 5), 1374: ('Google Shape;530;p44', 5), 1375: ('Google Shape;531;p44', 5), 1376: ('Google Shape;532;p44', 5), 1377: ('Google Shape;533;p44', 5), 1378: ('Google Shape;534;p44', 5), 1379: ('Google Shape;535;p44', 5), 1380: ('Google Shape;536;p44', 5), 1381: ('Google Shape;537;p44', 5), 1382: ('Google Shape;538;p44', 5), 1383: ('Google Shape;539;p44', 5), 1384: ('Google Shape;540;p44', 5), 1385: ('Google Shape;541;p44', 5), 1386: ('Google Shape;542;p44', 5), 1387: ('Google Shape;543;p44', 5), 1388: ('Google Shape;544;p44', 5), 1389: ('Google Shape;545;p44', 5), 1390: ('Google Shape;433;p43', 6), 1391: ('Google Shape;434;p43', 6), 1392: ('Rectangle: Rounded Corners 1', 6), 1393: ('Rectangle: Rounded Corners 6', 6), 1394: ('Rectangle: Rounded Corners 2', 6), 1395: ('Rectangle 8', 6), 1396: ('Google Shape;565;p45', 7), 1397: ('Google Shape;566;p45', 7), 1398: ('Google Shape;567;p45', 7), 1399: ('Google Shape;568;p45', 7), 1400: ('Google Shape;569;p45', 7), 1401: ('Google Shape;570;p45', 7), 1402: ('Google Shape;571;p45', 7), 1403: ('Google Shape;572;p45', 7), 1404: ('Google Shape;573;p45', 7), 1405: ('Google Shape;575;p45', 7), 1406: ('Google Shape;576;p45', 7), 1407: ('Google Shape;578;p45', 7), 1408: ('Google Shape;579;p45', 7), 1409: ('Google Shape;581;p45', 7), 1410: ('Google Shape;582;p45', 7), 1411: ('Google Shape;584;p45', 7), 1412: ('Google Shape;585;p45', 7), 1413: ('Google Shape;587;p45', 7), 1414: ('Google Shape;588;p45', 7), 1415: ('Google Shape;590;p45', 7), 1416: ('Google Shape;591;p45', 7), 1417: ('Google Shape;593;p45', 7), 1418: ('Google Shape;594;p45', 7), 1419: ('Google Shape;596;p45', 7), 1420: ('Google Shape;597;p45', 7), 1421: ('Google Shape;599;p45', 7), 1422: ('Google Shape;600;p45', 7), 1423: ('Google Shape;602;p45', 7), 1424: ('Google Shape;603;p45', 7), 1425: ('Google Shape;605;p45', 7), 1426: ('Google Shape;606;p45', 7), 1427: ('Google Shape;608;p45', 7), 1428: ('Google Shape;609;p45', 7), 1429: ('Google Shape;611;p45', 7), 1430: ('Google Shape;612;p45', 7), 1431: ('Google Shape;614;p45', 7), 1432: ('Google Shape;615;p45', 7), 1433: ('Google Shape;616;p45', 7), 1434: ('Google Shape;587;p45;s8;sid59', 7), 1435: ('Google Shape;588;p45;s8;sid60', 7), 1436: ('Google Shape;616;p45;s8;sid61', 7), 1437: ('Google Shape;622;p46', 8), 1438: ('Google Shape;623;p46', 8), 1439: ('Google Shape;624;p46', 8), 1440: ('Google Shape;625;p46', 8), 1441: ('Google Shape;626;p46', 8), 1442: ('Google Shape;627;p46', 8), 1443: ('Google Shape;628;p46', 8), 1444: ('Google Shape;629;p46', 8), 1445: ('Google Shape;630;p46', 8), 1446: ('Google Shape;631;p46', 8), 1447: ('Google Shape;632;p46', 8), 1448: ('Google Shape;633;p46', 8), 1449: ('Google Shape;634;p46', 8), 1450: ('Google Shape;635;p46', 8), 1451: ('Google Shape;636;p46', 8), 1452: ('Google Shape;637;p46', 8), 1453: ('Google Shape;638;p46', 8), 1454: ('Google Shape;639;p46', 8), 1455: ('Google Shape;640;p46', 8), 1456: ('Google Shape;641;p46', 8), 1457: ('Google Shape;642;p46', 8), 1458: ('Google Shape;643;p46', 8), 1459: ('Google Shape;644;p46', 8), 1460: ('Google Shape;645;p46', 8), 1461: ('Google Shape;646;p46', 8), 1462: ('Google Shape;647;p46', 8), 1463: ('Google Shape;648;p46', 8), 1464: ('Google Shape;649;p46', 8), 1465: ('Google Shape;650;p46', 8), 1466: ('Google Shape;656;p47', 9), 1467: ('Google Shape;657;p47', 9), 1468: ('Google Shape;658;p47', 9), 1469: ('Google Shape;659;p47', 9), 1470: ('Google Shape;660;p47', 9), 1471: ('Google Shape;661;p47', 9), 1472: ('Google Shape;662;p47', 9), 1473: ('Google Shape;663;p47', 9), 1474: ('Google Shape;664;p47', 9), 1475: ('Google Shape;665;p47', 9), 1476: ('Google Shape;666;p47', 9), 1477: ('Google Shape;667;p47', 9), 1478: ('Google Shape;668;p47', 9), 1479: ('Google Shape;669;p47', 9), 1480: ('Google Shape;670;p47', 9), 1481: ('Google Shape;671;p47', 9), 1482: ('Google Shape;672;p47', 9), 1483: ('Google Shape;673;p47', 9), 1484: ('Google Shape;674;p47', 9), 1485: ('Google Shape;675;p47', 9), 1486: ('Google Shape;676;p47', 9), 1487: ('Google Shape;677;p47', 9), 1488: ('Google Shape;678;p47', 9), 1489: ('Google Shape;679;p47', 9), 1490: ('Google Shape;680;p47', 9), 1491: ('Google Shape;681;p47', 9), 1492: ('Google Shape;682;p47', 9), 1493: ('Google Shape;683;p47', 9), 1494: ('Google Shape;684;p47', 9), 1495: ('Google Shape;690;p48', 10), 1496: ('Google Shape;691;p48', 10), 1497: ('Google Shape;692;p48', 10), 1498: ('Google Shape;693;p48', 10), 1499: ('Google Shape;694;p48', 10), 1500: ('Google Shape;695;p48', 10), 1501: ('Google Shape;696;p48', 10), 1502: ('Google Shape;697;p48', 10), 1503: ('Google Shape;698;p48', 10), 1504: ('Google Shape;699;p48', 10), 1505: ('Google Shape;700;p48', 10), 1506: ('Google Shape;701;p48', 10), 1507: ('Google Shape;702;p48', 10), 1508: ('Google Shape;703;p48', 10), 1509: ('Google Shape;704;p48', 10), 1510: ('Google Shape;705;p48', 10), 1511: ('Google Shape;706;p48', 10), 1512: ('Google Shape;707;p48', 10), 1513: ('Google Shape;708;p48', 10), 1514: ('Google Shape;709;p48', 10), 1515: ('Google Shape;710;p48', 10), 1516: ('Google Shape;711;p48', 10), 1517: ('Google Shape;712;p48', 10), 1518: ('Google Shape;713;p48', 10), 1519: ('Google Shape;714;p48', 10), 1520: ('Google Shape;715;p48', 10), 1521: ('Google Shape;716;p48', 10), 1522: ('Google Shape;717;p48', 10), 1523: ('Google Shape;718;p48', 10), 1524: ('Google Shape;295;p39;s12;sid295', 11), 1525: ('Google Shape;296;p39;s12;sid296', 11), 1526: ('Google Shape;297;p39;s12;sid297', 11), 1527: ('Google Shape;298;p39;s12;sid298', 11), 1528: ('Google Shape;299;p39;s12;sid299', 11), 1529: ('Google Shape;300;p39;s12;sid300', 11)}
@@ -580,9 +551,12 @@ def true_replacement(
   )
 
   # Populate text by name, regardless of slide moves
-  editPPTX(prs, ref, items, debug=debug)
+  with timed("editPPTX"):
+    editPPTX(prs, ref, items, debug=debug)
+
+  # Theme slides: one per three themes, cloned from the category's prototype
+  with timed("theme_slides"):
+    fill_theme_slides(prs, items, {"patient": patient, "education": education, "competitive": competitive})
 
-  buf = BytesIO()
-  prs.save(buf)
-  buf.seek(0)
-  return buf.getvalue()
+  with timed("prs_save"):
+    return save_presentation(prs)
@@ -0,0 +1,146 @@
+"""
+Opt-in per-request sampling profiler.
+
+A request sent with `X-Profile: 1` (or `?profile=1`) and a matching
+`X-Profile-Token` header is sampled from a background thread via sys._current_frames();
+the result is written as a speedscope file (https://www.speedscope.app) and its
+id returned in the `X-Profile-Id` response header. Fetch it from /profiles/{id}.
+
+  PROFILE_TOKEN      shared secret; profiling is disabled when unset
+  PROFILE_DIR        where profiles are written (default <tmp>/msl-profiles)
+  PROFILE_INTERVAL   seconds between samples (default 0.005)
+  PROFILE_KEEP       newest profiles kept on disk (default 50)
+
+Only the thread serving the request is sampled, so work it hands to other
+threads is not attributed to it. That thread is the event loop, which also
+runs every other request in flight: anything they execute on the loop while
+the profile runs shows up in it too. Profile on an otherwise idle worker
+for a clean attribution.
+
+The token is accepted as a header only; query strings end up in access logs.
+"""
+import hmac
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+PROFILE_TOKEN = os.environ.get("PROFILE_TOKEN", "")
+PROFILE_DIR = os.environ.get("PROFILE_DIR", os.path.join(tempfile.gettempdir(), "msl-profiles"))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+PROFILE_KEEP = int(os.environ.get("PROFILE_KEEP", "50"))
+
+_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+Frame = Tuple[str, str, int]
+
+class SamplingProfiler:
+  """
+  Samples one thread's stack every `interval` seconds until stop().
+  """
+  def __init__(self, thread_id: int, interval: float = PROFILE_INTERVAL):
+    self.thread_id = thread_id
+    self.interval = interval
+    self.samples: List[Tuple[Frame, ...]] = []
+    self.weights: List[float] = []
+    self._stop = threading.Event()
+    self._thread = threading.Thread(target=self._run, name="msl-profiler", daemon=True)
+    self.started = self.stopped = 0.0
+
+  def _run(self) -> None:
+    last = time.perf_counter()
+    while not self._stop.wait(self.interval):
+      frame = sys._current_frames().get(self.thread_id)
+      now = time.perf_counter()
+      if frame is None:
+        break
+      stack = []
+      while frame is not None:
+        code = frame.f_code
+        stack.append((code.co_name, code.co_filename, frame.f_lineno))
+        frame = frame.f_back
+      stack.reverse()
+      self.samples.append(tuple(stack))
+      self.weights.append(now - last)
+      last = now
+
+  def start(self) -> "SamplingProfiler":
+    self.started = time.perf_counter()
+    self._thread.start()
+    return self
+
+  def stop(self) -> "SamplingProfiler":
+    self._stop.set()
+    self._thread.join()
+    self.stopped = time.perf_counter()
+    return self
+
+  def speedscope(self, name: str) -> Dict:
+    frames: List[Dict] = []
+    index: Dict[Tuple[str, str], int] = {}
+    samples = []
+    for stack in self.samples:
+      ids = []
+      for fn, filename, line in stack:
+        # one frame per function; line numbers vary within it and would split the flamegraph
+        key = (fn, filename)
+        if key not in index:
+          index[key] = len(frames)
+          frames.append({"name": fn, "file": filename, "line": line})
+        ids.append(index[key])
+      samples.append(ids)
+    return {
+      "$schema": "https://www.speedscope.app/file-format-schema.json",
+      "name": name,
+      "exporter": "msl-demo-backend",
+      "shared": {"frames": frames},
+      "profiles": [{
+        "type": "sampled",
+        "name": name,
+        "unit": "seconds",
+        "startValue": 0,
+        "endValue": round(self.stopped - self.started, 6),
+        "samples": samples,
+        "weights": [round(w, 6) for w in self.weights],
+      }],
+    }
+
+def authorized(token: Optional[str]) -> bool:
+  return bool(PROFILE_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_TOKEN)
+
+def wants_profile(headers, query_params) -> bool:
+  return headers.get("x-profile") in ("1", "true") or query_params.get("profile") in ("1", "true")
+
+def _prune() -> None:
+  files = sorted(
+    (os.path.join(PROFILE_DIR, f) for f in os.listdir(PROFILE_DIR) if f.endswith(".speedscope.json")),
+    key=os.path.getmtime,
+  )
+  for path in files[:-PROFILE_KEEP]:
+    try:
+      os.remove(path)
+    except OSError:
+      pass
+
+def save_profile(profiler: SamplingProfiler, name: str) -> str:
+  """
+  Writes the speedscope file and returns its id.
+  """
+  os.makedirs(PROFILE_DIR, exist_ok=True)
+  profile_id = uuid.uuid4().hex
+  path = profile_path(profile_id)
+  with open(path + ".tmp", "w") as f:
+    json.dump(profiler.speedscope(name), f)
+  os.replace(path + ".tmp", path)
+  _prune()
+  return profile_id
+
+def profile_path(profile_id: str) -> Optional[str]:
+  if not _ID_RE.match(profile_id):
+    return None
+  return os.path.join(PROFILE_DIR, f"{profile_id}.speedscope.json")
@@ -0,0 +1,113 @@
+"""
+Slide cloning for variable-length sections.
+
+Theme slides in both templates hold three theme columns. For N themes the
+prototype slide is cloned once per extra chunk of three; clones point at the
+prototype's layout, images and other parts through new relationships instead
+of copying them, so a 30-theme deck is barely larger than a 3-theme one.
+"""
+import copy
+from typing import Any, Dict, List, Optional, Sequence
+
+from pptx.opc.constants import RELATIONSHIP_TYPE as RT
+
+THEMES_PER_SLIDE = 3
+
+_R_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+# Owned by a single slide; never shared with a clone
+_UNSHARED_RELS = {RT.SLIDE_LAYOUT, RT.NOTES_SLIDE}
+
+def _sld_id_for(prs, slide):
+  for sld_id in prs.slides._sldIdLst:
+    if prs.part.related_part(sld_id.rId) is slide.part:
+      return sld_id
+  raise ValueError("slide is not part of this presentation")
+
+def clone_slide(prs, src, after=None):
+  """
+  Appends a copy of `src` (placed right after `after`, default `src`).
+  Shape tree, background and slide settings are deep-copied; images, charts,
+  media and hyperlinks are shared by relating the clone to the same targets.
+  """
+  clone = prs.slides.add_slide(src.slide_layout)
+  src_el, dst_el = src.part._element, clone.part._element
+
+  rid_map: Dict[str, str] = {}
+  for rid, rel in src.part.rels.items():
+    if rel.reltype in _UNSHARED_RELS:
+      continue
+    if rel.is_external:
+      rid_map[rid] = clone.part.rels.get_or_add_ext_rel(rel.reltype, rel.target_ref)
+    else:
+      rid_map[rid] = clone.part.relate_to(rel.target_part, rel.reltype)
+  # the layout rel already exists on the clone under its own rId
+  for rid, rel in src.part.rels.items():
+    if rel.reltype == RT.SLIDE_LAYOUT:
+      rid_map[rid] = clone.part.relate_to(src.slide_layout.part, RT.SLIDE_LAYOUT)
+
+  # Rebuild the clone's XML from the source, but keep its own <p:spTree> element
+  # (emptied and refilled): the Slide proxy's .shapes is bound to it.
+  sp_tree = dst_el.cSld.spTree
+  for child in list(sp_tree):
+    sp_tree.remove(child)
+  for child in src_el.cSld.spTree:
+    sp_tree.append(copy.deepcopy(child))
+  for child in list(dst_el):
+    dst_el.remove(child)
+  for key, value in src_el.attrib.items():
+    dst_el.set(key, value)
+  for child in src_el:
+    if child.tag == src_el.cSld.tag:
+      c_sld = copy.copy(child)
+      for sub in list(c_sld):
+        c_sld.remove(sub)
+      for sub in child:
+        c_sld.append(sp_tree if sub is src_el.cSld.spTree else copy.deepcopy(sub))
+      dst_el.append(c_sld)
+    else:
+      dst_el.append(copy.deepcopy(child))
+  for el in dst_el.iter():
+    for key, value in el.attrib.items():
+      if key.startswith(_R_NS) and value in rid_map:
+        el.set(key, rid_map[value])
+
+  # add_slide appends at the end; move it next to its prototype
+  lst = prs.slides._sldIdLst
+  new_id = lst[-1]
+  lst.remove(new_id)
+  lst.insert(list(lst).index(_sld_id_for(prs, after or src)) + 1, new_id)
+  return clone
+
+def chunk_themes(themes: Sequence[Any], per_slide: int = THEMES_PER_SLIDE) -> List[List[Optional[Any]]]:
+  """
+  Themes split into slide-sized chunks, the last padded with None (blank slots).
+  Always at least one chunk so the prototype slide is filled or blanked.
+  """
+  themes = list(themes or [])
+  chunks = [themes[i:i + per_slide] for i in range(0, len(themes), per_slide)] or [[]]
+  chunks[-1] = chunks[-1] + [None] * (per_slide - len(chunks[-1]))
+  return chunks
+
+def expand_theme_slides(prs, prototype, n_themes: int, per_slide: int = THEMES_PER_SLIDE) -> List[Any]:
+  """
+  The prototype followed by enough clones to hold `n_themes` themes.
+  """
+  slides = [prototype]
+  for _ in range(max(1, -(-n_themes // per_slide)) - 1):
+    slides.append(clone_slide(prs, prototype, after=slides[-1]))
+  return slides
+
+def theme_texts(theme: Optional[Dict[str, Any]], number: int) -> Dict[str, str]:
+  """
+  Title, gap definition, quotes and root causes for one theme column; all
+  empty for a blank slot.
+  """
+  if theme is None:
+    return {"title": "", "gap": "", "quotes": "", "roots": ""}
+  roots = list(theme.get("root_cause_questions") or []) + ["", ""]
+  return {
+    "title": f"Theme {number} (n={len(theme.get('other_sources', [])) + 3})",
+    "gap": theme.get("gap_definition", ""),
+    "quotes": "\n".join([f"id {q.get('id')}: '{q.get('quote','')}'" for q in theme.get("representative_quotes", [])]),
+    "roots": f"1: {roots[0] or ''}\n2: {roots[1] or ''}",
+  }
@@ -0,0 +1,149 @@
+"""
+Startup profiling and worker warm-up.
+
+  python -m app.startup            # profile `main` plus the lazily loaded renderers
+  STARTUP_PROFILE=1 uvicorn main:app ...   # same report, printed once at boot
+
+Reports per-module import cost (cumulative and self time, in ms), slowest first.
+
+warm_up() runs from main.py's lifespan hook so the first real deck request
+doesn't pay for imports, the matplotlib font cache or template parsing.
+"""
+import builtins
+import importlib
+import os
+import sys
+import time
+from typing import List, Dict, Any
+from app.logger import get_logger, kv
+
+log = get_logger(__name__)
+
+# Modules main.py only imports inside the endpoints that need them
+HEAVY_MODULES = [
+  "app.demosite",
+  "app.data_analytics.metrics_store",
+  "app.pptxgenerator",
+  "app.data_analytics.pptx_generation",
+  "app.pptxdata",
+  "matplotlib.pyplot",
+]
+
+class ImportProfiler:
+  """
+  Context manager that wraps builtins.__import__ and times every first-time import.
+  """
+  def __init__(self):
+    self.records: Dict[str, Dict[str, float]] = {}
+    self._stack: List[float] = []
+    self._orig = None
+
+  def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name in sys.modules:
+      return self._orig(name, globals, locals, fromlist, level)
+    self._stack.append(0.0)
+    start = time.perf_counter()
+    try:
+      return self._orig(name, globals, locals, fromlist, level)
+    finally:
+      elapsed = time.perf_counter() - start
+      children = self._stack.pop()
+      if self._stack:
+        self._stack[-1] += elapsed
+      if name not in self.records:
+        self.records[name] = {"cumulative": elapsed, "self": elapsed - children}
+
+  def __enter__(self):
+    self._orig = builtins.__import__
+    builtins.__import__ = self._import
+    return self
+
+  def __exit__(self, *exc):
+    builtins.__import__ = self._orig
+    return False
+
+  def results(self) -> List[Dict[str, Any]]:
+    rows = [
+      {"module": name, "cumulative_ms": rec["cumulative"] * 1000.0, "self_ms": rec["self"] * 1000.0}
+      for name, rec in self.records.items()
+    ]
+    return sorted(rows, key=lambda r: r["cumulative_ms"], reverse=True)
+
+def profile_imports(modules: List[str]) -> List[Dict[str, Any]]:
+  """
+  Imports `modules` under the profiler. Already-imported modules cost nothing and are skipped.
+  """
+  with ImportProfiler() as prof:
+    for name in modules:
+      __import__(name)
+  return prof.results()
+
+def format_report(results: List[Dict[str, Any]], top: int = 25) -> str:
+  lines = [f"{'cumulative ms':>14} {'self ms':>10}  module"]
+  for r in results[:top]:
+    lines.append(f"{r['cumulative_ms']:>14.1f} {r['self_ms']:>10.1f}  {r['module']}")
+  return "\n".join(lines)
+
+def log_startup_profile(top: int = 25) -> None:
+  """
+  Called from main.py when STARTUP_PROFILE is set: times the lazily loaded renderers.
+  """
+  print("[startup] lazily loaded module import cost:")
+  print(format_report(profile_imports(HEAVY_MODULES), top=top))
+
+# Read by the /ready endpoint
+WARMUP: Dict[str, Any] = {"ready": False, "error": None, "stages_ms": {}}
+
+def _stage(name: str, fn) -> None:
+  start = time.perf_counter()
+  fn()
+  WARMUP["stages_ms"][name] = round((time.perf_counter() - start) * 1000.0, 1)
+
+def _import_renderers() -> None:
+  # plain imports: the profiler patches builtins and this runs off the main thread.
+  # pyplot is left to the chart stage so it goes through demosite's backend lock.
+  for name in HEAVY_MODULES:
+    if name != "matplotlib.pyplot":
+      importlib.import_module(name)
+
+def _parse_templates() -> None:
+  from app.templates import TEMPLATE_PATHS, open_template
+  for path in TEMPLATE_PATHS:
+    if not os.path.exists(path):
+      log.warning("template missing, skipped", extra=kv(path=path))
+      continue
+    open_template(path)
+
+def _render_chart() -> None:
+  from app.demosite import _create_pie_chart
+  _create_pie_chart({"warm-up": 1})
+
+def _prime_prompts() -> None:
+  from app.allprompts import allprompts
+  for cat in range(3):
+    for step in range(4):
+      allprompts("", step, cat)
+
+def warm_up() -> None:
+  """
+  Imports the renderers, parses both templates, renders a throwaway chart and
+  primes the prompt builders, then flips WARMUP["ready"].
+  """
+  try:
+    _stage("imports", _import_renderers)
+    _stage("templates", _parse_templates)
+    _stage("chart", _render_chart)
+    _stage("prompts", _prime_prompts)
+  except Exception as e:
+    # still report ready: a failed warm-up only means the first request is slower
+    WARMUP["error"] = repr(e)
+    log.exception("warm-up failed")
+  WARMUP["ready"] = True
+  log.info("warm-up done", extra=kv(**WARMUP["stages_ms"]))
+
+if __name__ == "__main__":
+  top = int(os.environ.get("STARTUP_PROFILE_TOP", "25"))
+  print("[startup] import main:")
+  print(format_report(profile_imports(["main"]), top=top))
+  print()
+  log_startup_profile(top=top)
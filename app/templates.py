@@ -0,0 +1,110 @@
+import hashlib
+import os
+import zipfile
+from functools import lru_cache
+from io import BytesIO
+from app.metrics import register_lru_cache
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Template used by true_replacement (/real-pptx)
+NEW_TEMPLATE_PATH = os.path.join(BASE_DIR, "New Acquis Template.pptx")
+# Template used by full_replacement (/presentation)
+LEGACY_TEMPLATE_PATH = os.path.join(BASE_DIR, "data_analytics", "Acquis Template.pptx")
+
+TEMPLATE_PATHS = [NEW_TEMPLATE_PATH, LEGACY_TEMPLATE_PATH]
+
+@lru_cache(maxsize=8)
+def _read_template(path: str, mtime_ns: int) -> bytes:
+  with open(path, "rb") as f:
+    return f.read()
+
+register_lru_cache("template_bytes", _read_template)
+
+def template_bytes(path: str) -> bytes:
+  """
+  Raw template bytes, read from disk once per file version (keyed on mtime).
+  """
+  return _read_template(path, os.stat(path).st_mtime_ns)
+
+def template_version(path: str) -> str:
+  """
+  Short content hash of the template; changes whenever the file is edited.
+  """
+  return hashlib.sha256(template_bytes(path)).hexdigest()[:16]
+
+def open_template(path: str):
+  """
+  Fresh Presentation parsed from the cached template bytes (safe to mutate).
+  """
+  from pptx import Presentation
+  return Presentation(BytesIO(template_bytes(path)))
+
+# Fixed member timestamp (the ZIP epoch) so identical decks are byte-identical
+_ZIP_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+class _DeterministicZipWriter:
+  """
+  python-pptx physical writer stand-in: same members and order as prs.save(),
+  but with fixed timestamps and permissions instead of the current local time.
+  """
+  def __init__(self, stream):
+    self._zipf = zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self._zipf.close()
+
+  def write(self, pack_uri, blob: bytes) -> None:
+    info = zipfile.ZipInfo(pack_uri.membername, date_time=_ZIP_DATE_TIME)
+    info.compress_type = zipfile.ZIP_DEFLATED
+    info.external_attr = 0o644 << 16
+    self._zipf.writestr(info, blob)
+
+def _private_writer_available() -> bool:
+  # PackageWriter's private steps are python-pptx internals (pinned in requirements.txt)
+  try:
+    from pptx.opc.serialized import PackageWriter
+  except ImportError:
+    return False
+  return all(hasattr(PackageWriter, name) for name in ("_write_content_types_stream", "_write_pkg_rels", "_write_parts"))
+
+def _restamp_zip(data: bytes) -> bytes:
+  """
+  The same ZIP with every member re-stamped with the fixed date and mode,
+  members kept in their original order.
+  """
+  buf = BytesIO()
+  with zipfile.ZipFile(BytesIO(data)) as src, _DeterministicZipWriter(buf) as phys:
+    for info in src.infolist():
+      out = zipfile.ZipInfo(info.filename, date_time=_ZIP_DATE_TIME)
+      out.compress_type = zipfile.ZIP_DEFLATED
+      out.external_attr = 0o644 << 16
+      phys._zipf.writestr(out, src.read(info))
+  return buf.getvalue()
+
+def save_presentation(prs) -> bytes:
+  """
+  prs.save() with reproducible output: [Content_Types].xml first, then package
+  rels and parts in relationship order, all stamped with a fixed date. If
+  python-pptx's writer internals change, falls back to prs.save() and
+  re-stamps the saved ZIP.
+  """
+  package = prs.part.package
+  if _private_writer_available() and hasattr(package, "_rels"):
+    from pptx.opc.serialized import PackageWriter
+    writer = PackageWriter(None, package._rels, tuple(package.iter_parts()))
+    buf = BytesIO()
+    try:
+      with _DeterministicZipWriter(buf) as phys:
+        writer._write_content_types_stream(phys)
+        writer._write_pkg_rels(phys)
+        writer._write_parts(phys)
+      return buf.getvalue()
+    except (AttributeError, TypeError):
+      pass
+  saved = BytesIO()
+  prs.save(saved)
+  return _restamp_zip(saved.getvalue())
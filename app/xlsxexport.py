@@ -0,0 +1,113 @@
+"""
+XLSX export of normalized insight rows plus the deck aggregates.
+
+Written with xlsxwriter's constant_memory mode: each row is flushed to a
+worksheet temp file as soon as the next one starts, so memory stays flat
+regardless of row count. The workbook is assembled into a file on close and
+streamed from there.
+"""
+import os
+import tempfile
+from typing import Any, Dict, Iterable, List
+
+import xlsxwriter
+
+from app.metrics import timed_fn
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+# Excel's hard limit per cell
+_MAX_CELL_CHARS = 32767
+
+def _columns(rows: Iterable[Dict[str, Any]]) -> List[str]:
+  """
+  Union of row keys in first-seen order.
+  """
+  seen: Dict[str, None] = {}
+  for r in rows:
+    for k in r:
+      if k not in seen:
+        seen[k] = None
+  return list(seen)
+
+def _cell(v: Any) -> Any:
+  if isinstance(v, bool):
+    return int(v)
+  if v is None or isinstance(v, (int, float)):
+    return v
+  s = v if isinstance(v, str) else str(v)
+  return s[:_MAX_CELL_CHARS]
+
+def _write_table(ws, row: int, title: str, header: List[str], body: Iterable[List[Any]], bold) -> int:
+  ws.write_string(row, 0, title, bold)
+  row += 1
+  ws.write_row(row, 0, header, bold)
+  row += 1
+  for values in body:
+    ws.write_row(row, 0, values)
+    row += 1
+  return row + 1
+
+def _write_summary(wb, metrics: Dict[str, Any], bold) -> None:
+  ws = wb.add_worksheet("Summary")
+  ws.set_column(0, 0, 38)
+  ws.set_column(1, 1, 14)
+  row = _write_table(ws, 0, "Overview", ["Metric", "Value"], [
+    ["Reporting period", metrics.get("dates", "")],
+    ["Insights", metrics.get("insight_count", 0)],
+    ["HCP interactions", metrics.get("n_interactions", 0)],
+    ["Deployed MSLs", len(metrics.get("msls", []))],
+  ], bold)
+  for title, key, label in (
+    ("Insight categories", "category_counts", "Category"),
+    ("KOL tiers", "kol_tier_counts", "Tier"),
+    ("Practice settings", "practice_counts", "Setting"),
+    ("Monthly interactions", "monthly_interactions", "Month"),
+  ):
+    row = _write_table(ws, row, title, [label, "Count"], [[k, v] for k, v in (metrics.get(key) or {}).items()], bold)
+  row = _write_table(ws, row, "Congresses", ["Congress"], [[c] for c in metrics.get("congresses", [])], bold)
+  _write_table(ws, row, "MSLs", ["MSL"], [[m] for m in metrics.get("msls", [])], bold)
+
+@timed_fn("xlsx_export")
+def write_workbook(rows: List[Dict[str, Any]], metrics: Dict[str, Any], path: str) -> str:
+  """
+  Writes a Summary sheet (aggregates) and a Rows sheet (one line per insight).
+  """
+  wb = xlsxwriter.Workbook(path, {
+    "constant_memory": True,
+    "strings_to_numbers": False,
+    "strings_to_urls": False,
+    "nan_inf_to_errors": True,
+  })
+  bold = wb.add_format({"bold": True})
+  _write_summary(wb, metrics, bold)
+
+  ws = wb.add_worksheet("Rows")
+  cols = _columns(rows)
+  ws.write_row(0, 0, cols, bold)
+  ws.freeze_panes(1, 0)
+  # typed writers directly: write_row() re-dispatches on type (and regex-checks strings) per cell
+  write_string, write_number = ws.write_string, ws.write_number
+  for i, r in enumerate(rows, start=1):
+    for j, c in enumerate(cols):
+      v = _cell(r.get(c))
+      if v is None:
+        continue
+      if isinstance(v, str):
+        if v:
+          write_string(i, j, v)
+      else:
+        write_number(i, j, v)
+  wb.close()
+  return path
+
+def export_to_tempfile(rows: List[Dict[str, Any]], metrics: Dict[str, Any]) -> str:
+  """
+  Workbook path in the temp dir; the caller removes it once streamed.
+  """
+  fd, path = tempfile.mkstemp(prefix="msl-export-", suffix=".xlsx")
+  os.close(fd)
+  try:
+    return write_workbook(rows, metrics, path)
+  except Exception:
+    os.remove(path)
+    raise
@@ -0,0 +1,219 @@
+"""
+Concurrent load test against the API with a local n8n webhook stand-in.
+
+  python -m benchmarks.loadtest                                  # spawn uvicorn + mock webhook
+  python -m benchmarks.loadtest --concurrency 32 --duration 30 --workers 2
+  python -m benchmarks.loadtest --webhook-latency 0.8 --webhook-error-rate 0.05
+  python -m benchmarks.loadtest --target http://127.0.0.1:8000   # already running server
+                                                                 # (start it with N8N_WEBHOOK_URL
+                                                                 #  pointing at the mock)
+
+The mock webhook answers every POST after --webhook-latency seconds (+/- jitter)
+and fails --webhook-error-rate of them with a 500, so /single-slide-pptx can be
+measured without n8n cloud. Reports p50/p95/p99 latency, throughput and error
+rate per endpoint.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import httpx
+
+from benchmarks.synthetic import crm_rows, n8n_payload, themes, single_outputs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ENDPOINTS = ["single-slide-pptx", "real-pptx", "MSL-prompting", "MSL-prompting-clin", "MSL-prompting-comp"]
+
+# ======================
+# Mock n8n webhook
+# ======================
+def mock_webhook_app(latency: float, jitter: float, error_rate: float, seed: int = 0):
+  from fastapi import FastAPI, Request
+  from fastapi.responses import JSONResponse
+  rnd = random.Random(seed)
+  app = FastAPI()
+  stats = {"received": 0, "failed": 0}
+  app.state.stats = stats
+
+  @app.post("/{path:path}")
+  async def hook(path: str, request: Request):
+    await request.body()
+    stats["received"] += 1
+    await asyncio.sleep(max(0.0, latency + rnd.uniform(-jitter, jitter)))
+    if rnd.random() < error_rate:
+      stats["failed"] += 1
+      return JSONResponse(status_code=500, content={"error": "mock failure"})
+    return {"status": "accepted", "path": path}
+
+  return app
+
+async def _serve(app, port: int):
+  import uvicorn
+  server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", lifespan="off"))
+  task = asyncio.create_task(server.serve())
+  while not server.started:
+    await asyncio.sleep(0.05)
+  return server, task
+
+# ======================
+# Request payloads
+# ======================
+def build_payloads(rows: int) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+  """
+  endpoint -> (HTTP method, JSON body), shaped like the n8n workflow's requests.
+  """
+  data = crm_rows(rows)
+  records = data[:50]
+  deck = n8n_payload(data)
+  deck.update(
+    patient_management=themes(data, seed=1),
+    education=themes(data, seed=2),
+    competitive=themes(data, seed=3),
+    single=single_outputs(data),
+  )
+  prompting = {"content": "Previous step output.", "counter": 1, "records": records}
+  return {
+    "single-slide-pptx": ("POST", {"id": "job", "content": records[0]}),
+    "real-pptx": ("GET", deck),
+    "MSL-prompting": ("POST", prompting),
+    "MSL-prompting-clin": ("POST", prompting),
+    "MSL-prompting-comp": ("POST", prompting),
+  }
+
+# ======================
+# Driver
+# ======================
+def _percentile(sorted_vals: List[float], q: float) -> float:
+  if not sorted_vals:
+    return float("nan")
+  idx = min(len(sorted_vals) - 1, max(0, int(round(q * (len(sorted_vals) - 1)))))
+  return sorted_vals[idx]
+
+async def _worker(client: httpx.AsyncClient, base: str, plan: List[str], bodies: Dict[str, Tuple[str, bytes]],
+                  deadline: float, results: Dict[str, Dict[str, Any]], counter: List[int]):
+  while time.perf_counter() < deadline:
+    endpoint = plan[counter[0] % len(plan)]
+    counter[0] += 1
+    method, body = bodies[endpoint]
+    if endpoint == "single-slide-pptx":
+      # job ids must be unique or create_job overwrites
+      body = body.replace(b'"id": "job"', f'"id": "job-{counter[0]}"'.encode(), 1)
+    res = results[endpoint]
+    start = time.perf_counter()
+    try:
+      resp = await client.request(method, f"{base}/{endpoint}", content=body,
+                                  headers={"content-type": "application/json"})
+      ok = resp.status_code < 400
+      res["status"][resp.status_code] = res["status"].get(resp.status_code, 0) + 1
+    except httpx.HTTPError as e:
+      ok = False
+      res["status"][type(e).__name__] = res["status"].get(type(e).__name__, 0) + 1
+    res["latency"].append(time.perf_counter() - start)
+    if not ok:
+      res["errors"] += 1
+
+async def _wait_ready(client: httpx.AsyncClient, base: str, timeout: float = 60.0) -> None:
+  deadline = time.perf_counter() + timeout
+  while time.perf_counter() < deadline:
+    try:
+      if (await client.get(f"{base}/ready")).status_code == 200:
+        return
+    except httpx.HTTPError:
+      pass
+    await asyncio.sleep(0.2)
+  raise RuntimeError(f"{base} not ready after {timeout}s")
+
+def report(results: Dict[str, Dict[str, Any]], elapsed: float) -> List[Dict[str, Any]]:
+  out = []
+  for endpoint, res in results.items():
+    lat = sorted(res["latency"])
+    n = len(lat)
+    out.append({
+      "endpoint": endpoint,
+      "requests": n,
+      "rps": round(n / elapsed, 2) if elapsed else 0.0,
+      "error_rate": round(res["errors"] / n, 4) if n else 0.0,
+      "p50_ms": round(_percentile(lat, 0.50) * 1000, 1),
+      "p95_ms": round(_percentile(lat, 0.95) * 1000, 1),
+      "p99_ms": round(_percentile(lat, 0.99) * 1000, 1),
+      "status": {str(k): v for k, v in res["status"].items()},
+    })
+  return out
+
+async def run(args) -> List[Dict[str, Any]]:
+  mock_app = mock_webhook_app(args.webhook_latency, args.webhook_jitter, args.webhook_error_rate)
+  mock_server, mock_task = await _serve(mock_app, args.mock_port)
+  webhook_url = f"http://127.0.0.1:{args.mock_port}/webhook/mock"
+
+  proc = None
+  base = args.target
+  if not base:
+    env = {**os.environ, "N8N_WEBHOOK_URL": webhook_url, "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+    proc = subprocess.Popen(
+      [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+       "--workers", str(args.workers), "--log-level", "warning"],
+      cwd=ROOT, env=env,
+    )
+    base = f"http://127.0.0.1:{args.port}"
+
+  payloads = build_payloads(args.rows)
+  bodies = {ep: (m, json.dumps(b).encode()) for ep, (m, b) in payloads.items() if ep in args.endpoints}
+  plan = list(args.endpoints)
+  results = {ep: {"latency": [], "errors": 0, "status": {}} for ep in plan}
+
+  limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+  try:
+    async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+      await _wait_ready(client, base)
+      counter = [0]
+      start = time.perf_counter()
+      deadline = start + args.duration
+      await asyncio.gather(*[
+        _worker(client, base, plan, bodies, deadline, results, counter) for _ in range(args.concurrency)
+      ])
+      elapsed = time.perf_counter() - start
+  finally:
+    if proc is not None:
+      proc.terminate()
+      proc.wait(timeout=10)
+    mock_server.should_exit = True
+    await mock_task
+
+  rows = report(results, elapsed)
+  print(f"{'endpoint':<22}{'reqs':>7}{'rps':>9}{'err%':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}  status")
+  for r in rows:
+    print(f"{r['endpoint']:<22}{r['requests']:>7}{r['rps']:>9}{r['error_rate'] * 100:>7.1f}"
+          f"{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}  {r['status']}")
+  print(f"\nmock webhook: {mock_app.state.stats['received']} received, {mock_app.state.stats['failed']} failed")
+  return rows
+
+def main(argv: List[str] | None = None) -> None:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--target", help="base URL of a running server (default: spawn one)")
+  parser.add_argument("--port", type=int, default=8765)
+  parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for the spawned server")
+  parser.add_argument("--mock-port", type=int, default=8766)
+  parser.add_argument("--webhook-latency", type=float, default=0.3, help="mock webhook response time (s)")
+  parser.add_argument("--webhook-jitter", type=float, default=0.1)
+  parser.add_argument("--webhook-error-rate", type=float, default=0.0)
+  parser.add_argument("--endpoints", nargs="+", choices=ENDPOINTS, default=ENDPOINTS)
+  parser.add_argument("--concurrency", type=int, default=16)
+  parser.add_argument("--duration", type=float, default=20.0, help="seconds of traffic")
+  parser.add_argument("--rows", type=int, default=1000, help="CRM rows per deck request")
+  parser.add_argument("--timeout", type=float, default=60.0)
+  parser.add_argument("--out", help="write the report as JSON")
+  args = parser.parse_args(argv)
+
+  rows = asyncio.run(run(args))
+  if args.out:
+    with open(args.out, "w") as f:
+      json.dump({"args": vars(args), "results": rows}, f, indent=2)
+
+if __name__ == "__main__":
+  main()
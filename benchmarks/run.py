@@ -0,0 +1,205 @@
+"""
+Benchmark harness for the deck and prompt pipelines.
+
+  python -m benchmarks.run                          # all cases at 1k, 10k, 100k, 1M rows
+  python -m benchmarks.run --sizes 1000 10000 --cases data_preprocess prompting_education
+  python -m benchmarks.run --compare benchmarks/results/abc123.json benchmarks/results/def456.json
+
+Every (case, size) runs in a fresh interpreter so peak RSS is per case.
+Results are written to benchmarks/results/<commit>.json (or --out) for
+comparison between commits.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from typing import Any, Callable, Dict, List, Tuple
+
+DEFAULT_SIZES = [1_000, 10_000, 100_000, 1_000_000]
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ======================
+# Cases: each returns (setup -> state, timed fn(state))
+# ======================
+def _case_data_preprocess(n: int):
+  from benchmarks.synthetic import crm_rows, n8n_payload
+  from app.demosite import data_preprocess, _pyplot
+  _pyplot()
+  return n8n_payload(crm_rows(n)), data_preprocess
+
+def _case_compute_metrics(n: int):
+  from benchmarks.synthetic import crm_rows
+  from app.demosite import compute_metrics, _normalize_fields_inplace
+  rows = crm_rows(n)
+  _normalize_fields_inplace(rows)
+  return rows, compute_metrics
+
+def _case_create_pie_chart(n: int):
+  from benchmarks.synthetic import crm_rows
+  from app.demosite import _create_pie_chart, _pyplot
+  from app.data_analytics.psetting import pie_practice_setting_by_interaction
+  _pyplot()  # import cost is measured by app.startup, not here
+  return pie_practice_setting_by_interaction(crm_rows(n)), _create_pie_chart
+
+def _deck_inputs(n: int):
+  from benchmarks.synthetic import crm_rows, n8n_payload, themes, single_outputs
+  from app.demosite import data_preprocess, second_process
+  rows = crm_rows(n)
+  stats = second_process(data_preprocess(n8n_payload(rows)))
+  return stats, themes(rows, seed=1), themes(rows, seed=2), themes(rows, seed=3), single_outputs(rows)
+
+def _require_template(path: str) -> None:
+  if not os.path.exists(path):
+    raise FileNotFoundError(f"template missing: {path}")
+
+def _case_true_replacement(n: int):
+  from app.pptxdata import true_replacement
+  from app.templates import NEW_TEMPLATE_PATH
+  _require_template(NEW_TEMPLATE_PATH)
+  return _deck_inputs(n), lambda args: true_replacement(*args)
+
+def _case_full_replacement(n: int):
+  from app.data_analytics.pptx_generation import full_replacement
+  from app.templates import LEGACY_TEMPLATE_PATH
+  _require_template(LEGACY_TEMPLATE_PATH)
+  return _deck_inputs(n)[:4], lambda args: full_replacement(*args)
+
+def _prompting_case(fn_name: str):
+  def case(n: int):
+    import app.prompting as prompting
+    from benchmarks.synthetic import crm_rows
+    fn = getattr(prompting, fn_name)
+    return crm_rows(n), lambda rows: fn("Previous step output.", 1, rows)
+  return case
+
+def _case_initial_prompts(n: int):
+  from benchmarks.synthetic import crm_rows
+  from app.prompting import attach_initial_prompts
+  return {"content": crm_rows(n)}, attach_initial_prompts
+
+CASES: Dict[str, Callable[[int], Tuple[Any, Callable[[Any], Any]]]] = {
+  "data_preprocess": _case_data_preprocess,
+  "compute_metrics": _case_compute_metrics,
+  "create_pie_chart": _case_create_pie_chart,
+  "true_replacement": _case_true_replacement,
+  "full_replacement": _case_full_replacement,
+  "initial_prompts": _case_initial_prompts,
+  "prompting_education": _prompting_case("attach_education_prompts"),
+  "prompting_clinical": _prompting_case("attach_clinical_prompts"),
+  "prompting_competitive": _prompting_case("attach_competitive_prompts"),
+}
+
+def _peak_rss_mb() -> float:
+  peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+  # Linux reports KiB, macOS bytes
+  return peak / (1024.0 * 1024.0) if sys.platform == "darwin" else peak / 1024.0
+
+def run_case(name: str, n: int) -> Dict[str, Any]:
+  """
+  Runs one case in-process. Meant to be called in a fresh child interpreter.
+  """
+  result: Dict[str, Any] = {"case": name, "n": n}
+  try:
+    state, fn = CASES[name](n)
+  except FileNotFoundError as e:
+    result.update(status="skipped", reason=str(e))
+    return result
+  start = time.perf_counter()
+  fn(state)
+  seconds = time.perf_counter() - start
+  result.update(
+    status="ok",
+    seconds=round(seconds, 6),
+    rows_per_sec=round(n / seconds, 1) if seconds > 0 else None,
+    peak_rss_mb=round(_peak_rss_mb(), 1),
+  )
+  return result
+
+def _run_child(name: str, n: int, timeout: float) -> Dict[str, Any]:
+  cmd = [sys.executable, "-m", "benchmarks.run", "--child", name, str(n)]
+  env = {**os.environ, "WARMUP": "0", "LOG_LEVEL": os.environ.get("LOG_LEVEL", "WARNING")}
+  try:
+    proc = subprocess.run(cmd, cwd=ROOT, env=env, capture_output=True, text=True, timeout=timeout)
+  except subprocess.TimeoutExpired:
+    return {"case": name, "n": n, "status": "timeout"}
+  lines = [l for l in proc.stdout.splitlines() if l.startswith("{\"case\"")]
+  if proc.returncode != 0 or not lines:
+    return {"case": name, "n": n, "status": "error", "reason": proc.stderr.strip().splitlines()[-1:]}
+  return json.loads(lines[-1])
+
+def _git_commit() -> str:
+  try:
+    out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    return out.stdout.strip() or "unknown"
+  except OSError:
+    return "unknown"
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+  print(f"{'case':<24}{'n':>10}{'seconds':>12}{'rows/s':>14}{'peak MB':>10}  status")
+  for r in results:
+    print(f"{r['case']:<24}{r['n']:>10}{r.get('seconds', ''):>12}{r.get('rows_per_sec', '') or '':>14}"
+          f"{r.get('peak_rss_mb', ''):>10}  {r['status']} {r.get('reason', '')}")
+
+def compare(old_path: str, new_path: str) -> None:
+  """
+  Prints new/old time ratios per (case, n); >1.0 means the new run is slower.
+  """
+  with open(old_path) as f:
+    old = {(r["case"], r["n"]): r for r in json.load(f)["results"]}
+  with open(new_path) as f:
+    new = json.load(f)
+  print(f"{'case':<24}{'n':>10}{'old s':>12}{'new s':>12}{'ratio':>8}{'old MB':>10}{'new MB':>10}")
+  for r in new["results"]:
+    o = old.get((r["case"], r["n"]))
+    if not o or r.get("status") != "ok" or o.get("status") != "ok":
+      continue
+    ratio = r["seconds"] / o["seconds"] if o["seconds"] else float("nan")
+    print(f"{r['case']:<24}{r['n']:>10}{o['seconds']:>12.4f}{r['seconds']:>12.4f}{ratio:>8.2f}"
+          f"{o['peak_rss_mb']:>10}{r['peak_rss_mb']:>10}")
+
+def main(argv: List[str] | None = None) -> None:
+  parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+  parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+  parser.add_argument("--cases", nargs="+", choices=sorted(CASES), default=list(CASES))
+  parser.add_argument("--out", help="results file (default benchmarks/results/<commit>.json)")
+  parser.add_argument("--timeout", type=float, default=1800.0, help="per-case timeout in seconds")
+  parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+  parser.add_argument("--child", nargs=2, metavar=("CASE", "N"), help=argparse.SUPPRESS)
+  args = parser.parse_args(argv)
+
+  if args.child:
+    print(json.dumps(run_case(args.child[0], int(args.child[1]))))
+    return
+  if args.compare:
+    compare(*args.compare)
+    return
+
+  results = []
+  for n in args.sizes:
+    for name in args.cases:
+      r = _run_child(name, n, args.timeout)
+      results.append(r)
+      print(json.dumps(r), file=sys.stderr)
+
+  commit = _git_commit()
+  report = {
+    "commit": commit,
+    "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    "python": platform.python_version(),
+    "platform": platform.platform(),
+    "results": results,
+  }
+  out = args.out or os.path.join(RESULTS_DIR, f"{commit}.json")
+  os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+  with open(out, "w") as f:
+    json.dump(report, f, indent=2)
+  _print_table(results)
+  print(f"\nwrote {out}")
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,108 @@
+"""
+Deterministic synthetic CRM rows and LLM theme outputs for benchmarks.
+
+Column names match the real n8n/CRM export consumed by app.demosite and
+app.initialprompts; values follow the spellings seen in production exports.
+"""
+import random
+from datetime import date, timedelta
+from typing import List, Dict, Any
+
+from app.data_analytics.icategories import INSIGHT_COLS
+
+PRODUCTS = ["Epcoritamab", "Kymriah", "Rituximab"]
+INSIGHT_CATEGORIES = ["Educational and Communication", "Clinical Practice", "Competitive Intelligence"]
+TIER_SPELLINGS = ["Tier 1", "Tier 2", "Tier 3", "1", "2", "3", "T1", "T2", "T3", ""]
+SETTINGS = ["Academic Center", "Community Practice", "Hospital", "Private Practice", ""]
+CONGRESSES = ["ASCO 2025", "ASH 2024", "EHA 2025", "ICML 2025", "SOHO 2024"]
+FIRST = ["Raj", "Ana", "Bo", "Maria", "James", "Priya", "Chen", "Sofia", "Omar", "Lena"]
+LAST = ["Singh", "Lee", "Chen", "Garcia", "Smith", "Patel", "Wang", "Rossi", "Haddad", "Novak"]
+
+_PHRASES = [
+  "asked about dosing in elderly patients with renal impairment",
+  "was unaware of the updated CRS management guidance",
+  "compared response durability with the competitor's bispecific",
+  "reported referral delays from community sites to treatment centers",
+  "wanted real-world data on outpatient administration",
+  "raised concerns about reimbursement for step-up dosing",
+  "noted nursing staff need training on neurotoxicity monitoring",
+  "prefers CAR-T for fit patients but cites manufacturing wait times",
+  "requested a slide deck to educate fellows on mechanism of action",
+  "questioned sequencing after rituximab-based regimens",
+]
+
+def _name(rnd: random.Random) -> str:
+  return f"{rnd.choice(FIRST)} {rnd.choice(LAST)}"
+
+def crm_rows(n: int, seed: int = 0) -> List[Dict[str, Any]]:
+  """
+  n CRM insight rows; ~1.6 insights per interaction ID, ~40 MSLs, 18 months of dates.
+  """
+  rnd = random.Random(seed)
+  start = date(2024, 1, 1)
+  msls = [_name(rnd) for _ in range(40)]
+  rows = []
+  for i in range(n):
+    cats = {col: 0 for col in INSIGHT_COLS}
+    for col in rnd.sample(INSIGHT_COLS, rnd.choice([1, 1, 1, 2, 2, 3])):
+      cats[col] = 1
+    d = start + timedelta(days=rnd.randrange(548))
+    congress = rnd.choice(CONGRESSES) if rnd.random() < 0.3 else ""
+    rows.append({
+      "ID": str(int(i / 1.6) + 1),
+      "MSL Name": rnd.choice(msls),
+      "KOL Name": _name(rnd),
+      "KOL Full Name": _name(rnd),
+      "KOL Tier": rnd.choice(TIER_SPELLINGS),
+      "KOL Practice Setting": rnd.choice(SETTINGS),
+      "Report Date": f"{d.month}/{d.day}/{d.year}",
+      "Congress Name (if applic.)": congress,
+      "Product Discussed": rnd.choice(PRODUCTS),
+      "Insight Category": rnd.choice(INSIGHT_CATEGORIES),
+      "Therapeutic Area": "Hematology",
+      "MSL / Submitter Name": rnd.choice(msls),
+      "Raw CRM Input (from MSL)": "HCP " + "; ".join(rnd.sample(_PHRASES, 2)) + ".",
+      **cats,
+    })
+  return rows
+
+def n8n_payload(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+  """
+  Wraps rows the way n8n sends them: {"content": {"items": [{"json": row}, ...]}}.
+  """
+  return {"content": {"items": [{"json": r} for r in rows]}}
+
+def themes(rows: List[Dict[str, Any]], k: int = 3, seed: int = 0) -> List[Dict[str, Any]]:
+  """
+  k LLM theme outputs (gap_definition, representative_quotes, root_cause_questions,
+  other_sources) quoting ids from `rows`.
+  """
+  rnd = random.Random(seed)
+  out = []
+  for t in range(k):
+    picks = rnd.sample(rows, min(3, len(rows)))
+    others = rnd.sample(rows, min(len(rows), rnd.randint(2, 12)))
+    out.append({
+      "gap_definition": f"Theme {t + 1}: HCPs lack clarity on " + rnd.choice(_PHRASES).split(" ", 2)[-1] + ".",
+      "representative_quotes": [{"id": r["ID"], "quote": r["Raw CRM Input (from MSL)"][:120]} for r in picks],
+      "root_cause_questions": [
+        "Is the current guidance reaching community prescribers?",
+        "Which channel do these HCPs trust for safety updates?",
+      ],
+      "other_sources": [r["ID"] for r in others],
+    })
+  return out
+
+def single_outputs(rows: List[Dict[str, Any]], seed: int = 0) -> List[Dict[str, Any]]:
+  """
+  The five per-insight outputs true_replacement reads from `single`.
+  """
+  rnd = random.Random(seed)
+  row = rows[0] if rows else {"Raw CRM Input (from MSL)": ""}
+  return [{
+    "Raw CRM Input (from MSL)": row.get("Raw CRM Input (from MSL)", ""),
+    "idea": rnd.choice(_PHRASES),
+    "value_classification_rationale": rnd.choice(_PHRASES),
+    "categories": rnd.sample(INSIGHT_COLS, 2),
+    "categorization_rationale": rnd.choice(_PHRASES),
+  } for _ in range(5)]
@@ -1,19 +1,73 @@
-from fastapi import FastAPI, Request, Response, HTTPException, Header, BackgroundTasks
+from fastapi import FastAPI, Request, Response, HTTPException, Header, BackgroundTasks, UploadFile, File
 from fastapi.responses import StreamingResponse, JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from app.prompting import attach_education_prompts, attach_initial_prompts, attach_clinical_prompts, attach_competitive_prompts
-from app.pptxgenerator import pptx_maker
-from app.demosite import data_preprocess, second_process
-from app.data_analytics.pptx_generation import full_replacement
-from app.pptxdata import true_replacement
 from typing import List
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
-import httpx, uuid, time
+from contextlib import asynccontextmanager
+from app.startup import WARMUP, warm_up
+from app.logger import get_logger, kv, queue_depth
+from app.metrics import timed, render_metrics, register_gauge, REQUEST_SECONDS
+from fastapi.responses import PlainTextResponse, FileResponse
+from app import profiling
+import asyncio, uuid, time, os, re, threading
 
 import io
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+  # Warm the worker in the background: "/" answers immediately, "/ready" waits for this
+  if os.environ.get("WARMUP", "1") != "0":
+    asyncio.get_running_loop().run_in_executor(None, warm_up)
+  else:
+    WARMUP["ready"] = True
+  yield
+  if _WEBHOOK_CLIENT is not None:
+    await _WEBHOOK_CLIENT.aclose()
+
+app = FastAPI(lifespan=lifespan)
+log = get_logger("main")
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+  start = time.perf_counter()
+  status = 500
+  try:
+    response = await call_next(request)
+    status = response.status_code
+    return response
+  finally:
+    # label by route template, not raw path, to keep cardinality bounded
+    route = getattr(request.scope.get("route"), "path", "unmatched")
+    REQUEST_SECONDS.observe(time.perf_counter() - start, request.method, route, str(status))
+
+@app.middleware("http")
+async def profile_requests(request: Request, call_next):
+  # Opt-in sampling profile of one request: X-Profile: 1 (or ?profile=1) plus X-Profile-Token
+  if not profiling.wants_profile(request.headers, request.query_params):
+    return await call_next(request)
+  token = request.headers.get("x-profile-token")
+  if not profiling.authorized(token):
+    return JSONResponse(status_code=403, content={"error": "profiling not authorized"})
+  profiler = profiling.SamplingProfiler(threading.get_ident()).start()
+  try:
+    response = await call_next(request)
+  finally:
+    profiler.stop()
+  profile_id = profiling.save_profile(profiler, f"{request.method} {request.url.path}")
+  log.info("request profiled", extra=kv(path=request.url.path, profile_id=profile_id, samples=len(profiler.samples)))
+  response.headers["X-Profile-Id"] = profile_id
+  return response
+
+async def read_json(request: Request):
+  with timed("request_parse"):
+    return await request.json()
+
+# Report per-module import cost of the lazily loaded renderers (cold-start tuning)
+if os.environ.get("STARTUP_PROFILE"):
+  from app.startup import log_startup_profile
+  log_startup_profile()
 
 app.add_middleware(
     CORSMiddleware,
@@ -50,32 +104,74 @@ def create_job(id, initial: Optional[Dict[str, Any]] = None) -> str:
   }
   return jid
 
-# In-place for webhook calls
-webhook = "https://yichao.app.n8n.cloud/webhook-test/b4fcda5e-d82e-4b6b-b3c5-b721375d794a"
+# In-place for webhook calls (N8N_WEBHOOK_URL points it at a local stand-in for load tests)
+webhook = os.environ.get("N8N_WEBHOOK_URL", "https://yichao.app.n8n.cloud/webhook-test/b4fcda5e-d82e-4b6b-b3c5-b721375d794a")
+WEBHOOK_MAX_CONNECTIONS = int(os.environ.get("WEBHOOK_MAX_CONNECTIONS", "20"))
+_WEBHOOK_CLIENT = None
+
+def _webhook_client():
+  # One pooled async client per worker; a new Client per request pays TCP+TLS setup every time
+  global _WEBHOOK_CLIENT
+  if _WEBHOOK_CLIENT is None:
+    import httpx
+    _WEBHOOK_CLIENT = httpx.AsyncClient(
+      timeout=30,
+      limits=httpx.Limits(max_connections=WEBHOOK_MAX_CONNECTIONS, max_keepalive_connections=WEBHOOK_MAX_CONNECTIONS),
+    )
+  return _WEBHOOK_CLIENT
 
 @app.post("/single-slide-pptx")
 async def start_single_slide(request: Request):
   _sweep_expired()
-  data = await request.json()
+  data = await read_json(request)
   job_id = data["id"]
   content = data["content"]
   create_job(job_id)
-  with httpx.Client(timeout=30) as client:
-    resp = client.post(webhook, json=content, headers=None)
-    resp.raise_for_status()
-    if resp.headers.get("content-type", "").startswith("application/json"):
-      return resp.json()
-    return {"status": "accepted", "raw": resp.text}
+  import httpx
+  with timed("webhook_post"):
+    try:
+      resp = await _webhook_client().post(webhook, json=content)
+      resp.raise_for_status()
+    except httpx.HTTPError as e:
+      # Upstream failure is a 502, not an unhandled 500 that drops the client's keep-alive connection
+      log.warning("webhook failed", extra=kv(job_id=job_id, error=str(e)))
+      raise HTTPException(status_code=502, detail="n8n webhook failed")
+  if resp.headers.get("content-type", "").startswith("application/json"):
+    return resp.json()
+  return {"status": "accepted", "raw": resp.text}
 
 """End STUFF FOR SINGLE USE TEXT EXTRACTION !!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!!"""
 
+register_gauge("msl_queue_depth", "Items waiting per in-process queue.", ("queue",),
+               lambda: {("log",): queue_depth(), ("jobs",): len(JOBS)})
+
+@app.get("/metrics")
+async def metrics():
+  return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/profiles/{profile_id}")
+async def get_profile(profile_id: str, request: Request):
+  token = request.headers.get("x-profile-token")
+  if not profiling.authorized(token):
+    raise HTTPException(status_code=403, detail="profiling not authorized")
+  path = profiling.profile_path(profile_id)
+  if path is None or not os.path.exists(path):
+    raise HTTPException(status_code=404, detail="profile not found")
+  return FileResponse(path, media_type="application/json", filename=f"{profile_id}.speedscope.json")
+
 @app.get("/")
 async def root():
     return {"status": "Chart API is alive"}
 
+@app.get("/ready")
+async def ready():
+  if not WARMUP["ready"]:
+    return JSONResponse(status_code=503, content={"status": "warming"})
+  return {"status": "ready", "warmup_ms": WARMUP["stages_ms"], "error": WARMUP["error"]}
+
 @app.get("/MSL-preprocessing", response_model=List[str])
 async def process_data(request: Request):
-  data = await request.json()
+  data = await read_json(request)
   dat = attach_initial_prompts(data)
   # buf = query2
   # return StreamingResponse(buf, media_type="image/png")
@@ -87,13 +183,13 @@ async def process_data(request: Request):
 
 @app.post("/MSL-prompting")
 async def process_data(request: Request):
-  data = await request.json()
+  data = await read_json(request)
   content = data["content"]
   run = data["counter"]
   records = data["records"]
   # print(data)
   dat = attach_education_prompts(content, run, records)
-  print(dat)
+  log.debug("prompt assembled", extra=kv(endpoint="education", run=run, prompt=dat))
   # buf = query2
   # return StreamingResponse(buf, media_type="image/png")
 
@@ -104,13 +200,13 @@ async def process_data(request: Request):
 
 @app.post("/MSL-prompting-clin")
 async def process_data(request: Request):
-  data = await request.json()
+  data = await read_json(request)
   content = data["content"]
   run = data["counter"]
   records = data["records"]
   # print(data)
   dat = attach_clinical_prompts(content, run, records)
-  print(dat)
+  log.debug("prompt assembled", extra=kv(endpoint="clinical", run=run, prompt=dat))
   # buf = query2
   # return StreamingResponse(buf, media_type="image/png")
 
@@ -121,13 +217,13 @@ async def process_data(request: Request):
 
 @app.post("/MSL-prompting-comp")
 async def process_data(request: Request):
-  data = await request.json()
+  data = await read_json(request)
   content = data["content"]
   run = data["counter"]
   records = data["records"]
   # print(data)
   dat = attach_competitive_prompts(content, run, records)
-  print(dat)
+  log.debug("prompt assembled", extra=kv(endpoint="competitive", run=run, prompt=dat))
   # buf = query2
   # return StreamingResponse(buf, media_type="image/png")
 
@@ -139,77 +235,492 @@ async def process_data(request: Request):
 
 @app.post("/PPTX-generation")
 async def pptx_generation(request: Request):
-  data = await request.json()
+  data = await read_json(request)
   rec = data["content"]
   # print("this is rec:\n", rec)
+  from app.pptxgenerator import pptx_maker
   pptx = pptx_maker(rec)
   
   if pptx is None: return JSONResponse(status_code=500, content={"error":"Failed to generate pptx"})
 
+def _cube_or_404(dataset):
+  from app.data_analytics.cube import get_cube
+  try:
+    return get_cube(str(dataset))
+  except KeyError:
+    raise HTTPException(status_code=404, detail=f"No cube for dataset {dataset!r}; POST /cube first")
+
+def _use_store(data, request: Request = None) -> bool:
+  """
+  Whether stats come from the metrics store ("use_store" in the body, or
+  ?use_store=1). The store keeps all-time totals, so a reporting_window
+  can't be applied to it and is rejected rather than silently ignored.
+  """
+  use_store = bool(data.get("use_store")) or (request is not None and request.query_params.get("use_store") in ("1", "true"))
+  if use_store and data.get("reporting_window"):
+    raise HTTPException(status_code=400, detail="reporting_window can't be combined with use_store (the store holds all-time aggregates)")
+  return use_store
+
+def _check_window(window) -> None:
+  # a bound that doesn't parse would otherwise be dropped and widen the window
+  from app.data_analytics.dates import window_bounds
+  if isinstance(window, dict):
+    try:
+      window_bounds(window.get("start"), window.get("end"))
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+
+def _stats_source(data, record=True):
+  """
+  Where a deck's stats come from, as (deck cache key inputs, preprocess thunk):
+  raw rows (default), the metrics store ("use_store": true), a cube slice
+  ("cube": {"dataset": ..., "filters": {...}}) or an inline Arrow/Parquet
+  table ("columnar": {"format": ..., "data": <base64>}). record=False keeps a
+  raw-row render from writing to the trend store.
+  """
+  from app.demosite import deck_preprocess, store_preprocess, cube_preprocess, columnar_input, data_preprocess
+  _check_window(data.get("reporting_window"))
+  if _use_store(data):
+    from app.data_analytics.metrics_store import get_metrics_store
+    return {**data, "store_snapshot": get_metrics_store().snapshot()}, store_preprocess
+  spec = data.get("cube")
+  if isinstance(spec, dict):
+    cube = _cube_or_404(spec.get("dataset"))
+    try:
+      cube.select(spec.get("filters"))
+    except ValueError as e:
+      raise HTTPException(status_code=400, detail=str(e))
+    return {**data, "cube_fingerprint": cube.fingerprint}, lambda: cube_preprocess(cube, spec.get("filters"))
+  try:
+    inline = columnar_input(data)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  if inline is not None:
+    import hashlib
+    body, kind = inline
+    # key on the table's hash, not its base64 text
+    inputs = {**{k: v for k, v in data.items() if k != "columnar"}, "columnar_sha256": hashlib.sha256(body).hexdigest(), "columnar_format": kind}
+
+    def preprocess():
+      try:
+        return data_preprocess(data)
+      except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Could not read {kind} table: {e}")
+    return inputs, preprocess
+  # raw rows: with "series", the render also records fully covered quarters in the trend store
+  return data, lambda: deck_preprocess(data, record)
+
+THEME_KEYS = ("patient_management", "education", "competitive")
+
+def _insight_store_or_404(dataset):
+  from app.data_analytics.insight_store import get_insight_store
+  try:
+    return get_insight_store(str(dataset))
+  except KeyError:
+    raise HTTPException(status_code=404, detail=f"No insight store for dataset {dataset!r}; POST /insights first")
+
+def _prepare_themes(data):
+  """
+  Theme lists as rendered: cited cluster labels and collapsed duplicates
+  expanded back into other_sources ("cluster_groups" / "duplicate_groups",
+  the 'clusters' / 'duplicates' of /MSL-preprocessing), then quote
+  verification ("quote_dataset").
+  """
+  clusters = data.get("cluster_groups")
+  if clusters:
+    from app.data_analytics.preclustering import expand_cluster_sources
+    data = {**data, **{key: [expand_cluster_sources(t, clusters) for t in data.get(key) or []] for key in THEME_KEYS if key in data}}
+  groups = data.get("duplicate_groups")
+  if groups:
+    from app.data_analytics.dedupe import expand_theme_sources
+    data = {**data, **{key: [expand_theme_sources(t, groups) for t in data.get(key) or []] for key in THEME_KEYS if key in data}}
+  return _verified_themes(data)
+
+def _verified_themes(data):
+  """
+  With "quote_dataset": <insight store>, theme quotes that aren't real
+  substrings of their cited insight (and unknown other_sources IDs) are
+  dropped before rendering; the store fingerprint joins the deck cache key.
+  """
+  dataset = data.get("quote_dataset")
+  if not dataset:
+    return data
+  store = _insight_store_or_404(dataset)
+  out = {**data, "quote_store_fingerprint": store.fingerprint}
+  dropped = 0
+  for key in THEME_KEYS:
+    themes = data.get(key) or []
+    out[key] = [store.filter_theme(t) for t in themes]
+    dropped += sum(len(t.get("representative_quotes") or []) - len(f["representative_quotes"]) for t, f in zip(themes, out[key]))
+  if dropped:
+    log.warning("unverified theme quotes dropped", extra=kv(dataset=dataset, dropped=dropped))
+  return out
+
 @app.get("/presentation")
 async def send_pptx(request: Request):
-  data = await request.json()
-  statdata = data_preprocess(data)
-  stat = second_process(statdata)
-  patient = data["patient_management"]
-  education = data["education"]
-  competitive = data["competitive"]
-  # print("patient:\n")
-  # print(patient)
-  # print("\n\n")
-  # print("education:\n")
-  # print(education)
-  # print("\n\n")
-  # print("competitive:\n")
-  # print(competitive)
-  presentation = full_replacement(stat,patient,education,competitive)
-  if presentation is None: return JSONResponse(status_code=500, content={"error":"Failed to generate pptx"})
-  return Response(
-    content=presentation,
-    media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-    headers={"Content-Disposition": "attachment; filename=out.pptx"}
-  )
-
+  from app.demosite import second_process
+  from app.data_analytics.pptx_generation import full_replacement
+  from app.deck_cache import deck_key
+  from app.templates import LEGACY_TEMPLATE_PATH
+  data = _prepare_themes(await read_json(request))
+  inputs, preprocess = _stats_source(data)
+  with timed("deck_cache_key"):
+    key = deck_key("full_replacement", LEGACY_TEMPLATE_PATH, inputs)
+
+  def render():
+    statdata = preprocess()
+    stat = second_process(statdata)
+    patient = data["patient_management"]
+    education = data["education"]
+    competitive = data["competitive"]
+    return full_replacement(stat,patient,education,competitive)
+
+  return await _deck_response(request, key, render)
+
+# Incremental metrics store: push row deltas once, read aggregates many times
+@app.post("/store/rows")
+async def store_rows(request: Request):
+  from app.demosite import extract_normalized_rows
+  from app.data_analytics.metrics_store import get_metrics_store
+  data = await read_json(request)
+  store = get_metrics_store()
+  result = {"interactions": 0, "replaced": 0, "rows": 0}
+  if "content" in data:
+    rows = extract_normalized_rows(data)
+    result = store.apply_rows(rows)
+  result["deleted"] = store.delete_ids(data.get("delete_ids", []))
+  return result
+
+# Raw CRM export upload (multipart "file": .csv or .xlsx), parsed in chunks; ?store=1 also feeds the metrics store
+@app.post("/upload")
+async def upload_export(request: Request, file: UploadFile = File(...)):
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import ingest_upload
+  from app.data_analytics.ingest import upload_kind
+  if upload_kind(file.filename or "", file.content_type or "") is None:
+    raise HTTPException(status_code=415, detail="Expected a .csv or .xlsx export")
+  to_store = request.query_params.get("store") in ("1", "true")
+  try:
+    return await run_in_threadpool(ingest_upload, file.file, file.filename or "", file.content_type or "", to_store)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=f"Could not parse upload: {e}")
+  finally:
+    await file.close()
+
+@app.get("/store/stats")
+async def store_stats():
+  from app.data_analytics.metrics_store import get_metrics_store
+  return get_metrics_store().snapshot()
+
+async def _optional_json(request: Request) -> Dict[str, Any]:
+  # dashboards reading the metrics store send no body at all
+  return await read_json(request) if await request.body() else {}
+
+def _chart_kinds(request: Request) -> List[str]:
+  from app.demosite import CHART_SOURCES
+  kinds = [k for k in request.query_params.get("charts", "").split(",") if k]
+  if kinds == ["all"]:
+    return list(CHART_SOURCES)
+  unknown = [k for k in kinds if k not in CHART_SOURCES]
+  if unknown:
+    raise HTTPException(status_code=400, detail=f"Unknown chart(s) {unknown}; expected {list(CHART_SOURCES)}")
+  return kinds
+
+# Numbers only (same body as /presentation, or ?use_store=1). Charts are drawn only
+# when asked for: ?charts=category,practice (base64 in the JSON) or /stats/chart/{kind}
+@app.get("/stats")
+async def stats(request: Request):
+  import base64
+  from app.demosite import stats_metrics, stats_summary, render_chart
+  data = await _optional_json(request)
+  kinds = _chart_kinds(request)
+  use_store = _use_store(data, request)
+  try:
+    metrics = stats_metrics(data, use_store)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  payload = {"stats": stats_summary(metrics), "metrics": metrics}
+  if kinds:
+    payload["charts"] = {k: base64.b64encode(render_chart(metrics, k)).decode("ascii") for k in kinds}
+  return payload
+
+@app.get("/stats/chart/{kind}")
+async def stats_chart(kind: str, request: Request):
+  from app.demosite import CHART_SOURCES, stats_metrics, render_chart
+  if kind not in CHART_SOURCES:
+    raise HTTPException(status_code=404, detail=f"Unknown chart {kind!r}; expected {list(CHART_SOURCES)}")
+  data = await _optional_json(request)
+  use_store = _use_store(data, request)
+  try:
+    metrics = stats_metrics(data, use_store)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+  png = render_chart(metrics, kind)
+  return Response(content=png, media_type="image/png", headers={"Cache-Control": "private, no-cache"})
+
+# Insight cube: built once per dataset (same body as /presentation, optional "dataset" name),
+# then sliced by product/msl/tier/setting/month/category/quarter
+@app.post("/cube")
+async def cube_build(request: Request):
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import preprocess_rows
+  from app.data_analytics.cube import InsightCube, put_cube
+  data = await read_json(request)
+  _check_window(data.get("reporting_window"))
+  rows = preprocess_rows(data)
+  cube = await run_in_threadpool(InsightCube, rows)
+  dataset = str(data.get("dataset") or cube.fingerprint[:16])
+  put_cube(dataset, cube)
+  log.info("cube built", extra=kv(dataset=dataset, rows=cube.n_rows, cells=cube.n_cells))
+  return {"dataset": dataset, **cube.describe()}
+
+@app.get("/cube/{dataset}")
+async def cube_describe(dataset: str):
+  return {"dataset": dataset, **_cube_or_404(dataset).describe()}
+
+# e.g. /cube/q2/query?tier=1&setting=Academic Center&category=competitive&product=Kymriah&quarter=Q2&group_by=msl
+# Repeat a parameter to OR values; metrics=1 adds compute_metrics-shaped aggregates for the slice
+@app.get("/cube/{dataset}/query")
+async def cube_query(dataset: str, request: Request):
+  from app.data_analytics.cube import QUERY_DIMENSIONS
+  cube = _cube_or_404(dataset)
+  params = request.query_params
+  # "profile" belongs to the profiling middleware
+  unknown = set(params) - set(QUERY_DIMENSIONS) - {"quarter", "group_by", "metrics", "profile"}
+  if unknown:
+    raise HTTPException(status_code=400, detail=f"Unknown query parameter(s) {sorted(unknown)}")
+  filters = {d: params.getlist(d) for d in QUERY_DIMENSIONS + ("quarter",) if params.getlist(d)}
+  group_by = [d for d in params.get("group_by", "").split(",") if d]
+  try:
+    with timed("cube_query"):
+      return cube.query(filters, group_by, metrics=params.get("metrics") in ("1", "true"))
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=str(e))
+
+_PERIOD_RE = re.compile(r"^\d{4}-Q[1-4]$")
+
+# Quarter-over-quarter history recorded by deck renders: ?series=&from=2024-Q1&to=2025-Q4
+@app.get("/trends")
+async def trends(request: Request):
+  from app.data_analytics.trend_store import get_trend_store
+  params = request.query_params
+  start, end = params.get("from"), params.get("to")
+  for p in (start, end):
+    if p and not _PERIOD_RE.match(p):
+      raise HTTPException(status_code=400, detail=f"Bad period {p!r}; expected e.g. 2025-Q2")
+  series = params.get("series")
+  if not series:
+    raise HTTPException(status_code=400, detail="series is required (see /trends/series)")
+  return {"series": series, "periods": get_trend_store().trends(series, start, end)}
+
+@app.get("/trends/series")
+async def trend_series():
+  from app.data_analytics.trend_store import get_trend_store
+  return {"series": get_trend_store().series()}
+
+# Backfill: same body as /presentation + "series" and "reporting_window"; records
+# without rendering a deck. Only the quarters the window fully covers are recorded.
+@app.post("/trends")
+async def trends_backfill(request: Request):
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import preprocess_rows, metrics_by_quarter
+  from app.data_analytics.dates import quarters_within
+  from app.data_analytics.trend_store import get_trend_store
+  data = await read_json(request)
+  if not data.get("series"):
+    raise HTTPException(status_code=400, detail="series is required")
+  series = str(data["series"])
+  window = data.get("reporting_window")
+  _check_window(window)
+  covered = set(quarters_within(window.get("start"), window.get("end"))) if isinstance(window, dict) else set()
+  if not covered:
+    # without it, partial first/last quarters would overwrite complete stored ones
+    raise HTTPException(status_code=400, detail="reporting_window with a start and end covering at least one full quarter is required")
+  by_period = await run_in_threadpool(metrics_by_quarter, preprocess_rows(data))
+  by_period = {q: m for q, m in by_period.items() if q in covered}
+  get_trend_store().upsert(series, by_period)
+  return {"series": series, "recorded": list(by_period)}
+
+# Insight/quote store: rows indexed by ID and by token of "Raw CRM Input (from MSL)"
+@app.post("/insights")
+async def insights_build(request: Request):
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import preprocess_rows
+  from app.data_analytics.insight_store import InsightStore, put_insight_store
+  data = await read_json(request)
+  _check_window(data.get("reporting_window"))
+  store = await run_in_threadpool(InsightStore, preprocess_rows(data))
+  dataset = str(data.get("dataset") or store.fingerprint[:16])
+  put_insight_store(dataset, store)
+  log.info("insight store built", extra=kv(dataset=dataset, **store.describe()))
+  return {"dataset": dataset, **store.describe()}
+
+@app.get("/insights/{dataset}/id/{insight_id}")
+async def insights_get(dataset: str, insight_id: str):
+  rows = _insight_store_or_404(dataset).get(insight_id)
+  if not rows:
+    raise HTTPException(status_code=404, detail=f"No insight with ID {insight_id!r}")
+  return {"id": insight_id, "rows": rows}
+
+# ?q=words (all must match, tf-idf ranked) or ?q="exact phrase"; &limit=
+@app.get("/insights/{dataset}/search")
+async def insights_search(dataset: str, q: str, limit: int = 20):
+  store = _insight_store_or_404(dataset)
+  with timed("insight_search"):
+    hits = store.search(q, max(1, min(limit, 500)))
+  return {"query": q, "hits": hits}
+
+# Body: {"quotes": [{"id", "quote"}]} and/or theme lists (patient_management / education / competitive)
+@app.post("/insights/{dataset}/verify")
+async def insights_verify(dataset: str, request: Request):
+  store = _insight_store_or_404(dataset)
+  data = await read_json(request)
+  with timed("quote_verify"):
+    out = {"quotes": [store.verify_quote(q.get("id"), q.get("quote")) for q in data.get("quotes") or []]}
+    for key in THEME_KEYS:
+      if key in data:
+        out[key] = [store.verify_theme(t) for t in data.get(key) or []]
+  return out
+
+# Read-only PDF report: same inputs as /presentation, drawn directly (no PPTX conversion).
+# Rendered off the event loop into a temp file, then streamed in chunks.
 @app.get("/pdf")
 async def pdf_generator(request: Request):
-  content = await request.json()
-  data = content["data"]
-  print(data)
-  
-  return
+  from starlette.background import BackgroundTask
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import second_process
+  from app.pdfreport import pdf_to_tempfile
+  data = _prepare_themes(await read_json(request))
+  _, preprocess = _stats_source(data, record=False)
+
+  def render():
+    stat = second_process(preprocess())
+    return pdf_to_tempfile(stat, data.get("patient_management", []), data.get("education", []), data.get("competitive", []))
+
+  path = await run_in_threadpool(render)
+  return FileResponse(path, media_type="application/pdf", filename="report.pdf",
+                      background=BackgroundTask(os.remove, path))
+
+# Rows + aggregates as a workbook; built off the event loop, streamed from a temp file
+@app.get("/xlsx")
+async def xlsx_export(request: Request):
+  from starlette.background import BackgroundTask
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import preprocess_rows, compute_metrics
+  from app.xlsxexport import export_to_tempfile, XLSX_MEDIA_TYPE
+  data = await read_json(request)
+  _check_window(data.get("reporting_window"))
+  rows = preprocess_rows(data)
+  metrics = compute_metrics(rows)
+  path = await run_in_threadpool(export_to_tempfile, rows, metrics)
+  return FileResponse(path, media_type=XLSX_MEDIA_TYPE, filename="insights.xlsx",
+                      background=BackgroundTask(os.remove, path))
+
+# Warehouse feeds: Arrow IPC (stream or file) or Parquet body in, deck aggregates out.
+# Optional ?start=&end= reporting window. Deck endpoints and /stats take the same
+# table inline as "columnar": {"format": "parquet" | "arrow", "data": <base64>}.
+@app.post("/columnar")
+async def columnar_metrics(request: Request):
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import columnar_preprocess
+  from app.data_analytics.columnar import columnar_kind
+  kind = columnar_kind(request.headers.get("content-type", ""))
+  if kind is None:
+    raise HTTPException(status_code=415, detail="Expected an Arrow IPC or Parquet body")
+  body = await request.body()
+  window = {"start": request.query_params.get("start"), "end": request.query_params.get("end")}
+  _check_window(window)
+  try:
+    return await run_in_threadpool(columnar_preprocess, body, kind, window)
+  except ValueError as e:
+    raise HTTPException(status_code=400, detail=f"Could not read {kind} body: {e}")
+
+# Normalized rows (same body as /xlsx) as a compressed Parquet file
+@app.get("/parquet")
+async def parquet_export(request: Request):
+  from starlette.background import BackgroundTask
+  from starlette.concurrency import run_in_threadpool
+  from app.demosite import preprocess_rows
+  from app.data_analytics.columnar import export_parquet_tempfile, PARQUET_MEDIA_TYPE
+  data = await read_json(request)
+  _check_window(data.get("reporting_window"))
+  rows = preprocess_rows(data)
+  path = await run_in_threadpool(export_parquet_tempfile, rows)
+  return FileResponse(path, media_type=PARQUET_MEDIA_TYPE, filename="insights.parquet",
+                      background=BackgroundTask(os.remove, path))
+
+PPTX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.presentationml.presentation"
+
+async def _deck_response(request: Request, key: str, render, filename: str = "out.pptx"):
+  """
+  Serves a rendered deck from the content-addressed cache, rendering on miss.
+  FileResponse adds Last-Modified, Accept-Ranges and single/multi byte-range
+  (206) handling; If-None-Match against the strong ETag short-circuits to 304.
+  The cache hands out a private link per response, removed once sent.
+  Rendering and cache file I/O run in the threadpool, off the event loop.
+  """
+  from starlette.background import BackgroundTask
+  from starlette.concurrency import run_in_threadpool
+  from app.deck_cache import get_deck_cache, content_etag, etag_matches
+  cache = get_deck_cache()
+  headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+  path = await run_in_threadpool(cache.get, key)
+  status = "hit"
+  if path:
+    etag = await run_in_threadpool(cache.etag, key, path)
+  else:
+    status = "miss"
+    pptx_bytes = await run_in_threadpool(render)
+    if not pptx_bytes:
+      raise HTTPException(status_code=500, detail="Failed to generate pptx")
+    with timed("deck_cache_put"):
+      path = await run_in_threadpool(cache.put, key, pptx_bytes)
+    etag = await run_in_threadpool(content_etag, pptx_bytes)
+    if not path:
+      # cache disabled: still conditional, just not rangeable
+      if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+      return Response(content=pptx_bytes, media_type=PPTX_MEDIA_TYPE,
+                      headers={**headers, "ETag": etag, "X-Deck-Cache": status})
+  if etag_matches(request.headers.get("if-none-match"), etag):
+    os.remove(path)
+    return Response(status_code=304, headers={"ETag": etag, "X-Deck-Cache": status})
+  return FileResponse(path, media_type=PPTX_MEDIA_TYPE, background=BackgroundTask(os.remove, path),
+                      headers={**headers, "ETag": etag, "Cache-Control": "private, no-cache", "X-Deck-Cache": status})
 
 # Path for actual pptx generation
 @app.get("/real-pptx")
 async def real_pptx(request: Request):
-  data = await request.json()
-  statdata = data_preprocess(data)
-  stat = second_process(statdata)
-  patient = data["patient_management"]
-  education = data["education"]
-  competitive = data["competitive"]
-  print("single")
-  single = data["single"]
-  print(single)
-  
-  pptx_bytes = true_replacement(stat, patient, education, competitive, single)
-  if not pptx_bytes:
-    raise HTTPException(status_code=500, detail="Failed to generate pptx")
-
-  return Response(
-    content=pptx_bytes,
-    media_type="application/vnd.openxmlformats-officedocument.presentationml.presentation",
-    headers={"Content-Disposition": 'attachment; filename="out.pptx"'},
-  )
+  from app.demosite import second_process
+  from app.pptxdata import true_replacement
+  from app.deck_cache import deck_key
+  from app.templates import NEW_TEMPLATE_PATH
+  data = _prepare_themes(await read_json(request))
+  inputs, preprocess = _stats_source(data)
+  # identical payloads (re-downloads, shares) map to one cached deck
+  with timed("deck_cache_key"):
+    key = deck_key("true_replacement", NEW_TEMPLATE_PATH, inputs)
+
+  def render():
+    statdata = preprocess()
+    stat = second_process(statdata)
+    patient = data["patient_management"]
+    education = data["education"]
+    competitive = data["competitive"]
+    single = data["single"]
+    log.debug("single payload", extra=kv(single=single))
+    return true_replacement(stat, patient, education, competitive, single)
+
+  return await _deck_response(request, key, render)
 
 
 # Path for single use case pptx processing and storing
 @app.post("/single-slide-ppt")
 async def one_slide_generation(request: Request):
-  content = await request.json()
+  content = await read_json(request)
   job_id = content["id"]
   data = content["content"]
-  print("id: ", job_id)
-  print("Data: ", data)
+  log.info("single slide job", extra=kv(job_id=job_id, data=data))
 
   return
 